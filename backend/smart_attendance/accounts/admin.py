@@ -1,43 +1,44 @@
 from django.contrib import admin
-from .models import Student, Department, Batch, ClassGroup
+from .models import EncodingState, Student, StudentImportJob, Department, Batch, ClassGroup
 from django.contrib import messages
-import numpy as np
+from django.utils.html import format_html
 
 class StudentAdmin(admin.ModelAdmin):
-    list_display = ('roll_no', 'name', 'created_at', 'face_encoding_display')
+    list_display = ('thumbnail_display', 'roll_no', 'name', 'created_at', 'face_encoding_display', 'encoding_version')
     search_fields = ('roll_no', 'name')
-    list_filter = ('created_at',)
+    list_filter = ('created_at', 'encoding_state')
     exclude = ('qr_code',)
-    readonly_fields = ('face_encoding_display',)
+    readonly_fields = ('thumbnail_display', 'face_encoding_display', 'encoding_version')
 
+    # Reads the persisted encoding_state; the 1 KB face_encoding blob is never decoded here
     def face_encoding_display(self, obj):
-        if not obj.face_encoding or obj.face_encoding == b'':
+        if obj.encoding_state == EncodingState.MISSING:
             return " No encoding (attendance will not work)"
-        
-        try:
-            arr = np.frombuffer(obj.face_encoding, dtype=np.float64)
-            if np.all(arr == 0):
-                return " Default empty encoding (zeros). Upload image to fix."
-        except:
-            pass
-
-        if hasattr(obj, 'has_valid_encoding') and not obj.has_valid_encoding:
+        if obj.encoding_state == EncodingState.DEFAULT:
+            return " Default empty encoding (zeros). Upload image to fix."
+        if obj.encoding_state == EncodingState.INVALID:
             return " Invalid encoding (not 128-dim float64)"
-        return f" Encoding present ({len(obj.face_encoding)} bytes)"
+        return " Encoding present"
 
     face_encoding_display.short_description = "Face encoding status"
 
+    # Thumbnails keep the changelist light; full photos are only linked
+    def thumbnail_display(self, obj):
+        if not obj.image_thumbnail:
+            return ""
+        return format_html('<img src="{}" height="48" alt="">', obj.image_thumbnail.url)
+
+    thumbnail_display.short_description = "Photo"
+
+    def get_queryset(self, request):
+        # The changelist only needs encoding_state
+        qs = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+            qs = qs.defer('face_encoding')
+        return qs
+
     def save_model(self, request, obj, form, change): 
-        is_default = False
-        if obj.face_encoding:
-             try:
-                 arr = np.frombuffer(obj.face_encoding, dtype=np.float64)
-                 if np.all(arr == 0):
-                     is_default = True
-             except:
-                 pass
-
-        if not obj.image and (not obj.face_encoding or obj.face_encoding == b'' or is_default):
+        if not obj.image and not obj.has_valid_encoding:
             messages.warning(request, " No image provided. Face encoding cannot be generated automatically.")
         
         super().save_model(request, obj, form, change)
@@ -53,4 +54,11 @@ class StudentAdmin(admin.ModelAdmin):
 admin.site.register(Student, StudentAdmin)
 admin.site.register(Department)
 admin.site.register(Batch)
-admin.site.register(ClassGroup)
\ No newline at end of file
+admin.site.register(ClassGroup)
+
+class StudentImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'done', 'total', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'done', 'total', 'report', 'error', 'created_at', 'finished_at')
+
+admin.site.register(StudentImportJob, StudentImportJobAdmin)
@@ -0,0 +1,81 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import Student
+from accounts.search import index_students, search_students, typeahead
+
+FIRST = ["Ram", "Sita", "Hari", "Gita", "Bikash", "Asha", "Sunil", "Anita", "Prakash", "Sarita",
+         "Rajesh", "Kamala", "Dipak", "Laxmi", "Suresh", "Bimala", "Rohan", "Nisha", "Arjun", "Puja"]
+LAST = ["Sharma", "Karki", "Thapa", "Shrestha", "Gurung", "Tamang", "Rai", "Adhikari", "Poudel",
+        "Bhandari", "Khadka", "Magar", "Basnet", "Koirala", "Joshi", "Pandey", "Maharjan", "Bista"]
+TERMS = ["s", "sh", "sha", "sharm", "arm", "ram thapa", "BCA0", "BCA01234", "zzz"]
+
+
+def _median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+class Command(BaseCommand):
+    help = "Benchmark student search: old icontains scan vs roll prefix + name trigram index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=50000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        results = []
+        # Seed inside a transaction that is always rolled back
+        with transaction.atomic():
+            t0 = time.perf_counter()
+            Student.objects.bulk_create(
+                (
+                    Student(roll_no=f"BCA{i:05d}", name=f"{rng.choice(FIRST)} {rng.choice(LAST)}")
+                    for i in range(options["students"])
+                ),
+                batch_size=2000,
+            )
+            index_students(Student.objects.filter(roll_no__startswith="BCA"))
+            self.stdout.write(f"Seeded and indexed {options['students']} students in {time.perf_counter() - t0:.1f}s")
+
+            base = Student.objects.order_by("-created_at")
+            self.stdout.write(f"{'term':>12}{'matches':>9}{'icontains ms':>14}{'indexed ms':>12}{'typeahead ms':>14}")
+            for term in TERMS:
+                old = base.filter(Q(name__icontains=term) | Q(roll_no__icontains=term))
+                new = search_students(term, base)
+                row = {
+                    "term": term,
+                    "matches": new.count(),
+                    # count + first page, as StudentListView does
+                    "icontains_ms": _median_ms(lambda: (old.count(), list(old[:30])), options["repeat"]),
+                    "indexed_ms": _median_ms(lambda: (new.count(), list(new[:30])), options["repeat"]),
+                    "typeahead_ms": _median_ms(lambda: typeahead(term, 10), options["repeat"]),
+                }
+                results.append(row)
+                self.stdout.write(
+                    f"{term:>12}{row['matches']:>9}{row['icontains_ms']:>14.1f}"
+                    f"{row['indexed_ms']:>12.1f}{row['typeahead_ms']:>14.1f}"
+                )
+            transaction.set_rollback(True)
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+# Usage: python manage.py bench_student_search [--students 50000] [--repeat 5] [--json out.json]
+# Synthetic students are created in a transaction that is rolled back afterwards.
+# Name matches from the old query also include infix roll-number matches, so
+# the match counts are only comparable for name terms.
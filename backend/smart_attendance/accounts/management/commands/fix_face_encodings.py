@@ -1,24 +1,190 @@
-from django.core.management.base import BaseCommand
-from accounts.models import Student
-from attendance.utils.face_utils import get_face_encoding
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from accounts.models import ENCODING_FIELDS, EncodingState, Student, current_encoding_version
+from attendance.utils.encoding_pool import _warm_worker, encode_for_storage
+from attendance.utils.face_index import face_index
+from attendance.utils.face_utils import storage_config
+
+DEFAULT_CHECKPOINT = os.path.join(settings.BASE_DIR, ".fix_face_encodings.json")
+
 
 class Command(BaseCommand):
-    help = "Generate missing face encodings for students with images"
-
-    def handle(self, *args, **kwargs):
-        fixed = 0
-        for student in Student.objects.filter(face_encoding__isnull=True).exclude(image=''):
-            print(f"Processing {student.roll_no} ({student.name})...")
-            encoding = get_face_encoding(student.image.path)
-            if encoding:
-                student.face_encoding = encoding
-                student.save()
-                print(f"  -> Face encoding set.")
-                fixed += 1
+    help = "Generate missing, zero, malformed or outdated face encodings for students with images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(),
+            help="Encoding processes (default: all cores; 0 = encode in this process)",
+        )
+        parser.add_argument("--batch-size", type=int, default=200, help="Students per bulk_update/checkpoint")
+        parser.add_argument("--dry-run", action="store_true", help="Only report which students would be encoded")
+        parser.add_argument("--since", help="Only students created on or after this date (YYYY-MM-DD)")
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Re-encode every student with an image, even those already on FACE_ENCODING_VERSION",
+        )
+        parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file used to resume")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        since = None
+        if options["since"]:
+            try:
+                since = datetime.strptime(options["since"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--since must be YYYY-MM-DD")
+
+        qs = Student.objects.exclude(image="").exclude(image__isnull=True)
+        if since:
+            qs = qs.filter(created_at__date__gte=since)
+
+        # A checkpoint only applies to a run with the same selection
+        run_key = {"all": options["all"], "since": options["since"]}
+        checkpoint_path = options["checkpoint"]
+        checkpoint = None if options["restart"] else self._load_checkpoint(checkpoint_path)
+        if checkpoint and checkpoint.get("run") == run_key:
+            qs = qs.filter(id__gt=checkpoint["last_id"])
+            self.stdout.write(f"Resuming after student id {checkpoint['last_id']} ({checkpoint['fixed']} fixed so far).")
+        else:
+            checkpoint = {"run": run_key, "last_id": 0, "fixed": 0, "failed": 0}
+
+        # Indexed filter on the persisted state; the encoding blobs are never read
+        version = current_encoding_version()
+        if not options["all"]:
+            qs = qs.filter(~Q(encoding_state=EncodingState.VALID) | Q(encoding_version__lt=version))
+
+        todo, reasons = [], {}
+        for student_id, roll_no, image, state, student_version in (
+            qs.order_by("id")
+            .values_list("id", "roll_no", "image", "encoding_state", "encoding_version")
+            .iterator(chunk_size=2000)
+        ):
+            if state != EncodingState.VALID:
+                reason = state
+            elif student_version < version:
+                reason = "outdated"
+            else:
+                reason = "re-encode"
+            reasons[reason] = reasons.get(reason, 0) + 1
+            todo.append((student_id, roll_no, image))
+
+        summary = ", ".join(f"{n} {r}" for r, n in sorted(reasons.items())) or "none"
+        self.stdout.write(f"{len(todo)} students to encode ({summary}).")
+        if options["dry_run"]:
+            for _, roll_no, image in todo[:20]:
+                self.stdout.write(f"  {roll_no}: {image}")
+            if len(todo) > 20:
+                self.stdout.write(f"  ... and {len(todo) - 20} more")
+            return
+        if not todo:
+            self._remove_checkpoint(checkpoint_path)
+            return
+
+        workers = options["workers"]
+        pool = None
+        if workers > 0:
+            context = multiprocessing.get_context(getattr(settings, "FACE_POOL_START_METHOD", "spawn"))
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_warm_worker)
+        config = storage_config()
+        batch_size = options["batch_size"]
+        started = time.monotonic()
+        try:
+            for offset in range(0, len(todo), batch_size):
+                batch = todo[offset:offset + batch_size]
+                fixed, failed = self._encode_batch(batch, pool, workers, config)
+                checkpoint["last_id"] = batch[-1][0]
+                checkpoint["fixed"] += fixed
+                checkpoint["failed"] += failed
+                self._save_checkpoint(checkpoint_path, checkpoint)
+
+                done = offset + len(batch)
+                elapsed = time.monotonic() - started
+                eta = elapsed / done * (len(todo) - done)
+                self.stdout.write(
+                    f"{done}/{len(todo)} processed, {checkpoint['fixed']} fixed, "
+                    f"{checkpoint['failed']} failed ({done / elapsed:.1f}/s, ETA {eta:.0f}s)"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write(f"Interrupted. Run the same command again to resume from {checkpoint_path}.")
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            # bulk_update skips post_save, so let the identification index reload
+            face_index.invalidate()
+
+        self._remove_checkpoint(checkpoint_path)
+        self.stdout.write(f"Done. Fixed {checkpoint['fixed']} students, {checkpoint['failed']} failed.")
+
+    def _encode_batch(self, batch, pool, workers, config):
+        paths, missing = [], []
+        for student_id, roll_no, image in batch:
+            try:
+                path = default_storage.path(image)
+            except NotImplementedError:
+                path = None
+            if path and os.path.exists(path):
+                paths.append((student_id, roll_no, path))
             else:
-                print(f"  -> No face found in image.")
-        print(f"Done. Fixed {fixed} students.")
+                missing.append(roll_no)
+        for roll_no in missing:
+            self.stdout.write(f"  {roll_no}: image file missing")
+
+        sources = [path for _, _, path in paths]
+        if pool is None:
+            results = map(encode_for_storage, sources, repeat(config))
+        else:
+            chunksize = max(1, len(sources) // (workers * 4))
+            results = pool.map(encode_for_storage, sources, repeat(config), chunksize=chunksize)
+
+        updates = []
+        for (student_id, roll_no, _), (encoding, error) in zip(paths, results):
+            if error:
+                self.stdout.write(f"  {roll_no}: {error}")
+            else:
+                student = Student(id=student_id)
+                student.set_face_encoding(encoding)
+                updates.append(student)
+        Student.objects.bulk_update(updates, ENCODING_FIELDS)
+        return len(updates), len(batch) - len(updates)
+
+    def _load_checkpoint(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_checkpoint(self, path, checkpoint):
+        tmp = f"{path}.part"
+        with open(tmp, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, path)
+
+    def _remove_checkpoint(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
 
-# Usage: python manage.py fix_face_encodings
-# This will generate encodings for students who have an image but no encoding.
-# Make sure the image is a clear, frontal face.
+# Usage: python manage.py fix_face_encodings [--workers 8] [--batch-size 200] [--dry-run] [--since 2026-01-01] [--all]
+# Finds students with an image whose encoding_state is not "valid" (missing,
+# all-zero or malformed) or whose encoding_version is older than
+# FACE_ENCODING_VERSION, and encodes them in a process pool. Progress is checkpointed after every batch, so
+# an interrupted run picks up where it stopped; use --restart to start over.
+# After a face model upgrade, bump FACE_ENCODING_VERSION and run it again;
+# --all re-encodes everyone regardless of version.
+# Make sure the images are clear, frontal faces.
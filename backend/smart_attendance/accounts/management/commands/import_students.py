@@ -0,0 +1,53 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.student_import import import_students, read_roster
+from attendance.utils.encoding_pool import EncodingPool
+
+
+class Command(BaseCommand):
+    help = "Bulk import students from a CSV/XLSX roster and a ZIP of face images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("roster", help="CSV or XLSX with roll_no, name[, image, department, batch, class_group]")
+        parser.add_argument("--images", help="ZIP of face images (default name <roll_no>.jpg)")
+        parser.add_argument(
+            "--workers", type=int,
+            help="Encoding processes (default: STUDENT_IMPORT_WORKERS, else all cores; 0 = encode inline)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["roster"], "rb") as f:
+                rows = read_roster(f, options["roster"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read roster: {e}")
+        self.stdout.write(f"Read {len(rows)} roster rows.")
+
+        def progress(done, total):
+            self.stdout.write(f"\rEncoding faces: {done}/{total}", ending="\n" if done == total else "")
+            self.stdout.flush()
+
+        # This process is not serving requests, so it gets a pool of its own
+        workers = options["workers"]
+        if workers is None:
+            workers = getattr(settings, "STUDENT_IMPORT_WORKERS", None) or os.cpu_count()
+        pool = EncodingPool(workers=workers)
+        try:
+            report = import_students(rows, options["images"], pool=pool, progress=progress)
+        finally:
+            pool.shutdown()
+        for e in report["errors"]:
+            self.stdout.write(f"  row {e['row']} ({e['roll_no']}): skipped - {e['error']}")
+        for w in report["warnings"]:
+            self.stdout.write(f"  row {w['row']} ({w['roll_no']}): imported without face encoding - {w['error']}")
+        self.stdout.write(
+            f"Done. Created {report['created']} students "
+            f"({report['without_face']} without face encoding), skipped {len(report['errors'])} rows."
+        )
+
+# Usage: python manage.py import_students roster.csv --images photos.zip [--workers 8]
+# The API (POST /api/students/import/) runs the same import on the background
+# queue through the server's shared encoding pool instead.
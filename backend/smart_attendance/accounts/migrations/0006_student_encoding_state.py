@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:27
+
+import numpy as np
+from django.db import migrations, models
+
+
+def classify_encodings(apps, schema_editor):
+    # Same rules as accounts.models.encoding_state_for; existing valid
+    # encodings are taken to come from the current (first) model version.
+    Student = apps.get_model('accounts', 'Student')
+    updates = []
+    for student in Student.objects.only('id', 'face_encoding').iterator(chunk_size=1000):
+        raw = bytes(student.face_encoding) if student.face_encoding else b''
+        if not raw:
+            state = 'missing'
+        elif len(raw) != 1024 or not np.all(np.isfinite(np.frombuffer(raw, dtype=np.float64))):
+            state = 'invalid'
+        elif not np.any(np.frombuffer(raw, dtype=np.float64)):
+            state = 'default'
+        else:
+            state = 'valid'
+        student.encoding_state = state
+        student.encoding_version = 1 if state == 'valid' else 0
+        updates.append(student)
+    Student.objects.bulk_update(updates, ['encoding_state', 'encoding_version'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_batch_department_alter_student_face_encoding_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='encoding_state',
+            field=models.CharField(choices=[('missing', 'Missing'), ('default', 'Default (zeros)'), ('valid', 'Valid'), ('invalid', 'Invalid')], default='default', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='encoding_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['encoding_state', 'encoding_version'], name='student_encoding_state_idx'),
+        ),
+        migrations.RunPython(classify_encodings, migrations.RunPython.noop),
+    ]
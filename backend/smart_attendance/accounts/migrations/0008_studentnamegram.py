@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_names(apps, schema_editor):
+    # Same grams as accounts.search.name_grams
+    Student = apps.get_model('accounts', 'Student')
+    StudentNameGram = apps.get_model('accounts', 'StudentNameGram')
+    rows = []
+    for pk, name in Student.objects.values_list('id', 'name').iterator(chunk_size=2000):
+        grams = set()
+        for word in (name or '').lower().split():
+            padded = f'  {word} '
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        rows.extend(StudentNameGram(student_id=pk, gram=g) for g in grams)
+        if len(rows) >= 5000:
+            StudentNameGram.objects.bulk_create(rows)
+            rows = []
+    StudentNameGram.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_student_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentNameGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_grams', to='accounts.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['gram', 'student'], name='student_name_gram_idx')],
+            },
+        ),
+        migrations.RunPython(index_names, migrations.RunPython.noop),
+    ]
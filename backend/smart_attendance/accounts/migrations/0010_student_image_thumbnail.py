@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_student_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='students/thumbs/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_student_image_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classgroup',
+            name='match_tolerance',
+            field=models.FloatField(blank=True, help_text="Face match distance limit for this class; overrides the department's", null=True),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='match_tolerance',
+            field=models.FloatField(blank=True, help_text="Face match distance limit for this department's students (blank = FACE_MATCH_TOLERANCE)", null=True),
+        ),
+    ]
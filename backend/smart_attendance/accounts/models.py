@@ -1,12 +1,11 @@
 import os
 from datetime import datetime
-from io import BytesIO
 
 import numpy as np
-import qrcode
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files import File
 from django.db import models
+from django.utils import timezone
 
 
 def student_image_upload_path(instance, filename):
@@ -30,8 +29,43 @@ def default_encoding():
     return np.zeros(128, dtype=np.float64).tobytes()
 
 
+class EncodingState(models.TextChoices):
+    MISSING = "missing", "Missing"
+    DEFAULT = "default", "Default (zeros)"
+    VALID = "valid", "Valid"
+    INVALID = "invalid", "Invalid"
+
+
+def encoding_state_for(raw):
+    """Classify a face_encoding blob; only called when the blob is written."""
+    if not raw:
+        return EncodingState.MISSING
+    raw = bytes(raw)
+    if len(raw) != 128 * 8:
+        return EncodingState.INVALID
+    arr = np.frombuffer(raw, dtype=np.float64)
+    if not np.all(np.isfinite(arr)):
+        return EncodingState.INVALID
+    if not np.any(arr):
+        return EncodingState.DEFAULT
+    return EncodingState.VALID
+
+
+def current_encoding_version():
+    # Bump FACE_ENCODING_VERSION after changing the face model or preprocessing;
+    # fix_face_encodings then re-encodes every older valid encoding.
+    return getattr(settings, "FACE_ENCODING_VERSION", 1)
+
+
+ENCODING_FIELDS = ["face_encoding", "encoding_state", "encoding_version", "updated_at"]
+
+
 class Department(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    match_tolerance = models.FloatField(
+        null=True, blank=True,
+        help_text="Face match distance limit for this department's students (blank = FACE_MATCH_TOLERANCE)",
+    )
 
     def __str__(self):
         return self.name
@@ -51,6 +85,10 @@ class ClassGroup(models.Model):
         Department, null=True, blank=True, on_delete=models.SET_NULL
     )
     batch = models.ForeignKey(Batch, null=True, blank=True, on_delete=models.SET_NULL)
+    match_tolerance = models.FloatField(
+        null=True, blank=True,
+        help_text="Face match distance limit for this class; overrides the department's",
+    )
 
     def __str__(self):
         return self.name
@@ -68,22 +106,49 @@ class Student(models.Model):
     )
     # Default to 128-dim zero vector
     face_encoding = models.BinaryField(default=default_encoding, null=True, blank=True)
+    # Derived from face_encoding whenever it is written (see set_face_encoding/save),
+    # so listing and matching never have to decode the blob
+    encoding_state = models.CharField(
+        max_length=8, choices=EncodingState.choices, default=EncodingState.DEFAULT
+    )
+    encoding_version = models.PositiveSmallIntegerField(default=0)
     image = models.ImageField(
         upload_to=student_image_upload_path, null=True, blank=True
     )
+    # Small JPEG made from image by attendance.utils.image_pipeline (background)
+    image_thumbnail = models.ImageField(upload_to="students/thumbs/", null=True, blank=True, editable=False)
+    # Legacy: QR codes are now rendered on demand at /api/students/<roll_no>/qr.png
     qr_code = models.ImageField(upload_to="qr_codes/", null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Drives the student list ETag; bumped by saves, encoding updates and
+    # renames of the student's department/batch/class group (accounts.signals)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["encoding_state", "encoding_version"], name="student_encoding_state_idx"),
+            # Keyset pagination order (accounts.pagination.StudentCursorPagination)
+            models.Index(fields=["created_at", "id"], name="student_created_idx"),
+        ]
 
     @property
     def has_valid_encoding(self):
-        # Returns True if face_encoding is a valid 128-dim float64 vector AND not just zeros
-        if not self.face_encoding:
-            return False
-        try:
-            arr = np.frombuffer(self.face_encoding, dtype=np.float64)
-            return arr.shape == (128,) and not np.all(arr == 0)
-        except:
-            return False
+        # A valid 128-dim float64 vector that is not just zeros
+        return self.encoding_state == EncodingState.VALID
+
+    def set_face_encoding(self, raw, version=None):
+        """Assign face_encoding and keep encoding_state/encoding_version in step.
+
+        Use this (then save or bulk_update with ENCODING_FIELDS) whenever the
+        encoding comes from the encoder.
+        """
+        self.face_encoding = raw
+        self.updated_at = timezone.now()  # bulk_update doesn't apply auto_now
+        self.encoding_state = encoding_state_for(raw)
+        if self.encoding_state == EncodingState.VALID:
+            self.encoding_version = version or current_encoding_version()
+        else:
+            self.encoding_version = 0
 
     def clean(self):
         if Student.objects.exclude(pk=self.pk).filter(roll_no=self.roll_no).exists():
@@ -92,29 +157,27 @@ class Student(models.Model):
             )
 
     def save(self, *args, **kwargs):
-        # 1. Generate QR Code if missing
-        if self.roll_no and not self.qr_code:
-            qr_img = qrcode.make(self.roll_no)
-            buffer = BytesIO()
-            qr_img.save(buffer, format="PNG")
-            self.qr_code.save(f"{self.roll_no}_qr.png", File(buffer), save=False)
-
-        # 2. Save first to ensure image is on disk
+        # QR codes are not generated here; see accounts.views.student_qr.
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "face_encoding" in update_fields:
+            # Re-derive the state in case face_encoding was assigned directly
+            state = encoding_state_for(self.face_encoding)
+            if state != self.encoding_state:
+                self.encoding_state = state
+                self.encoding_version = current_encoding_version() if state == EncodingState.VALID else 0
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | set(ENCODING_FIELDS)
+
+        # 1. Save first to ensure image is on disk
         super().save(*args, **kwargs)
 
-        # 3. Auto-generate Face Encoding if image exists but encoding is missing or default (zeros)
-        is_default_or_empty = False
-        if not self.face_encoding or self.face_encoding == b"":
-            is_default_or_empty = True
-        else:
-            try:
-                arr = np.frombuffer(self.face_encoding, dtype=np.float64)
-                if np.all(arr == 0):
-                    is_default_or_empty = True
-            except:
-                is_default_or_empty = True
+        # 2. Auto-generate Face Encoding if image exists but encoding is missing, default (zeros) or invalid.
+        # EncoderBusy / EncoderTimeout propagate so views can answer 503 / 504
+        # (see attendance.utils.encoding_pool.encoder_unavailable_response).
+        if self.image and self.encoding_state != EncodingState.VALID:
+            from attendance.utils.encoding_pool import EncoderBusy, EncoderTimeout
 
-        if self.image and is_default_or_empty:
             try:
                 from attendance.utils.face_utils import get_face_encoding
 
@@ -124,14 +187,64 @@ class Student(models.Model):
                 encoding = get_face_encoding(self.image.path)
 
                 if encoding:
-                    self.face_encoding = encoding
-                    # Save only the face_encoding field to update the DB record
-                    super().save(update_fields=["face_encoding"])
+                    self.set_face_encoding(encoding)
+                    # Save only the encoding fields to update the DB record
+                    super().save(update_fields=ENCODING_FIELDS)
                     print(f"Successfully saved encoding for {self.roll_no}")
                 else:
                     print(f"Warning: No face found in image for {self.roll_no}")
+            except (EncoderBusy, EncoderTimeout):
+                raise
             except Exception as e:
                 print(f"Error generating face encoding in save(): {e}")
 
+        # 3. Compress the photo and make its thumbnail in the background; queued
+        # last so the encoder above has finished reading the original file
+        if self.image and (update_fields is None or "image" in update_fields):
+            from attendance.utils.image_pipeline import process_student_image, schedule, student_image_processed
+
+            if not student_image_processed(self):
+                schedule(process_student_image, self.pk)
+
     def __str__(self):
         return f"{self.roll_no} - {self.name}"
+
+
+class StudentNameGram(models.Model):
+    """Trigram index over Student.name for search (see accounts.search).
+
+    Each word is padded like "  ram " so one- and two-letter queries can use
+    the word-start grams ("  r", " ra") and longer ones the inner trigrams.
+    """
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="name_grams")
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [models.Index(fields=["gram", "student"], name="student_name_gram_idx")]
+
+
+class StudentImportJob(models.Model):
+    """One bulk import run by the background queue (see accounts.student_import).
+
+    The HTTP request only validates the upload and creates this row;
+    clients poll /api/students/import/<id>/ for done/total and, once the
+    status is "done", the per-row report.
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    total = models.PositiveIntegerField(default=0)  # images to encode
+    done = models.PositiveIntegerField(default=0)
+    report = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.status})"
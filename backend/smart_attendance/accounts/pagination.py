@@ -0,0 +1,189 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import InvalidPage, Page
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connection
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def approximate_count(queryset):
+    """Cheap row count for page-number clients.
+
+    An unfiltered queryset on MySQL reads the table statistics; anything else
+    counts at most APPROXIMATE_COUNT_CAP rows, so the answer is exact below
+    the cap and "at least the cap" above it. Returns ``(count, is_exact)``.
+    """
+    if connection.vendor == "mysql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] is not None:
+            return int(row[0]), False
+    cap = getattr(settings, "APPROXIMATE_COUNT_CAP", 10000)
+    count = queryset.order_by()[:cap].count()
+    return count, count < cap
+
+
+class _OpenEndedPage(Page):
+    # has_next comes from fetching one extra row, not from the (approximate) count
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class ApproximateCountPaginator(DjangoPaginator):
+    """Django paginator that never runs an exact COUNT(*).
+
+    Pages are sliced straight from the queryset (page_size + 1 rows to find
+    out whether there is a next page), so a wrong estimate can't truncate or
+    reject a page.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count, self.count_is_exact = approximate_count(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage("That page number is not an integer")
+        if number < 1:
+            raise InvalidPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise InvalidPage("That page contains no results")
+        return _OpenEndedPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+
+
+class KeysetPagination(pagination.BasePagination):
+    """Cursor pagination on a unique tuple of columns, e.g. (created_at, id).
+
+    Each page is ``WHERE (a, b) < (last_a, last_b) ORDER BY a DESC, b DESC
+    LIMIT n`` (spelled out with OR/AND), so page 1000 costs the same index
+    range scan as page 1 and no COUNT(*) is run. Cursors are opaque base64 of
+    the boundary row's key values. `ordering` must end with a unique column
+    and all columns must sort in the same direction.
+    """
+
+    ordering = ("-id",)
+    page_size = 30
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+
+    def _fields(self):
+        return [f.lstrip("-") for f in self.ordering]
+
+    def _descending(self):
+        return self.ordering[0].startswith("-")
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for name in self._fields():
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        raw = json.dumps({"k": values, "r": int(reverse)}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            fields = [queryset.model._meta.get_field(name) for name in self._fields()]
+            values = [field.to_python(v) for field, v in zip(fields, data["k"])]
+            if len(values) != len(fields):
+                raise ValueError
+            return values, bool(data.get("r"))
+        except Exception:
+            raise NotFound("Invalid cursor")
+
+    def _beyond(self, values, forward):
+        # Rows strictly after `values` in the scan direction
+        lookup = "lt" if self._descending() == forward else "gt"
+        q = Q()
+        equal = {}
+        for name, value in zip(self._fields(), values):
+            q |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return q
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        values, reverse = self.decode_cursor(queryset, cursor) if cursor else (None, False)
+
+        ordering = list(self.ordering)
+        if reverse:
+            ordering = [f[1:] if f.startswith("-") else f"-{f}" for f in ordering]
+        qs = queryset.order_by(*ordering)
+        if values is not None:
+            qs = qs.filter(self._beyond(values, forward=not reverse))
+        rows = list(qs[:size + 1])
+        more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if more or reverse:
+                self.next_cursor = self.encode_cursor(rows[-1], reverse=False)
+            if values is not None and (more or not reverse):
+                self.previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+
+class StudentCursorPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
+
+
+class AttendanceRecordCursorPagination(KeysetPagination):
+    ordering = ("-date", "-id")
+    page_size = 60
+    max_page_size = 500
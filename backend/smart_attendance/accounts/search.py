@@ -0,0 +1,119 @@
+"""Student search: roll number prefix plus a trigram index on names.
+
+``roll_no`` is unique, so ``roll_no LIKE 'x%'`` is a range scan on its
+index. Names go through StudentNameGram: a query's grams are looked up on
+the (gram, student) index, students holding all of them are candidates and
+only those few rows are checked with icontains. No query ever has to scan
+the whole student table with LIKE '%x%'.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import Student, StudentNameGram
+
+
+def _words(text):
+    return (text or "").lower().split()
+
+
+def name_grams(name):
+    """Every gram stored for `name`."""
+    grams = set()
+    for word in _words(name):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def query_grams(term):
+    """Grams a name must contain to match every word of `term`."""
+    grams = set()
+    for word in _words(term):
+        if len(word) == 1:
+            grams.add(f"  {word}")
+        elif len(word) == 2:
+            grams.add(f" {word}")
+        else:
+            grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def _index_rows(rows):
+    StudentNameGram.objects.filter(student_id__in=[pk for pk, _ in rows]).delete()
+    StudentNameGram.objects.bulk_create(
+        (StudentNameGram(student_id=pk, gram=gram) for pk, name in rows for gram in name_grams(name)),
+        batch_size=5000,
+    )
+
+
+def index_student(student):
+    _index_rows([(student.pk, student.name)])
+
+
+def index_students(students):
+    """(Re)build the name grams of `students` (a Student queryset), e.g. after bulk_create."""
+    rows = list(students.values_list("id", "name"))
+    for i in range(0, len(rows), 2000):
+        _index_rows(rows[i:i + 2000])
+
+
+def _roll_prefix_q(term):
+    if connection.vendor == "mysql":
+        # LIKE 'x%' on the case-insensitive collation is a range scan on the unique index
+        return Q(roll_no__istartswith=term)
+    # Other backends don't use an index for a case-insensitive LIKE, so spell
+    # the prefix out as index ranges for the typed, upper- and lower-case forms
+    # (other mixes, e.g. a stored "Bca01" typed as "bca", are not matched)
+    q = Q()
+    for prefix in {term, term.upper(), term.lower()}:
+        q |= Q(roll_no__gte=prefix, roll_no__lt=prefix + "\uffff")
+    return q
+
+
+def _name_match_ids(term):
+    grams = query_grams(term)
+    return (
+        StudentNameGram.objects.filter(gram__in=grams)
+        .values("student_id")
+        .annotate(n=Count("gram"))
+        .filter(n=len(grams))
+        .values("student_id")
+    )
+
+
+def _name_q(term):
+    q = Q(id__in=_name_match_ids(term))
+    for word in _words(term):
+        q &= Q(name__icontains=word)
+    return q
+
+
+def search_students(term, queryset=None):
+    """Filter `queryset` (default all students) to roll-number-prefix or name matches."""
+    qs = Student.objects.all() if queryset is None else queryset
+    term = (term or "").strip()
+    if not term:
+        return qs
+    return qs.filter(_roll_prefix_q(term) | _name_q(term))
+
+
+def typeahead(term, limit=None):
+    """Up to `limit` students for a search box: roll-number prefix matches
+    (exact roll first), then name matches in name order."""
+    cap = getattr(settings, "STUDENT_SEARCH_MAX_RESULTS", 20)
+    limit = min(limit or cap, cap)
+    term = (term or "").strip()
+    if not term:
+        return []
+    students = Student.objects.select_related("class_group").only(
+        "id", "roll_no", "name", "class_group__name"
+    )
+    results = list(students.filter(_roll_prefix_q(term)).order_by("roll_no")[:limit])
+    results.sort(key=lambda s: s.roll_no.lower() != term.lower())
+    if len(results) < limit:
+        seen = [s.id for s in results]
+        results += list(
+            students.filter(_name_q(term)).exclude(id__in=seen).order_by("name")[:limit - len(results)]
+        )
+    return results
@@ -1,3 +1,8 @@
+from urllib.parse import quote
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
 
 from .models import Batch, ClassGroup, Department, Student
@@ -6,6 +11,7 @@ from .models import Batch, ClassGroup, Department, Student
 class StudentSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(write_only=True, required=False)
     image_url = serializers.SerializerMethodField(read_only=True)
+    thumbnail_url = serializers.SerializerMethodField(read_only=True)
     qr_code_url = serializers.SerializerMethodField(read_only=True)
     department = serializers.SerializerMethodField(read_only=True)
     batch = serializers.SerializerMethodField(read_only=True)
@@ -28,12 +34,13 @@ class StudentSerializer(serializers.ModelSerializer):
             "id",
             "roll_no",
             "name",
-            "face_encoding",
+            "encoding_state",
             "qr_code",
             "qr_code_url",
             "created_at",
             "image",
             "image_url",
+            "thumbnail_url",
             "department",
             "batch",
             "class_group",
@@ -42,34 +49,37 @@ class StudentSerializer(serializers.ModelSerializer):
             "class_group_id",
         ]
         read_only_fields = [
-            "face_encoding",
+            "encoding_state",
             "qr_code",
             "created_at",
             "image_url",
+            "thumbnail_url",
             "qr_code_url",
         ]
 
-    def get_image_url(self, obj):
+    def _file_url(self, field):
         request = self.context.get("request") if hasattr(self, "context") else None
-        if obj.image and hasattr(obj.image, "url"):
+        if field and hasattr(field, "url"):
             try:
                 if request:
-                    return request.build_absolute_uri(obj.image.url)
-                return obj.image.url
+                    return request.build_absolute_uri(field.url)
+                return field.url
             except Exception:
                 return None
         return None
 
+    def get_image_url(self, obj):
+        return self._file_url(obj.image)
+
+    def get_thumbnail_url(self, obj):
+        # Small JPEG for avatars/lists; None until the background pipeline has run
+        return self._file_url(obj.image_thumbnail)
+
     def get_qr_code_url(self, obj):
+        # QR codes are rendered on demand; stored qr_code files are legacy
         request = self.context.get("request") if hasattr(self, "context") else None
-        if obj.qr_code and hasattr(obj.qr_code, "url"):
-            try:
-                if request:
-                    return request.build_absolute_uri(obj.qr_code.url)
-                return obj.qr_code.url
-            except Exception:
-                return None
-        return None
+        url = reverse("student-qr", args=[obj.roll_no])
+        return request.build_absolute_uri(url) if request else url
 
     def get_department(self, obj):
         if obj.department:
@@ -112,3 +122,79 @@ class StudentSerializer(serializers.ModelSerializer):
 
         # Use default update for other fields
         return super().update(instance, validated_data)
+
+
+class SparseFieldsMixin:
+    """Keep only the fields named in ``?fields=a,b,c`` (unknown names are ignored)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        wanted = request.query_params.get("fields") if request is not None else None
+        if wanted:
+            keep = {name.strip() for name in wanted.split(",")}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+
+class StudentListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Read-only list row: no face_encoding blob (encoding_state only), and the
+    image/QR URLs are built from prefixes resolved once per response rather
+    than through storage and build_absolute_uri for every student."""
+
+    image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    qr_code_url = serializers.SerializerMethodField()
+    department = serializers.SerializerMethodField()
+    batch = serializers.SerializerMethodField()
+    class_group = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Student
+        fields = [
+            "id",
+            "roll_no",
+            "name",
+            "encoding_state",
+            "created_at",
+            "image_url",
+            "thumbnail_url",
+            "qr_code_url",
+            "department",
+            "batch",
+            "class_group",
+        ]
+        read_only_fields = fields
+
+    def _url_prefixes(self):
+        # One serializer instance renders every row of a list, so resolve once
+        if not hasattr(self, "_prefixes"):
+            request = self.context.get("request")
+            absolute = request.build_absolute_uri if request is not None else (lambda url: url)
+            self._prefixes = (
+                absolute(settings.MEDIA_URL),
+                absolute(reverse("student-qr", args=["__roll__"])),
+            )
+        return self._prefixes
+
+    def get_image_url(self, obj):
+        if not obj.image:
+            return None
+        return self._url_prefixes()[0] + filepath_to_uri(obj.image.name)
+
+    def get_thumbnail_url(self, obj):
+        if not obj.image_thumbnail:
+            return None
+        return self._url_prefixes()[0] + filepath_to_uri(obj.image_thumbnail.name)
+
+    def get_qr_code_url(self, obj):
+        return self._url_prefixes()[1].replace("__roll__", quote(obj.roll_no, safe=""))
+
+    def get_department(self, obj):
+        return {"id": obj.department_id, "name": obj.department.name} if obj.department_id else None
+
+    def get_batch(self, obj):
+        return {"id": obj.batch_id, "name": obj.batch.name} if obj.batch_id else None
+
+    def get_class_group(self, obj):
+        return {"id": obj.class_group_id, "name": obj.class_group.name} if obj.class_group_id else None
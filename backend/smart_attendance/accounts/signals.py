@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Batch, ClassGroup, Department, Student
+from .search import index_student
+
+
+@receiver(post_save, sender=Student)
+def index_student_name(sender, instance, update_fields=None, **kwargs):
+    # Saves that don't touch the name (e.g. the auto-encoding save) keep their grams
+    if update_fields is None or "name" in update_fields:
+        index_student(instance)
+
+
+GROUP_FIELDS = {Department: "department", Batch: "batch", ClassGroup: "class_group"}
+
+
+def _touch_students(sender, instance):
+    # Student list rows embed these names, so the list ETag (count + latest
+    # updated_at) must change when one is renamed or removed
+    Student.objects.filter(**{GROUP_FIELDS[sender]: instance}).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Department)
+@receiver(pre_save, sender=Batch)
+@receiver(pre_save, sender=ClassGroup)
+def remember_group_name(sender, instance, update_fields=None, **kwargs):
+    instance._previous_name = None
+    if instance.pk and (update_fields is None or "name" in update_fields):
+        instance._previous_name = sender.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Batch)
+@receiver(post_save, sender=ClassGroup)
+def touch_students_on_rename(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_name", None)
+    if not created and previous is not None and previous != instance.name:
+        _touch_students(sender, instance)
+
+
+@receiver(pre_delete, sender=Department)
+@receiver(pre_delete, sender=Batch)
+@receiver(pre_delete, sender=ClassGroup)
+def touch_students_on_delete(sender, instance, **kwargs):
+    # Before SET_NULL runs, while the students still point at the row
+    _touch_students(sender, instance)
@@ -0,0 +1,283 @@
+"""Bulk student import: a CSV/XLSX roster plus a ZIP of face images.
+
+Rows are validated up front, face encodings are computed in the shared
+encoding pool (attendance.utils.encoding_pool) with photos read from the ZIP
+one at a time, and students are written with one bulk_create (row by row if
+a roll_no was taken meanwhile). A bad row or photo is reported in the result
+instead of aborting the whole batch; if the import fails anyway, the photos
+it saved are deleted. The
+HTTP endpoint runs imports on the background queue as a StudentImportJob
+(run_import_job); the management command runs them inline.
+
+Roster columns (header row required, case-insensitive):
+  roll_no, name                     required
+  image                             optional file name inside the ZIP
+                                    (default: <roll_no>.jpg/.jpeg/.png)
+  department, batch, class_group    optional names, created if missing
+"""
+import csv
+import io
+import logging
+import os
+import zipfile
+import zlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Batch, ClassGroup, Department, Student, StudentImportJob, student_image_upload_path
+from .search import index_students
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+# Progress is written to the job row at most this often (images)
+PROGRESS_EVERY = 10
+
+# What ZipFile.read raises for a damaged, encrypted or unsupported member
+ZIP_READ_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, OSError, RuntimeError, NotImplementedError)
+
+
+def read_roster(fileobj, filename):
+    """Return a list of dicts (lower-cased keys) from a CSV or XLSX roster."""
+    if filename.lower().endswith(".xlsx"):
+        import openpyxl
+
+        wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h or "").strip().lower() for h in next(rows, [])]
+        return [
+            {k: ("" if v is None else str(v).strip()) for k, v in zip(header, row)}
+            for row in rows
+            if any(v not in (None, "") for v in row)
+        ]
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig")
+    return [
+        {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+        for row in csv.DictReader(text)
+    ]
+
+
+class _Lookups:
+    """Name -> instance caches for department/batch/class group, creating missing ones."""
+
+    def __init__(self):
+        self.departments = {d.name: d for d in Department.objects.all()}
+        self.batches = {b.name: b for b in Batch.objects.all()}
+        self.classgroups = {}
+
+    def department(self, name):
+        if name and name not in self.departments:
+            self.departments[name] = Department.objects.create(name=name)
+        return self.departments.get(name)
+
+    def batch(self, name):
+        if name and name not in self.batches:
+            self.batches[name] = Batch.objects.create(name=name)
+        return self.batches.get(name)
+
+    def classgroup(self, name, department, batch):
+        if not name:
+            return None
+        key = (name, department and department.id, batch and batch.id)
+        if key not in self.classgroups:
+            self.classgroups[key] = (
+                ClassGroup.objects.filter(name=name, department=department, batch=batch).first()
+                or ClassGroup.objects.create(name=name, department=department, batch=batch)
+            )
+        return self.classgroups[key]
+
+
+def _zip_members(zf):
+    return {
+        os.path.basename(n).lower(): n
+        for n in zf.namelist()
+        if n.lower().endswith(IMAGE_EXTS) and not n.endswith("/")
+    }
+
+
+def import_students(roster_rows, images_zip=None, pool=None, progress=None):
+    """Create students from roster rows and images in `images_zip`.
+
+    Returns {"created": n, "without_face": n, "errors": [...], "warnings": [...]}
+    where each entry is {"row", "roll_no", "error"}. Rows in "errors" were not
+    imported; rows in "warnings" were imported without a usable face encoding.
+    Row numbers are 1-based data rows. `pool` is the EncodingPool to use
+    (default: the shared one). `progress`, if given, is called as
+    progress(done, total) while encodings complete.
+    """
+    from attendance.utils.encoding_pool import encode_for_storage, encoding_pool
+    from attendance.utils.face_index import face_index
+    from attendance.utils.face_utils import storage_config
+    from attendance.utils.image_pipeline import process_student_image, schedule
+
+    pool = pool or encoding_pool
+    errors = []
+    warnings = []
+    seen = set()
+    valid = []
+    for i, row in enumerate(roster_rows, start=1):
+        roll_no, name = row.get("roll_no", ""), row.get("name", "")
+        if not roll_no or not name:
+            errors.append({"row": i, "roll_no": roll_no, "error": "roll_no and name are required"})
+        elif roll_no in seen:
+            errors.append({"row": i, "roll_no": roll_no, "error": "Duplicate roll_no in roster"})
+        else:
+            seen.add(roll_no)
+            valid.append((i, row))
+
+    existing = set(
+        Student.objects.filter(roll_no__in=seen).values_list("roll_no", flat=True)
+    )
+    rows = []
+    for i, row in valid:
+        if row["roll_no"] in existing:
+            errors.append({"row": i, "roll_no": row["roll_no"], "error": "Student already exists"})
+        else:
+            rows.append((i, row))
+    by_row = dict(rows)
+
+    # Stored image name and encoding per row; only the names and 1 KiB
+    # encodings are kept, photos are read, encoded and saved one at a time
+    image_names = {}
+    encodings = {}
+    try:
+        if images_zip is not None:
+            with zipfile.ZipFile(images_zip) as zf:
+                members = _zip_members(zf)
+                wanted_members = []
+                for i, row in rows:
+                    wanted = row.get("image") or ""
+                    candidates = [wanted.lower()] if wanted else [
+                        f"{row['roll_no']}{ext}".lower() for ext in IMAGE_EXTS
+                    ]
+                    member = next((members[c] for c in candidates if c in members), None)
+                    if member:
+                        wanted_members.append((i, member))
+                    elif wanted:
+                        warnings.append({"row": i, "roll_no": row["roll_no"], "error": f"Image {wanted} not in ZIP"})
+
+                unreadable = set()
+
+                def photos():
+                    # Read lazily (imap keeps only a few in flight); a damaged
+                    # member fails its own row only
+                    for i, member in wanted_members:
+                        try:
+                            data = zf.read(member)
+                        except ZIP_READ_ERRORS as e:
+                            unreadable.add(i)
+                            errors.append({"row": i, "roll_no": by_row[i]["roll_no"],
+                                           "error": f"Could not read {member} from ZIP: {e}"})
+                            continue
+                        yield (i, member, data), (data, config)
+
+                config = storage_config()
+                results = pool.imap(encode_for_storage, photos())
+                for done, ((i, member, data), (encoding, error)) in enumerate(results, start=1):
+                    row = by_row[i]
+                    if error:
+                        warnings.append({"row": i, "roll_no": row["roll_no"], "error": error})
+                    else:
+                        encodings[i] = encoding
+                    image_names[i] = default_storage.save(
+                        student_image_upload_path(Student(roll_no=row["roll_no"], name=row["name"]), os.path.basename(member)),
+                        ContentFile(data),
+                    )
+                    if progress:
+                        progress(done + len(unreadable), len(wanted_members))
+                if unreadable:
+                    rows = [(i, row) for i, row in rows if i not in unreadable]
+
+        # Create every student in one bulk insert
+        lookups = _Lookups()
+        students = {}
+        with transaction.atomic():
+            for i, row in rows:
+                department = lookups.department(row.get("department"))
+                batch = lookups.batch(row.get("batch"))
+                student = Student(
+                    roll_no=row["roll_no"],
+                    name=row["name"],
+                    department=department,
+                    batch=batch,
+                    class_group=lookups.classgroup(row.get("class_group"), department, batch),
+                )
+                if i in encodings:
+                    student.set_face_encoding(encodings[i])
+                if i in image_names:
+                    student.image.name = image_names[i]
+                students[i] = student
+            try:
+                with transaction.atomic():
+                    Student.objects.bulk_create(students.values(), batch_size=500)
+            except IntegrityError:
+                # A roll_no was taken since the check above: insert row by row
+                # and report only the rows that lost
+                for i, student in list(students.items()):
+                    try:
+                        with transaction.atomic():
+                            Student.objects.bulk_create([student])
+                    except IntegrityError:
+                        del students[i]
+                        errors.append({"row": i, "roll_no": student.roll_no, "error": "Student already exists"})
+                        if i in image_names:
+                            default_storage.delete(image_names.pop(i))
+            # bulk_create skips post_save and Student.save() (and may not set pks on MySQL)
+            created = Student.objects.filter(roll_no__in=[s.roll_no for s in students.values()])
+            index_students(created)
+            # Thumbnails/compression normally queued by Student.save()
+            for pk in created.exclude(image="").exclude(image__isnull=True).values_list("id", flat=True):
+                schedule(process_student_image, pk)
+    except BaseException:
+        # Nothing was imported: don't leave the photos saved so far behind
+        for name in image_names.values():
+            default_storage.delete(name)
+        raise
+
+    # Let the identification index reload as well
+    face_index.invalidate()
+    errors.sort(key=lambda e: e["row"])
+    warnings.sort(key=lambda e: e["row"])
+    return {
+        "created": len(students),
+        "without_face": sum(1 for i in students if i not in encodings),
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+def run_import_job(job_id, roster_rows, zip_path=None):
+    """Background-queue entry point for a StudentImportJob. Deletes zip_path when done."""
+    job = StudentImportJob.objects.get(pk=job_id)
+    job.status = "running"
+    job.save(update_fields=["status"])
+
+    def progress(done, total):
+        if done % PROGRESS_EVERY == 0 or done == total:
+            StudentImportJob.objects.filter(pk=job_id).update(done=done, total=total)
+
+    try:
+        report = import_students(roster_rows, zip_path, progress=progress)
+    except Exception as e:
+        logger.exception("Student import %s failed", job_id)
+        StudentImportJob.objects.filter(pk=job_id).update(
+            status="failed", error=str(e), finished_at=timezone.now(),
+        )
+        return
+    finally:
+        if zip_path:
+            try:
+                os.remove(zip_path)
+            except FileNotFoundError:
+                pass
+    StudentImportJob.objects.filter(pk=job_id).update(
+        status="done", report=report, finished_at=timezone.now(),
+    )
+    logger.info(
+        "Imported %d students (%d errors, %d warnings)",
+        report["created"], len(report["errors"]), len(report["warnings"]),
+    )
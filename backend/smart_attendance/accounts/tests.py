@@ -1,3 +1,399 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+
+from attendance.models import AdminSetting
+from .models import ClassGroup, Department, EncodingState, Student, encoding_state_for
+from .search import search_students
+from .views import StudentListView
+from .student_import import import_students, read_roster
+
+
+@override_settings(FACE_POOL_WORKERS=0)  # encode inline
+class StudentImportTests(TestCase):
+    roster = (
+        "Roll_No,Name,Department,Batch,Class_Group\n"
+        "R1,Asha,BCA,2026,BCA-1\n"
+        "R2,Bikash,BCA,2026,BCA-1\n"
+        "R2,Duplicate,BCA,2026,BCA-1\n"
+        ",No Roll,BCA,2026,BCA-1\n"
+        "R3,Chandra,,,\n"
+    )
+
+    def test_import_reports_bad_rows_and_creates_the_rest(self):
+        Student.objects.create(roll_no="R3", name="Existing")
+        rows = read_roster(io.BytesIO(self.roster.encode()), "roster.csv")
+        report = import_students(rows)
+
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(report["without_face"], 2)
+        self.assertEqual(
+            [(e["row"], e["error"]) for e in report["errors"]],
+            [(3, "Duplicate roll_no in roster"), (4, "roll_no and name are required"),
+             (5, "Student already exists")],
+        )
+        asha = Student.objects.get(roll_no="R1")
+        self.assertEqual(asha.class_group, ClassGroup.objects.get())
+        self.assertEqual(asha.department.name, "BCA")
+
+    def test_command_writes_report_to_stdout(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(self.roster)
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        call_command("import_students", f.name, "--workers", "0", stdout=out)
+        self.assertIn("Read 5 roster rows.", out.getvalue())
+        self.assertIn("Duplicate roll_no in roster", out.getvalue())
+
+    def test_endpoint_queues_a_job_and_reports_progress(self):
+        client = APIClient()
+        url = "/api/students/import/"
+        self.assertEqual(client.post(url).status_code, 403)
+
+        AdminSetting.objects.create(pin_hash=make_password("11111"))
+        token = client.post("/api/admin/auth/", {"pin": "11111"}).data["token"]
+        self.assertEqual(client.post(url, HTTP_X_ADMIN_TOKEN=token).status_code, 400)
+        bad_zip = {
+            "roster": SimpleUploadedFile("roster.csv", self.roster.encode()),
+            "images": SimpleUploadedFile("photos.zip", b"not a zip"),
+        }
+        self.assertEqual(client.post(url, bad_zip, HTTP_X_ADMIN_TOKEN=token).status_code, 400)
+
+        # Run the queued job inline instead of on a worker thread
+        with mock.patch("accounts.views.background.submit", side_effect=lambda fn, *args: fn(*args)), \
+                self.captureOnCommitCallbacks(execute=True):
+            resp = client.post(
+                url,
+                {"roster": SimpleUploadedFile("roster.csv", self.roster.encode())},
+                HTTP_X_ADMIN_TOKEN=token,
+            )
+        self.assertEqual(resp.status_code, 202)
+        self.assertTrue(resp.data["status_url"].endswith(f"/api/students/import/{resp.data['job']}/"))
+
+        job = client.get(resp.data["status_url"], HTTP_X_ADMIN_TOKEN=token).data
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["report"]["created"], 3)
+        self.assertEqual(client.get(resp.data["status_url"]).status_code, 403)
+
+    def photos_zip(self, corrupt=None):
+        # R1.jpg and R2.JPG, stored uncompressed so a member can be damaged in place
+        buf = io.BytesIO()
+        photos = {}
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+            for shade, name in enumerate(("photos/R1.jpg", "photos/R2.JPG")):
+                photo = io.BytesIO()
+                Image.new("RGB", (40, 40), (shade * 100, 0, 0)).save(photo, "JPEG")
+                photos[name] = photo.getvalue()
+                zf.writestr(name, photos[name])
+        data = bytearray(buf.getvalue())
+        if corrupt:
+            at = data.index(photos[corrupt]) + 100
+            data[at] ^= 0xFF  # CRC check fails on read
+        return io.BytesIO(bytes(data))
+
+    def stored_files(self, media):
+        return sorted(f for _, _, files in os.walk(media) for f in files)
+
+    def test_zip_images_are_stored_and_queued_for_thumbnails(self):
+        rows = read_roster(io.BytesIO(self.roster.encode()), "roster.csv")
+        progress = mock.Mock()
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                mock.patch("attendance.utils.image_pipeline.schedule") as schedule:
+            report = import_students(rows, self.photos_zip(), progress=progress)
+            stored = Student.objects.get(roll_no="R1").image.name
+            self.assertTrue(os.path.exists(os.path.join(media, stored)))
+
+        self.assertEqual(progress.call_args_list[-1], mock.call(2, 2))
+        # No face in a blank photo: imported, with a warning
+        self.assertEqual([w["roll_no"] for w in report["warnings"]], ["R1", "R2"])
+        queued = {call.args[1] for call in schedule.call_args_list}
+        self.assertEqual(queued, set(Student.objects.filter(roll_no__in=["R1", "R2"]).values_list("id", flat=True)))
+
+    def test_damaged_photo_and_concurrent_roll_no_fail_their_row_only(self):
+        rows = read_roster(io.BytesIO(self.roster.encode()), "roster.csv")
+
+        def registered_meanwhile(done, total):
+            if done == total:
+                Student.objects.create(roll_no="R2", name="Registered meanwhile")
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                mock.patch("attendance.utils.image_pipeline.schedule"):
+            report = import_students(rows, self.photos_zip(corrupt="photos/R1.jpg"), progress=registered_meanwhile)
+            # R2's photo was saved before its insert lost; it is removed again
+            self.assertEqual(self.stored_files(media), [])
+
+        self.assertEqual(report["created"], 1)
+        errors = {e["row"]: e["error"] for e in report["errors"]}
+        self.assertIn("Could not read photos/R1.jpg from ZIP", errors[1])
+        self.assertEqual(errors[2], "Student already exists")
+        self.assertFalse(Student.objects.filter(roll_no="R1").exists())
+        self.assertEqual(Student.objects.get(roll_no="R2").name, "Registered meanwhile")
+        self.assertTrue(Student.objects.filter(roll_no="R3").exists())
+
+    def test_failed_import_removes_saved_photos(self):
+        rows = read_roster(io.BytesIO(self.roster.encode()), "roster.csv")
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                mock.patch("accounts.student_import.index_students", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                import_students(rows, self.photos_zip())
+            self.assertEqual(self.stored_files(media), [])
+        self.assertFalse(Student.objects.filter(roll_no__in=["R1", "R2", "R3"]).exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FixFaceEncodingsTests(TestCase):
+    def setUp(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "students"), exist_ok=True)
+        self.checkpoint = os.path.join(settings.MEDIA_ROOT, "checkpoint.json")
+        encodings = {
+            "R1": None,
+            "R2": np.zeros(128).tobytes(),
+            "R3": b"\x00\x01",
+            "R4": np.ones(128).tobytes(),
+        }
+        for roll_no in encodings:
+            Image.new("RGB", (20, 20)).save(os.path.join(settings.MEDIA_ROOT, f"students/{roll_no}.jpg"))
+        # bulk_create so Student.save() doesn't try to encode on the way in
+        self.students = Student.objects.bulk_create(
+            Student(roll_no=roll_no, name=roll_no, image=f"students/{roll_no}.jpg",
+                    face_encoding=raw, encoding_state=encoding_state_for(raw),
+                    encoding_version=1)
+            for roll_no, raw in encodings.items()
+        )
+
+    def _run(self, *args):
+        out = io.StringIO()
+        call_command(
+            "fix_face_encodings", "--workers", "0", "--checkpoint", self.checkpoint, *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_dry_run_finds_null_zero_and_malformed(self):
+        out = self._run("--dry-run")
+        self.assertIn("3 students to encode (1 default, 1 invalid, 1 missing)", out)
+
+    @mock.patch("accounts.management.commands.fix_face_encodings.encode_for_storage")
+    def test_bulk_updates_and_resumes_from_checkpoint(self, encode):
+        encoding = np.full(128, 0.5).tobytes()
+        encode.return_value = (encoding, None)
+        with open(self.checkpoint, "w") as f:
+            json.dump({"run": {"all": False, "since": None}, "last_id": self.students[0].id,
+                       "fixed": 1, "failed": 0}, f)
+
+        out = self._run("--batch-size", "1")
+        self.assertIn("Resuming after student id", out)
+        self.assertIn("Done. Fixed 3 students, 0 failed.", out)
+        self.assertEqual(encode.call_count, 2)  # R1 was done before the "interruption"
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertFalse(Student.objects.get(roll_no="R1").has_valid_encoding)
+        self.assertEqual(bytes(Student.objects.get(roll_no="R3").face_encoding), encoding)
+        self.assertEqual(bytes(Student.objects.get(roll_no="R4").face_encoding), np.ones(128).tobytes())
+
+
+class StudentQRTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = ClassGroup.objects.create(name="BCA-1")
+        self.student = Student.objects.create(roll_no="R1", name="Asha", class_group=self.group)
+
+    def test_save_does_not_render_qr(self):
+        self.assertFalse(self.student.qr_code)
+
+    def test_qr_png_is_cached_with_etag(self):
+        client = APIClient()
+        resp = client.get("/api/students/R1/qr.png")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "image/png")
+        self.assertIn("max-age", resp["Cache-Control"])
+        self.assertEqual(Image.open(io.BytesIO(resp.content)).format, "PNG")
+
+        with self.assertNumQueries(1):
+            again = client.get("/api/students/R1/qr.png", HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(client.get("/api/students/NOPE/qr.png").status_code, 404)
+
+    def test_class_group_sheet(self):
+        for i in range(2, 23):
+            Student.objects.create(roll_no=f"R{i}", name=f"Student {i}", class_group=self.group)
+        resp = APIClient().get(f"/api/classgroups/{self.group.id}/qr-sheet/")
+        self.assertEqual(resp["Content-Type"], "application/pdf")
+        self.assertTrue(resp.content.startswith(b"%PDF"))
+        self.assertIn(b"/Count 2", resp.content)  # 22 students, 20 per page
+
+
+class EncodingStateTests(TestCase):
+    def test_state_is_maintained_on_write(self):
+        student = Student.objects.create(roll_no="R1", name="Asha")
+        self.assertEqual(student.encoding_state, EncodingState.DEFAULT)
+
+        student.set_face_encoding(np.full(128, 0.1).tobytes())
+        student.save()
+        student.refresh_from_db()
+        self.assertEqual((student.encoding_state, student.encoding_version), (EncodingState.VALID, 1))
+        self.assertTrue(student.has_valid_encoding)
+
+        student.face_encoding = b"\x00" * 10
+        student.save(update_fields=["face_encoding"])
+        student.refresh_from_db()
+        self.assertEqual((student.encoding_state, student.encoding_version), (EncodingState.INVALID, 0))
+
+        Student.objects.create(roll_no="R2", name="Bikash", face_encoding=None)
+        self.assertEqual(
+            list(Student.objects.exclude(encoding_state=EncodingState.VALID)
+                 .order_by("roll_no").values_list("encoding_state", flat=True)),
+            [EncodingState.INVALID, EncodingState.MISSING],
+        )
+
+
+class StudentListTests(TestCase):
+    url = "/api/students/"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.department = Department.objects.create(name="BCA")
+        for i in range(3):
+            Student.objects.create(roll_no=f"R{i}", name=f"Student {i}", department=self.department)
+
+    def test_rows_are_lean(self):
+        rows = self.client.get(self.url).data
+        self.assertEqual(len(rows), 3)
+        self.assertNotIn("face_encoding", rows[0])
+        self.assertEqual(rows[0]["encoding_state"], "default")
+        self.assertEqual(rows[0]["department"], {"id": self.department.id, "name": "BCA"})
+        self.assertTrue(rows[0]["qr_code_url"].startswith("http://testserver/api/students/R"))
+
+        rows = self.client.get(self.url, {"fields": "id,roll_no"}).data
+        self.assertEqual(set(rows[0]), {"id", "roll_no"})
+
+    def test_unchanged_list_returns_304(self):
+        first = self.client.get(self.url, {"fields": "id,name"})
+        etag = first["ETag"]
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, {"fields": "id,name"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        self.department.name = "BBA"
+        self.department.save()
+        resp = self.client.get(self.url, {"fields": "id,name"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+    def test_list_view_sends_etag(self):
+        # StudentListView had its own list() that bypassed ConditionalListMixin
+        view = StudentListView.as_view()
+        factory = APIRequestFactory()
+        first = view(factory.get("/", {"page_size": 2}))
+        self.assertIn("ETag", first)
+        resp = view(factory.get("/", {"page_size": 2}, HTTP_IF_NONE_MATCH=first["ETag"]))
+        self.assertEqual(resp.status_code, 304)
+
+    def test_etag_follows_group_renames_and_deletes(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(2):  # old name lookup + the save; no student UPDATE
+            self.department.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.department.name = "BBA"
+        self.department.save()
+        renamed = self.client.get(self.url)["ETag"]
+        self.assertNotEqual(renamed, etag)
+
+        self.department.delete()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=renamed)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNone(resp.data[0]["department"])
+
+
+class StudentSearchTests(TestCase):
+    def setUp(self):
+        for roll_no, name in [("BCA001", "Ram Sharma"), ("BCA002", "Sita Ram Karki"),
+                              ("BCA010", "Hari Bahadur"), ("BBA001", "Gita Sharma")]:
+            Student.objects.create(roll_no=roll_no, name=name)
+
+    def _rolls(self, term):
+        return sorted(search_students(term).values_list("roll_no", flat=True))
+
+    def test_roll_prefix_and_name_grams(self):
+        self.assertEqual(self._rolls("bca00"), ["BCA001", "BCA002"])
+        self.assertEqual(self._rolls("arm"), ["BBA001", "BCA001"])  # inside "Sharma"
+        self.assertEqual(self._rolls("ram"), ["BCA001", "BCA002"])
+        self.assertEqual(self._rolls("s"), ["BBA001", "BCA001", "BCA002"])  # word starts
+        self.assertEqual(self._rolls("ram karki"), ["BCA002"])
+        self.assertEqual(self._rolls("xyz"), [])
+
+    def test_roll_prefix_matches_lower_case_rolls(self):
+        Student.objects.create(roll_no="bca011", name="Maya Thapa")
+        self.assertEqual(self._rolls("BCA01"), ["BCA010", "bca011"])
+        self.assertEqual(self._rolls("Bca01"), ["BCA010", "bca011"])
+
+    def test_renames_are_reindexed(self):
+        student = Student.objects.get(roll_no="BCA010")
+        student.name = "Hari Sharma"
+        student.save()
+        self.assertIn("BCA010", self._rolls("sharma"))
+        self.assertNotIn("BCA010", self._rolls("bahadur"))
+
+    def test_typeahead_is_capped_and_roll_matches_first(self):
+        resp = APIClient().get("/api/students/search/", {"q": "bca001"})
+        self.assertEqual([r["roll_no"] for r in resp.json()["results"]], ["BCA001"])
+        resp = APIClient().get("/api/students/search/", {"q": "s", "limit": 2})
+        self.assertEqual(len(resp.json()["results"]), 2)
+        resp = APIClient().get("/api/students/", {"search": "sharma"})
+        self.assertEqual(len(resp.data), 2)
+
+
+class StudentPaginationTests(TestCase):
+    def setUp(self):
+        for i in range(7):
+            Student.objects.create(roll_no=f"R{i}", name=f"Student {i}")
+        # Same timestamp everywhere: id has to break the ties
+        Student.objects.update(created_at=timezone.now())
+
+    def test_cursor_pages_walk_every_student_once(self):
+        client = APIClient()
+        with self.assertNumQueries(2):  # ETag aggregate + one keyset page, no COUNT(*)
+            page = client.get("/api/students/", {"cursor": "", "page_size": 3, "fields": "roll_no"}).data
+        self.assertIsNone(page["previous"])
+        seen = [r["roll_no"] for r in page["results"]]
+        pages = [page]
+        while page["next"]:
+            page = client.get(page["next"]).data
+            pages.append(page)
+            seen += [r["roll_no"] for r in page["results"]]
+        self.assertEqual(seen, [f"R{i}" for i in range(6, -1, -1)])
+        self.assertEqual(len(pages), 3)
+
+        back = client.get(pages[1]["previous"]).data
+        self.assertEqual(back["results"], pages[0]["results"])
+        self.assertEqual(client.get("/api/students/", {"cursor": "garbage"}).status_code, 404)
+
+    def test_page_numbers_with_approximate_count(self):
+        view = StudentListView.as_view()
+        factory = APIRequestFactory()
+        resp = view(factory.get("/", {"page": 2, "page_size": 3, "count": "approximate"}))
+        self.assertEqual((resp.data["count"], resp.data["count_is_exact"]), (7, True))
+        self.assertEqual(len(resp.data["results"]), 3)
+
+        with self.settings(APPROXIMATE_COUNT_CAP=5):
+            resp = view(factory.get("/", {"page": 3, "page_size": 3, "count": "approximate"}))
+        self.assertEqual((resp.data["count"], resp.data["count_is_exact"]), (5, False))
+        self.assertEqual([r["roll_no"] for r in resp.data["results"]], ["R0"])
+        self.assertIsNone(resp.data["next"])
+
+        resp = view(factory.get("/", {"page_size": 4}))
+        self.assertEqual(len(resp.data["results"]), 4)
+        self.assertNotIn("count", resp.data)
@@ -1,17 +1,29 @@
 import logging
 from django.conf import settings
+import hashlib
 import json
+import shutil
+import tempfile
+import zipfile
 from django.views.decorators.csrf import csrf_exempt
-from django.db import models
-from django.http import JsonResponse
+from django.db import models, transaction
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
-from rest_framework import filters, generics, pagination, status, viewsets
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+from rest_framework import generics, pagination, status, viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from attendance.models import AdminToken
+from attendance.utils.admin_tokens import is_token_valid
+from attendance.utils.background import background
+from attendance.utils.encoding_pool import EncoderBusy, EncoderTimeout, encoder_unavailable_response, encoding_pool
+from attendance.utils.qr_utils import qr_etag, render_qr_png, render_qr_sheet
 
-from .models import Batch, ClassGroup, Department, Student
-from .serializers import StudentSerializer
+from .models import Batch, ClassGroup, Department, Student, StudentImportJob
+from .serializers import StudentListSerializer, StudentSerializer
+from .pagination import ApproximateCountPaginator, StudentCursorPagination
+from .search import search_students, typeahead
+from .student_import import read_roster, run_import_job
 
 logger = logging.getLogger(__name__)
 
@@ -20,11 +32,7 @@ def _admin_token_valid(request):
     token = request.headers.get("X-Admin-Token") or request.META.get("HTTP_X_ADMIN_TOKEN")
     # If token provided, validate normally
     if token:
-        try:
-            t = AdminToken.objects.get(key=token)
-            return not t.is_expired()
-        except AdminToken.DoesNotExist:
-            return False
+        return is_token_valid(token)
 
     # Development convenience: allow actions without token when DEBUG=True
     if getattr(settings, "DEBUG", False):
@@ -204,41 +212,77 @@ def batch_classgroups(request, batch_id):
     return JsonResponse(list(qs), safe=False)
 
 
+def _student_qr_etag(request, roll_no):
+    # None (no ETag) for unknown students so the view can answer 404
+    if Student.objects.filter(roll_no=roll_no).exists():
+        return qr_etag(roll_no)
+    return None
+
+
+@require_GET
+@condition(etag_func=_student_qr_etag)
+def student_qr(request, roll_no):
+    """GET /api/students/<roll_no>/qr.png — rendered on first request, then cached."""
+    if not Student.objects.filter(roll_no=roll_no).exists():
+        return JsonResponse({"error": "Student not found"}, status=404)
+    response = HttpResponse(render_qr_png(roll_no), content_type="image/png")
+    patch_cache_control(response, public=True, max_age=getattr(settings, "QR_CACHE_TIMEOUT", 7 * 24 * 3600))
+    return response
+
+
+@require_GET
+def classgroup_qr_sheet(request, classgroup_id):
+    """GET /api/classgroups/<id>/qr-sheet/ — printable A4 PDF of every student's QR code."""
+    try:
+        group = ClassGroup.objects.get(pk=classgroup_id)
+    except ClassGroup.DoesNotExist:
+        return JsonResponse({"error": "Not found"}, status=404)
+    students = Student.objects.filter(class_group=group).order_by("roll_no").values_list("roll_no", "name")
+    response = HttpResponse(render_qr_sheet(students.iterator(), title=group.name), content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="qr_{group.name}.pdf"'
+    return response
+
+
 class RegisterStudent(APIView):
     def post(self, request):
         # handle file upload via DRF
         image = request.FILES.get("image")
 
-        # Create student record first (Student.save() will generate QR if missing)
-        student = Student.objects.create(
-            roll_no=request.data.get("roll_no"),
-            name=request.data.get("name"),
-        )
+        # Refuse early (before writing anything) if the encoding pool is already
+        # full; it can still fill up before the encode, which is handled below
+        if image and encoding_pool.is_saturated():
+            return encoder_unavailable_response(EncoderBusy(getattr(settings, "FACE_POOL_RETRY_AFTER", 2)))
+
+        student = None
+        try:
+            with transaction.atomic():
+                # Create student record first (QR codes are rendered on demand by student_qr)
+                student = Student.objects.create(
+                    roll_no=request.data.get("roll_no"),
+                    name=request.data.get("name"),
+                )
+                if image:
+                    # Save uploaded file to the Student.image field so Django stores it using upload_to.
+                    # Student.save() then computes the face encoding from the saved file (in the
+                    # encoding pool), so there is no need to encode a second time here.
+                    student.image.save(image.name, image, save=True)
+        except (EncoderBusy, EncoderTimeout) as e:
+            # The student row is rolled back; drop the photo nothing refers to now
+            if student is not None and student.image:
+                student.image.storage.delete(student.image.name)
+            return encoder_unavailable_response(e)
 
         if image:
-            # Save uploaded file to the Student.image field so Django stores it using upload_to
-            student.image.save(image.name, image, save=True)
-
-            # After the file is saved, compute face encoding from the saved file path
-            try:
-                encoding = get_face_encoding(student.image.path)
-                if encoding:
-                    student.face_encoding = encoding
-                    # Update only face_encoding field
-                    student.save(update_fields=["face_encoding"])
-                else:
-                    # No face found — keep default encoding (zeros) and log
-                    print(
-                        f"Warning: No face detected in uploaded image for {student.roll_no}"
-                    )
-            except Exception as e:
-                print(f"Error extracting face encoding for {student.roll_no}: {e}")
+            if not student.has_valid_encoding:
+                # No face found — keep default encoding (zeros) and log
+                print(
+                    f"Warning: No face encoding computed for uploaded image of {student.roll_no}"
+                )
         else:
             print("No image uploaded for student")
 
         # At this point:
         # - student.image points to the stored file path (media/students/...)
-        # - student.qr_code has been generated/saved by the model's save() during create
         # - face_encoding is stored if extraction succeeded (otherwise default remains)
         print(f"Registered student {student.roll_no} (id={student.id})")
         return Response(
@@ -246,37 +290,172 @@ class RegisterStudent(APIView):
         )
 
 
+class StudentImportView(APIView):
+    """
+    POST /api/students/import/
+    Header: X-Admin-Token
+    Files: roster (CSV or XLSX), images (ZIP, optional)
+
+    Validates the upload and queues the import on the background queue;
+    answers 202 with the job id. Poll GET /api/students/import/<id>/ for
+    progress and, once done, the per-row errors/warnings report (see
+    accounts.student_import).
+    """
+
+    def post(self, request):
+        if not _admin_token_valid(request):
+            return Response({"error": "Unauthorized"}, status=403)
+        roster = request.FILES.get("roster")
+        images = request.FILES.get("images")
+        if not roster:
+            return Response({"error": "roster file (CSV or XLSX) is required"}, status=400)
+        try:
+            rows = read_roster(roster, roster.name)
+        except Exception as e:
+            return Response({"error": f"Could not read roster: {e}"}, status=400)
+        if images is not None and not zipfile.is_zipfile(images):
+            return Response({"error": "images must be a ZIP file"}, status=400)
+
+        zip_path = None
+        if images is not None:
+            # The upload's temp file goes away with the request; the job gets its own copy
+            images.seek(0)
+            with tempfile.NamedTemporaryFile(prefix="student-import-", suffix=".zip", delete=False) as f:
+                shutil.copyfileobj(images, f)
+            zip_path = f.name
+
+        job = StudentImportJob.objects.create(total=len(rows))
+        transaction.on_commit(lambda: background.submit(run_import_job, job.pk, rows, zip_path))
+        return Response(
+            {"job": job.pk, "status": job.status, "status_url": request.build_absolute_uri(f"{job.pk}/")},
+            status=202,
+        )
+
+
+class StudentImportStatusView(APIView):
+    """GET /api/students/import/<id>/ — progress and report of an import job (admin token)."""
+
+    def get(self, request, job_id):
+        if not _admin_token_valid(request):
+            return Response({"error": "Unauthorized"}, status=403)
+        job = StudentImportJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({"error": "Import not found"}, status=404)
+        return Response({
+            "job": job.pk,
+            "status": job.status,
+            "done": job.done,
+            "total": job.total,
+            "report": job.report,
+            "error": job.error or None,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        })
+
+
+@require_GET
+def student_typeahead(request):
+    """GET /api/students/search/?q=<text>&limit=<n> — capped suggestions for search boxes."""
+    try:
+        limit = int(request.GET.get("limit") or 0)
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+    results = [
+        {
+            "id": s.id,
+            "roll_no": s.roll_no,
+            "name": s.name,
+            "class_group": s.class_group.name if s.class_group_id else None,
+        }
+        for s in typeahead(request.GET.get("q"), limit)
+    ]
+    return JsonResponse({"results": results})
+
+
 class StandardResultsSetPagination(pagination.PageNumberPagination):
+    """Page-number pagination. ``?count=approximate`` swaps the exact COUNT(*)
+    for accounts.pagination.approximate_count and adds ``count_is_exact``."""
+
     page_size = 30
     page_size_query_param = "page_size"
     max_page_size = 200
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.approximate = request.query_params.get("count") == "approximate"
+        if self.approximate:
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.approximate:
+            response.data["count_is_exact"] = self.page.paginator.count_is_exact
+        return response
 
-class StudentListView(generics.ListAPIView):
+
+class ConditionalListMixin:
+    """ETag / If-None-Match for list endpoints over Student querysets.
+
+    The ETag is derived from one aggregate query (row count + latest
+    updated_at of the filtered queryset) plus the full query string, so an
+    unchanged admin table refresh costs that query and returns 304 without
+    fetching or serializing any rows.
+    """
+
+    def list_etag(self, queryset):
+        stats = queryset.order_by().aggregate(n=models.Count("id"), last=models.Max("updated_at"))
+        raw = f"{stats['n']}:{stats['last']}:{self.request.get_full_path()}"
+        return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        etag = self.list_etag(self.filter_queryset(self.get_queryset()))
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class StudentListView(ConditionalListMixin, generics.ListAPIView):
     """API endpoint that returns students with filtering and pagination.
 
+    Pagination is keyset-based: follow ``next``/``previous`` (``?cursor=``),
+    ordered by (created_at, id) newest first. Clients that need page numbers
+    can pass ``page`` instead, optionally with ``count=approximate``.
+
     Query params:
-      - page (DRF page number)
+      - cursor (opaque, from next/previous links)
+      - page (DRF page number, switches to page-number pagination)
       - page_size (optional)
+      - count (page-number only: "approximate" skips the exact COUNT(*))
       - date_from (YYYY-MM-DD)
       - date_to (YYYY-MM-DD)
       - batch (batch id)
       - department (department id)
-      - search (search string for name or roll)
+      - search (roll number prefix, or words contained in the name)
+      - fields (comma separated subset of the row fields, e.g. id,roll_no,name)
     """
 
     queryset = Student.objects.select_related(
         "department", "batch", "class_group"
-    ).order_by("-created_at")
-    serializer_class = StudentSerializer
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ["name", "roll_no"]
+    ).defer("face_encoding").order_by("-created_at", "-id")
+    serializer_class = StudentListSerializer
+    pagination_class = StudentCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            page_numbers = "page" in self.request.query_params
+            self._paginator = StandardResultsSetPagination() if page_numbers else StudentCursorPagination()
+        return self._paginator
 
     def get_queryset(self):
         qs = Student.objects.select_related(
             "department", "batch", "class_group"
-        ).order_by("-created_at")
+        ).defer("face_encoding").order_by("-created_at", "-id")
         req = self.request
         date_from = req.GET.get("date_from")
         date_to = req.GET.get("date_to")
@@ -293,32 +472,11 @@ class StudentListView(generics.ListAPIView):
         if dept:
             qs = qs.filter(department_id=dept)
         if search:
-            qs = qs.filter(
-                models.Q(name__icontains=search) | models.Q(roll_no__icontains=search)
-            )
+            # Roll number prefix or indexed name match (accounts.search)
+            qs = search_students(search, qs)
 
         return qs
 
-    def list(self, request, *args, **kwargs):
-        """Override to add debugging and ensure proper response format"""
-        try:
-            queryset = self.filter_queryset(self.get_queryset())
-            print(f"DEBUG: Found {queryset.count()} students")
-
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
-        except Exception as e:
-            logger.exception("Error in StudentListView.list: %s", e)
-            return Response(
-                {"error": f"Failed to fetch students: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
 
 class StudentDetailView(generics.RetrieveUpdateAPIView):
     queryset = Student.objects.select_related(
@@ -332,21 +490,51 @@ class StudentDetailView(generics.RetrieveUpdateAPIView):
         return self.partial_update(request, *args, **kwargs)
 
 
-class StudentViewSet(viewsets.ModelViewSet):
+class StudentViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Student.objects.select_related(
         "department", "batch", "class_group"
     ).all()
     serializer_class = StudentSerializer
 
+    @property
+    def paginator(self):
+        # The list stays unpaginated for existing clients; ?cursor= (empty for
+        # the first page) opts into keyset pagination
+        if not hasattr(self, "_paginator"):
+            wants_cursor = self.action == "list" and "cursor" in self.request.query_params
+            self._paginator = StudentCursorPagination() if wants_cursor else None
+        return self._paginator
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == "list":
+            qs = qs.defer("face_encoding")
+            search = self.request.query_params.get("search")
+            if search:
+                qs = search_students(search, qs)
+        return qs
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return StudentListSerializer
+        return StudentSerializer
+
     def partial_update(self, request, *args, **kwargs):
         """Handle PATCH requests for student updates"""
         try:
             instance = self.get_object()
+            old_image = instance.image.name
             serializer = self.get_serializer(instance, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            self.perform_update(serializer)
+            with transaction.atomic():
+                self.perform_update(serializer)
 
             return Response(serializer.data)
+        except (EncoderBusy, EncoderTimeout) as e:
+            # A new photo could not be encoded: the update is rolled back
+            if instance.image and instance.image.name != old_image:
+                instance.image.storage.delete(instance.image.name)
+            return encoder_unavailable_response(e)
         except Exception as e:
             logger.exception("Error updating student: %s", e)
             return Response(
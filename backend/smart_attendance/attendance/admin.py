@@ -1,11 +1,45 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Attendance
+from django.utils.encoding import filepath_to_uri
+from django.utils.html import format_html
+from .models import Attendance, AttendanceImage, AttendanceSummary, Holiday
 
 class AttendanceAdmin(admin.ModelAdmin):
-    list_display = ('student', 'date', 'time', 'status')
+    list_display = ('student', 'date', 'time', 'status', 'match_distance')
     list_filter = ('date', 'status')
     search_fields = ('student__name', 'student__roll_no')
     date_hierarchy = 'date'
+    ordering = ('-date', '-time')
+    list_select_related = ('student',)
 
 admin.site.register(Attendance, AttendanceAdmin)
 
+class AttendanceImageAdmin(admin.ModelAdmin):
+    list_display = ('thumbnail_display', 'attendance', 'kind', 'distance', 'size', 'original_size', 'created_at')
+    list_filter = ('kind', ('processed_at', admin.EmptyFieldListFilter))
+    search_fields = ('attendance__student__roll_no', 'sha256')
+    list_select_related = ('attendance__student',)
+    raw_id_fields = ('attendance',)
+
+    def thumbnail_display(self, obj):
+        if not obj.thumbnail:
+            return ""
+        return format_html('<img src="{}" height="48" alt="">', settings.MEDIA_URL + filepath_to_uri(obj.thumbnail))
+
+    thumbnail_display.short_description = "Photo"
+
+admin.site.register(AttendanceImage, AttendanceImageAdmin)
+
+class AttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('student', 'period', 'present_days', 'on_time_days', 'late_days', 'first_date', 'last_date')
+    list_filter = ('period',)
+    search_fields = ('student__name', 'student__roll_no')
+    list_select_related = ('student',)
+
+admin.site.register(AttendanceSummary, AttendanceSummaryAdmin)
+
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name')
+    date_hierarchy = 'date'
+
+admin.site.register(Holiday, HolidayAdmin)
@@ -0,0 +1,246 @@
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import nullcontext
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.client import Client
+from django.test.utils import override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import EncodingState, Student, current_encoding_version
+from accounts.views import StudentListView
+from attendance.utils.encoding_pool import encoding_pool
+from attendance.utils.face_utils import get_face_encoding
+from attendance.utils.metrics import RequestMetrics
+from attendance.utils.query_audit import can_collect_stats, seed
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _percentile(sorted_ms, p):
+    # Nearest-rank percentile of an already sorted list
+    rank = max(1, -(-p * len(sorted_ms) // 100))
+    return sorted_ms[rank - 1]
+
+
+def _drain(response):
+    if getattr(response, "streaming", False):
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _jpeg(side=640):
+    buf = io.BytesIO()
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 255, (side * 3 // 4, side, 3), dtype=np.uint8)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the attendance hot paths on synthetic data: latency percentiles, "
+        "query counts and peak Python memory per endpoint and scale"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scales", default="200x30,1000x120,3000x250",
+            help="Comma separated STUDENTSxDAYS datasets (default: 200x30,1000x120,3000x250)",
+        )
+        parser.add_argument("--repeat", type=int, default=30, help="Timed calls per endpoint and scale")
+        parser.add_argument(
+            "--encoder", choices=("stub", "real"), default="stub",
+            help="stub: encoding pool returns the stored encoding; real: run face_recognition on --image",
+        )
+        parser.add_argument("--image", help="Face photo used for MarkAttendance (required with --encoder real)")
+        parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+        parser.add_argument("--baseline", help="Earlier --json output to compare p50 latencies against")
+
+    def handle(self, *args, **options):
+        if options["encoder"] == "real" and not options["image"]:
+            raise CommandError("--encoder real needs --image")
+        try:
+            scales = [tuple(int(n) for n in s.split("x")) for s in options["scales"].split(",")]
+        except ValueError:
+            raise CommandError("--scales must look like 200x30,1000x120")
+
+        image = open(options["image"], "rb").read() if options["image"] else _jpeg()
+        results = []
+        self.stdout.write(
+            f"{'scale':>11} {'endpoint':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}"
+        )
+        # Seed inside a transaction that is always rolled back; marking images go to a scratch MEDIA_ROOT
+        with tempfile.TemporaryDirectory() as media, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], MEDIA_ROOT=media,
+        ):
+            for students, days in scales:
+                with transaction.atomic():
+                    for row in self._run_scale(students, days, image, options):
+                        results.append(row)
+                        self.stdout.write(
+                            f"{row['scale']:>11} {row['endpoint']:<16}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+                            f"{row['p99_ms']:>9.2f}{row['queries']:>9}{row['peak_kib']:>10.0f}"
+                        )
+                    transaction.set_rollback(True)
+
+        report = {
+            "revision": _git_revision(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "encoder": options["encoder"],
+            "repeat": options["repeat"],
+            "results": results,
+        }
+        if options["baseline"]:
+            self._compare(report, options["baseline"])
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+    def _run_scale(self, students, days, image, options):
+        t0 = time.perf_counter()
+        first, last = seed(students, days)
+        self.stdout.write(f"Seeded {students} students x {days} days in {time.perf_counter() - t0:.1f}s")
+        if not can_collect_stats():
+            self.stdout.write("Skipped ANALYZE (MySQL would commit the seeded rows).")
+
+        roster = Student.objects.filter(roll_no__startswith="AUDIT").order_by("id")
+        rolls = list(roster.values_list("roll_no", flat=True))
+        group_id = roster.values_list("class_group_id", flat=True).first()
+        if options["encoder"] == "real":
+            with open(os.path.join(tempfile.gettempdir(), "bench_attendance_face.jpg"), "wb") as f:
+                f.write(image)
+            stored = get_face_encoding(f.name)
+            if stored is None:
+                raise CommandError(f"No face found in {options['image']}")
+        else:
+            stored = np.full(128, 0.1).tobytes()
+        roster.update(
+            face_encoding=stored, encoding_state=EncodingState.VALID, encoding_version=current_encoding_version(),
+        )
+
+        client = Client()
+        factory = APIRequestFactory()
+        student_list = StudentListView.as_view()
+
+        def mark(i):
+            upload = SimpleUploadedFile("face.jpg", image, content_type="image/jpeg")
+            return client.post("/api/attendance/", {"roll_no": rolls[i % len(rolls)], "image": upload})
+
+        cases = [
+            ("status_list", lambda i: client.get(
+                "/api/attendanceStatus/list/", {"date": last.isoformat(), "page": 1, "page_size": 50})),
+            ("status_list_cls", lambda i: client.get(
+                "/api/attendanceStatus/list/", {"date": last.isoformat(), "class_id": group_id})),
+            ("most_absent", lambda i: client.get("/api/attendance/most-absent/", {"days": 30, "top_n": 10})),
+            ("student_detail", lambda i: client.get(
+                f"/api/student/{rolls[i % len(rolls)]}/attendance/",
+                {"date_from": (last - timedelta(days=30)).isoformat(), "date_to": last.isoformat()})),
+            ("export_csv", lambda i: client.get("/api/attendance/export/", {
+                "date_from": (last - timedelta(days=6)).isoformat(), "date_to": last.isoformat(),
+                "file_format": "csv"})),
+            # Shadowed by the router at /api/students/, so called directly
+            ("student_list", lambda i: student_list(factory.get("/api/students/", {"page_size": 50})).render()),
+            # Distinct students so every call takes the full verify + insert path
+            ("mark", mark),
+            # Same students again: the "already marked" short circuit
+            ("mark_repeat", mark),
+        ]
+
+        if options["encoder"] == "real":
+            stub = nullcontext()
+        else:
+            def fake_encode(image, *args, with_details=False, **kwargs):
+                encodings = [np.frombuffer(stored)]
+                if not with_details:
+                    return encodings
+                # Whole frame as the face box, so crop archiving has something to cut
+                h, w = image.shape[:2]
+                return encodings, {"location": (0, w, h, 0), "face_count": 1, "detect_ms": 0.0, "encode_ms": 0.0}
+
+            stub = mock.patch.object(encoding_pool, "encode", fake_encode)
+        with stub:
+            for name, call in cases:
+                # Marking calls each need their own student
+                limit = len(rolls) - 1 if name.startswith("mark") else None
+                yield self._measure(f"{students}x{days}", name, call, options["repeat"], limit)
+
+    def _measure(self, scale, name, call, repeat, limit=None):
+        # One untimed call with queries captured and allocations traced, then timed calls
+        # Counted with an execute wrapper: the test client resets connection.queries
+        # at request start, which breaks CaptureQueriesContext
+        counter = RequestMetrics()
+        tracemalloc.start()
+        with connection.execute_wrapper(counter.db_wrapper):
+            response = call(0)
+            size = _drain(response)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        timings = []
+        for i in range(1, min(repeat, limit or repeat) + 1):
+            t0 = time.perf_counter()
+            _drain(call(i))
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        row = {
+            "scale": scale,
+            "endpoint": name,
+            "status": response.status_code,
+            "calls": len(timings),
+            "mean_ms": sum(timings) / len(timings),
+            "max_ms": timings[-1],
+            "queries": counter.queries,
+            "peak_kib": peak / 1024,
+            "bytes": size,
+        }
+        for p in PERCENTILES:
+            row[f"p{p}_ms"] = _percentile(timings, p)
+        return row
+
+    def _compare(self, report, path):
+        with open(path) as f:
+            baseline = json.load(f)
+        before = {(r["scale"], r["endpoint"]): r for r in baseline["results"]}
+        self.stdout.write(f"\nvs {path} (revision {baseline.get('revision')}): p50 change, query change")
+        for row in report["results"]:
+            old = before.get((row["scale"], row["endpoint"]))
+            if old is None:
+                continue
+            change = (row["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+            row["p50_change_pct"] = change
+            self.stdout.write(
+                f"{row['scale']:>11} {row['endpoint']:<16}{change:>+8.1f}%{row['queries'] - old['queries']:>+6}"
+            )
+
+# Usage: python manage.py bench_attendance [--scales 200x30,1000x120] [--repeat 30]
+#        [--encoder stub|real --image face.jpg] [--json out.json] [--baseline previous.json]
+# Synthetic rows are created in a transaction that is rolled back afterwards.
+# Without MySQL, run against SQLite: SMART_ATTENDANCE_SQLITE=1 python manage.py migrate && ...
+# "mark" uses a different student per call; the stub encoder skips face_recognition
+# but keeps image decoding, distance matching, the insert and the image archive.
@@ -0,0 +1,98 @@
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+from datetime import time as datetime_time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import Student
+from attendance.models import Attendance
+from attendance.views import ExportAttendanceExcelAPIView
+
+STUDENTS = 500
+
+
+def _seed(rows):
+    """Create STUDENTS students and enough days of attendance for `rows` rows."""
+    students = Student.objects.bulk_create(
+        Student(roll_no=f"BENCH{i:05d}", name=f"Bench Student {i}")
+        for i in range(STUDENTS)
+    )
+    days = -(-rows // STUDENTS)
+    first = date(2020, 1, 1)
+    batch = []
+    for d in range(days):
+        day = first + timedelta(days=d)
+        for s in students:
+            batch.append(Attendance(student=s, date=day, time=datetime_time(8, 50), status="on_time"))
+            if len(batch) == 5000:
+                Attendance.objects.bulk_create(batch)
+                batch = []
+    if batch:
+        Attendance.objects.bulk_create(batch)
+    return first, first + timedelta(days=days - 1), days * STUDENTS
+
+
+def _drain(response):
+    size = 0
+    if response.streaming:
+        for chunk in response.streaming_content:
+            size += len(chunk)
+    else:
+        size = len(response.content)
+    # Not response.close(): that fires request_finished, which closes the
+    # DB connection and with it the rollback-only seeding transaction.
+    return size
+
+
+class Command(BaseCommand):
+    help = "Benchmark ExportAttendanceExcelAPIView: time and peak Python memory vs row count"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", default="10000,50000,200000",
+            help="Comma separated row counts to benchmark (default: 10000,50000,200000)",
+        )
+        parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = ExportAttendanceExcelAPIView.as_view()
+        results = []
+        self.stdout.write(f"{'rows':>9}{'format':>8}{'seconds':>10}{'peak MiB':>10}{'bytes':>12}")
+
+        for rows in (int(r) for r in options["rows"].split(",")):
+            # Seed inside a transaction that is always rolled back
+            with transaction.atomic():
+                start, end, actual = _seed(rows)
+                for fmt in ("csv", "xlsx"):
+                    request = factory.get(
+                        "/api/attendance/export/",
+                        {"date_from": start.isoformat(), "date_to": end.isoformat(), "file_format": fmt},
+                    )
+                    tracemalloc.start()
+                    t0 = time.perf_counter()
+                    size = _drain(view(request))
+                    elapsed = time.perf_counter() - t0
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    row = {
+                        "rows": actual, "format": fmt, "seconds": elapsed,
+                        "peak_mib": peak / 2**20, "bytes": size,
+                    }
+                    results.append(row)
+                    self.stdout.write(
+                        f"{actual:>9}{fmt:>8}{elapsed:>10.2f}{row['peak_mib']:>10.1f}{size:>12}"
+                    )
+                transaction.set_rollback(True)
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+# Usage: python manage.py bench_export [--rows 10000,100000] [--json out.json]
+# Synthetic rows are created in a transaction that is rolled back afterwards.
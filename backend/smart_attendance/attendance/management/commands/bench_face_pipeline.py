@@ -0,0 +1,120 @@
+import json
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.utils.face_utils import encode_faces, preprocess_config
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+# Each variant overrides the settings-driven preprocessing config.
+VARIANTS = [
+    ("full-res, upsample 1", {"FACE_MAX_IMAGE_SIDE": None, "FACE_UPSAMPLE": 1, "FACE_CENTER_ROI": None}),
+    ("1280px, upsample 1", {"FACE_MAX_IMAGE_SIDE": 1280, "FACE_UPSAMPLE": 1, "FACE_CENTER_ROI": None}),
+    ("800px, upsample 1", {"FACE_MAX_IMAGE_SIDE": 800, "FACE_UPSAMPLE": 1, "FACE_CENTER_ROI": None}),
+    ("640px, upsample 1", {"FACE_MAX_IMAGE_SIDE": 640, "FACE_UPSAMPLE": 1, "FACE_CENTER_ROI": None}),
+    ("640px, upsample 0", {"FACE_MAX_IMAGE_SIDE": 640, "FACE_UPSAMPLE": 0, "FACE_CENTER_ROI": None}),
+    ("480px, upsample 1", {"FACE_MAX_IMAGE_SIDE": 480, "FACE_UPSAMPLE": 1, "FACE_CENTER_ROI": None}),
+    ("640px, upsample 1, roi 0.6", {"FACE_MAX_IMAGE_SIDE": 640, "FACE_UPSAMPLE": 1, "FACE_CENTER_ROI": 0.6}),
+]
+
+
+def _load_fixtures(root):
+    """Return {label: [image paths]} for a <root>/<label>/<image> layout."""
+    fixtures = {}
+    for label in sorted(os.listdir(root)):
+        folder = os.path.join(root, label)
+        if not os.path.isdir(folder):
+            continue
+        images = sorted(
+            os.path.join(folder, fn)
+            for fn in os.listdir(folder)
+            if fn.lower().endswith(IMAGE_EXTS)
+        )
+        if len(images) >= 2:
+            fixtures[label] = images
+    return fixtures
+
+
+class Command(BaseCommand):
+    help = "Benchmark face preprocessing settings: latency vs match accuracy on a fixture image set"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "fixtures",
+            help="Directory with one sub-folder per person; the first image (sorted) "
+                 "is enrolled, the remaining images are used as probes.",
+        )
+        parser.add_argument("--tolerance", type=float, default=0.6)
+        parser.add_argument("--cnn", action="store_true", help="Also benchmark the CNN detector")
+        parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        fixtures = _load_fixtures(options["fixtures"])
+        if not fixtures:
+            raise CommandError("No fixtures found (need <dir>/<label>/ with at least 2 images)")
+
+        # Enrol every label once with the full-resolution baseline so all variants
+        # are compared against the same gallery, like registration does.
+        baseline = preprocess_config(FACE_MAX_IMAGE_SIDE=None, FACE_UPSAMPLE=1, FACE_CENTER_ROI=None)
+        labels, gallery = [], []
+        for label, images in fixtures.items():
+            encs = encode_faces(images[0], use_roi=False, config=baseline)
+            if not encs:
+                self.stderr.write(f"Skipping {label}: no face in enrolment image {images[0]}")
+                continue
+            labels.append(label)
+            gallery.append(np.asarray(encs[0], dtype=np.float64))
+        if not gallery:
+            raise CommandError("No enrolment image contained a face")
+        gallery = np.vstack(gallery)
+        probes = [(label, path) for label in labels for path in fixtures[label][1:]]
+
+        variants = list(VARIANTS)
+        if options["cnn"]:
+            variants += [
+                (f"{name}, cnn", dict(overrides, FACE_DETECTOR_MODEL="cnn"))
+                for name, overrides in VARIANTS
+            ]
+
+        self.stdout.write(f"{len(labels)} people, {len(probes)} probe images\n")
+        self.stdout.write(f"{'variant':<34}{'p50 ms':>9}{'p95 ms':>9}{'detected':>10}{'accuracy':>10}")
+        results = []
+        for name, overrides in variants:
+            cfg = preprocess_config(**overrides)
+            timings, detected, correct = [], 0, 0
+            for label, path in probes:
+                start = time.perf_counter()
+                encs = encode_faces(path, config=cfg)
+                timings.append((time.perf_counter() - start) * 1000)
+                if not encs:
+                    continue
+                detected += 1
+                distances = np.linalg.norm(gallery - encs[0], axis=1)
+                best = int(np.argmin(distances))
+                if distances[best] <= options["tolerance"] and labels[best] == label:
+                    correct += 1
+
+            row = {
+                "variant": name,
+                "config": overrides,
+                "p50_ms": float(np.percentile(timings, 50)),
+                "p95_ms": float(np.percentile(timings, 95)),
+                "detected_rate": detected / len(probes),
+                "accuracy": correct / len(probes),
+            }
+            results.append(row)
+            self.stdout.write(
+                f"{name:<34}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                f"{row['detected_rate']:>10.1%}{row['accuracy']:>10.1%}"
+            )
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump({"people": len(labels), "probes": len(probes), "results": results}, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+# Usage: python manage.py bench_face_pipeline path/to/fixtures [--cnn] [--json out.json]
+# Fixture layout: fixtures/<roll_no>/01.jpg (enrolment), fixtures/<roll_no>/02.jpg ... (probes)
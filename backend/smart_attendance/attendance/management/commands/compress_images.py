@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Student
+from attendance.models import AttendanceImage
+from attendance.utils.image_pipeline import (
+    bytes_saved_by_day,
+    pipeline_config,
+    process_attendance_image,
+    process_student_image,
+    student_image_processed,
+)
+
+
+class Command(BaseCommand):
+    help = "Compress stored photos and create thumbnails for anything the background pipeline missed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", action="store_true", help="Only registration photos")
+        parser.add_argument("--attendance", action="store_true", help="Only archived attendance photos")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--max-side", type=int, help="Override IMAGE_MAX_SIDE")
+        parser.add_argument("--quality", type=int, help="Override IMAGE_JPEG_QUALITY")
+        parser.add_argument("--report", action="store_true", help="Only print bytes saved per day")
+
+    def handle(self, *args, **options):
+        if not options["report"]:
+            overrides = {}
+            if options["max_side"]:
+                overrides["IMAGE_MAX_SIDE"] = options["max_side"]
+            if options["quality"]:
+                overrides["IMAGE_JPEG_QUALITY"] = options["quality"]
+            config = pipeline_config(**overrides)
+            both = not (options["students"] or options["attendance"])
+            if options["attendance"] or both:
+                self._attendance(config, options["batch_size"])
+            if options["students"] or both:
+                self._students(config, options["batch_size"])
+        self._report()
+
+    def _attendance(self, config, batch_size):
+        done = saved = 0
+        last_id = 0
+        while True:
+            ids = list(
+                AttendanceImage.objects.filter(processed_at__isnull=True, id__gt=last_id)
+                .order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            for pk in ids:
+                try:
+                    saved += process_attendance_image(pk, config)
+                    done += 1
+                except (OSError, ValueError) as exc:
+                    self.stderr.write(f"AttendanceImage {pk}: {exc}")
+        self.stdout.write(f"Attendance photos: processed {done}, saved {saved / 2**20:.1f} MiB.")
+
+    def _students(self, config, batch_size):
+        done = saved = 0
+        students = Student.objects.exclude(image="").exclude(image__isnull=True).only("id", "image", "image_thumbnail")
+        for student in students.order_by("id").iterator(chunk_size=batch_size):
+            if student_image_processed(student):
+                continue
+            try:
+                saved += process_student_image(student.pk, config)
+                done += 1
+            except (OSError, ValueError) as exc:
+                self.stderr.write(f"Student {student.pk}: {exc}")
+        self.stdout.write(f"Student photos: processed {done}, saved {saved / 2**20:.1f} MiB.")
+
+    def _report(self):
+        rows = bytes_saved_by_day()
+        if not rows:
+            self.stdout.write("No processed attendance photos yet.")
+            return
+        self.stdout.write(f"{'date':<12}{'images':>8}{'original MiB':>14}{'stored MiB':>12}{'saved':>8}")
+        for day, images, original, stored in rows:
+            saved = 1 - stored / original if original else 0
+            self.stdout.write(
+                f"{day.isoformat():<12}{images:>8}{original / 2**20:>14.2f}{stored / 2**20:>12.2f}{saved:>8.0%}"
+            )
+
+# Usage: python manage.py compress_images [--students | --attendance] [--report]
+# New photos are processed in the background after each save; run this once
+# after deploying and whenever IMAGE_MAX_SIDE / IMAGE_JPEG_QUALITY change.
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from attendance.utils.image_store import prune_archive, remove_legacy_temp, retention_days
+
+
+class Command(BaseCommand):
+    help = "Delete archived attendance photos older than ATTENDANCE_IMAGE_RETENTION_DAYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Keep this many days instead of the setting")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+        parser.add_argument(
+            "--legacy-temp", action="store_true",
+            help="Also delete the old MEDIA_ROOT/temp/<weekday>/ image tree",
+        )
+
+    def handle(self, *args, **options):
+        days = retention_days() if options["days"] is None else options["days"]
+        images, size = prune_archive(days, batch_size=options["batch_size"], dry_run=options["dry_run"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{verb} {images} images ({size / 2**20:.1f} MiB) older than {days} days.")
+        if options["legacy_temp"] and not options["dry_run"]:
+            self.stdout.write(f"Removed {remove_legacy_temp()} files from the legacy temp tree.")
+
+# Usage: python manage.py prune_attendance_images [--days 7] [--dry-run] [--legacy-temp]
+# Schedule it (e.g. daily cron). Files are removed by the AttendanceImage
+# post_delete signal once each batch's delete commits.
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from attendance.utils.admin_tokens import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired admin tokens"
+
+    def handle(self, *args, **kwargs):
+        deleted = purge_expired()
+        self.stdout.write(f"Done. Deleted {deleted} expired admin tokens.")
+
+# Usage: python manage.py purge_admin_tokens
+# Schedule it (e.g. daily cron); expired rows are also purged on each admin login.
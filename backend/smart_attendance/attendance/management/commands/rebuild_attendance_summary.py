@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.utils.summary import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-student monthly AttendanceSummary table from Attendance rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Only rebuild months from this date (YYYY-MM-DD) onwards",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = datetime.strptime(options["since"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--since must be YYYY-MM-DD")
+        created = rebuild_summary(since)
+        self.stdout.write(f"Done. Rebuilt {created} summary rows.")
+
+# Usage: python manage.py rebuild_attendance_summary [--since 2026-01-01]
+# Normally not needed: Attendance writes keep the summary up to date through signals.
+# Run it after bulk imports or raw SQL edits that bypass the ORM.
@@ -0,0 +1,173 @@
+import json
+import os
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import EncodingState, Student
+from attendance.models import Attendance, AttendanceImage
+from attendance.utils.encoding_pool import encoding_pool
+from attendance.utils.face_index import _decode_encoding
+from attendance.utils.face_utils import parse_face_box
+
+DEFAULT_TOLERANCES = "0.40,0.45,0.50,0.55,0.60"
+
+
+def _percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+def sweep(genuine, impostor, tolerances):
+    """Per tolerance: share of genuine distances that would be rejected (a
+    retry at the kiosk) and of impostor distances that would be accepted
+    (a false accept). impostor may be empty."""
+    genuine, impostor = np.asarray(genuine), np.asarray(impostor)
+    rows = []
+    for t in tolerances:
+        rows.append({
+            "tolerance": t,
+            "reject_pct": float(np.mean(genuine > t) * 100) if genuine.size else None,
+            "false_accept_pct": float(np.mean(impostor <= t) * 100) if impostor.size else None,
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Replay stored match distances (or re-encode archived photos) against candidate tolerances"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=date.fromisoformat, help="Only attendance from this date (YYYY-MM-DD)")
+        parser.add_argument("--tolerances", default=DEFAULT_TOLERANCES, help="Comma separated, e.g. 0.5,0.55,0.6")
+        parser.add_argument("--by", choices=("class", "department", "all"), default="class")
+        parser.add_argument(
+            "--reencode", action="store_true",
+            help="Re-encode archived photos with a face box and compare them with every current encoding",
+        )
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        try:
+            tolerances = sorted(float(t) for t in options["tolerances"].split(","))
+        except ValueError:
+            raise CommandError("--tolerances must be comma separated numbers")
+
+        group_field = {
+            "class": "student__class_group__name",
+            "department": "student__department__name",
+            "all": None,
+        }[options["by"]]
+        if options["reencode"]:
+            samples = self._reencoded(options["since"], group_field)
+        else:
+            samples = self._stored(options["since"], group_field)
+        if not samples:
+            self.stdout.write("No attendance with a match distance to replay.")
+            return
+
+        results = []
+        for group, (genuine, impostor) in sorted(samples.items(), key=lambda item: str(item[0])):
+            genuine = sorted(genuine)
+            results.append({
+                "group": group or "-",
+                "samples": len(genuine),
+                "p50": _percentile(genuine, 50),
+                "p90": _percentile(genuine, 90),
+                "max": genuine[-1],
+                "closest_impostor": min(impostor) if impostor else None,
+                "sweep": sweep(genuine, impostor, tolerances),
+            })
+        self._print(results, tolerances, options["reencode"])
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump({"reencode": options["reencode"], "tolerances": tolerances, "groups": results}, f, indent=2)
+
+    def _stored(self, since, group_field):
+        # Distances saved at marking time: genuine matches only, since rejected
+        # attempts create no row (their distances are in the attendance logs)
+        qs = Attendance.objects.filter(match_distance__isnull=False)
+        if since:
+            qs = qs.filter(date__gte=since)
+        samples = {}
+        fields = ["match_distance"] + ([group_field] if group_field else [])
+        for row in qs.values_list(*fields).iterator(chunk_size=2000):
+            samples.setdefault(row[1] if group_field else None, ([], []))[0].append(row[0])
+        return samples
+
+    def _reencoded(self, since, group_field):
+        # Every archived photo with a known face box is encoded again (no
+        # detection; crops are small) and measured against all current
+        # encodings: its own student's is the genuine distance, the closest
+        # other student's the impostor distance
+        ids, rows = [], []
+        for student_id, raw in Student.objects.filter(encoding_state=EncodingState.VALID).values_list(
+            "id", "face_encoding"
+        ).iterator(chunk_size=2000):
+            enc = _decode_encoding(raw)
+            if enc is not None:
+                ids.append(student_id)
+                rows.append(enc)
+        if not rows:
+            return {}
+        matrix = np.vstack(rows)
+        positions = {student_id: i for i, student_id in enumerate(ids)}
+
+        qs = AttendanceImage.objects.exclude(face_box="")
+        if since:
+            qs = qs.filter(attendance__date__gte=since)
+        fields = ["path", "face_box", "attendance__student_id"] + (
+            ["attendance__" + group_field] if group_field else []
+        )
+        samples = {}
+        for row in qs.values_list(*fields).iterator(chunk_size=500):
+            path, face_box, student_id = row[:3]
+            own = positions.get(student_id)
+            if own is None:
+                continue
+            try:
+                encodings = encoding_pool.encode(
+                    os.path.join(settings.MEDIA_ROOT, path), face_box=parse_face_box(face_box), use_roi=False,
+                )
+            except (OSError, ValueError) as exc:
+                self.stderr.write(f"{path}: {exc}")
+                continue
+            if not encodings:
+                continue
+            distances = np.linalg.norm(matrix - encodings[0], axis=1)
+            genuine, impostor = samples.setdefault(row[3] if group_field else None, ([], []))
+            genuine.append(float(distances[own]))
+            if len(ids) > 1:
+                impostor.append(float(np.min(np.delete(distances, own))))
+        return samples
+
+    def _print(self, results, tolerances, reencode):
+        header = f"{'group':<16}{'n':>6}{'p50':>7}{'p90':>7}{'max':>7}"
+        if reencode:
+            header += f"{'impostor':>10}"
+        header += "".join(f"{t:>12.2f}" for t in tolerances)
+        self.stdout.write(header)
+        self.stdout.write(
+            " " * (len(header) - 12 * len(tolerances))
+            + ("  reject% / false accept% per tolerance" if reencode else "  reject% per tolerance")
+        )
+        for r in results:
+            line = f"{str(r['group'])[:15]:<16}{r['samples']:>6}{r['p50']:>7.3f}{r['p90']:>7.3f}{r['max']:>7.3f}"
+            if reencode:
+                line += f"{r['closest_impostor']:>10.3f}" if r["closest_impostor"] is not None else f"{'-':>10}"
+            for cell in r["sweep"]:
+                if reencode and cell["false_accept_pct"] is not None:
+                    line += f"{cell['reject_pct']:>6.1f}/{cell['false_accept_pct']:<5.1f}"
+                else:
+                    line += f"{cell['reject_pct']:>12.1f}"
+            self.stdout.write(line)
+
+# Usage: python manage.py replay_matches [--since 2026-01-01] [--tolerances 0.5,0.55,0.6]
+#        [--by class|department|all] [--reencode] [--json out.json]
+# Without --reencode it reads Attendance.match_distance: how many accepted marks a
+# stricter tolerance would have turned into retries. --reencode re-encodes archived
+# photos that have a face box (ATTENDANCE_ARCHIVE_MODE = "crop" keeps them cheap)
+# and also reports false accepts against the closest other student. Set the chosen
+# value on ClassGroup / Department.match_tolerance, or FACE_MATCH_TOLERANCE.
@@ -0,0 +1,98 @@
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .utils import metrics
+
+
+class RequestMetricsMiddleware:
+    """Adds Server-Timing and records per-route latency, DB and face timings.
+
+    Put it first in MIDDLEWARE so the total covers the other middleware too.
+    Streaming responses (the attendance export) are recorded when the view
+    returns; queries run while the body streams are not counted and their
+    size is unknown. Disable with REQUEST_METRICS_ENABLED = False.
+
+    Sync and async capable, so it doesn't push async views (under ASGI) back
+    onto a thread. For async requests the query counter is installed from the
+    request's sync_to_async thread, which is where the async ORM runs queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", True):
+            return self.get_response(request)
+
+        current, token = metrics.begin()
+        try:
+            with ExitStack() as stack:
+                self._count_queries(stack, current)
+                response = self.get_response(request)
+        finally:
+            metrics.end(token)
+        return self._record(request, response, current)
+
+    async def __acall__(self, request):
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", True):
+            return await self.get_response(request)
+
+        current, token = metrics.begin()
+        stack = ExitStack()
+        try:
+            await sync_to_async(self._count_queries)(stack, current)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            metrics.end(token)
+        return self._record(request, response, current)
+
+    @staticmethod
+    def _count_queries(stack, current):
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(current.db_wrapper))
+
+    @staticmethod
+    def _record(request, response, current):
+        total_ms = current.total_ms()
+        response["Server-Timing"] = metrics.server_timing(current, total_ms)
+
+        match = getattr(request, "resolver_match", None)
+        # The URL pattern, not the path, so roll numbers don't explode the key space
+        route = f"{request.method} /{match.route}" if match else f"{request.method} <unresolved>"
+        size = None if response.streaming else len(response.content)
+        metrics.registry.record(route, {
+            "total_ms": total_ms,
+            "db_ms": current.db_ms,
+            "queries": current.queries,
+            "face_ms": current.face_ms(),
+            "bytes": size,
+        })
+        if not metrics.logger.isEnabledFor(logging.INFO):
+            return response
+        metrics.logger.info(
+            "%s %s %s queries=%d db=%.1fms total=%.1fms",
+            request.method, request.path, response.status_code,
+            current.queries, current.db_ms, total_ms,
+            extra={
+                "route": route,
+                "status": response.status_code,
+                "queries": current.queries,
+                "db_ms": round(current.db_ms, 2),
+                "total_ms": round(total_ms, 2),
+                "spans": {name: round(ms, 2) for name, ms in current.spans.items()},
+                "bytes": size,
+            },
+        )
+        return response
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:17
+#
+# AdminSetting, AdminToken and the already_marked default (True -> False)
+# were changed in attendance/models.py without a migration being committed;
+# apply_migrations.sh ran makemigrations on each server, which generated this
+# same file under this same name. Committed here so fresh installs match.
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_alter_attendance_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminSetting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pin_hash', models.CharField(blank=True, max_length=255, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AdminToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='already_marked',
+            field=models.BooleanField(default=False),
+        ),
+    ]
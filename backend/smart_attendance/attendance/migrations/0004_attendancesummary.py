@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:17
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def populate_summary(apps, schema_editor):
+    Attendance = apps.get_model('attendance', 'Attendance')
+    AttendanceSummary = apps.get_model('attendance', 'AttendanceSummary')
+    rows = (
+        Attendance.objects.annotate(period=TruncMonth('date'))
+        .values('student_id', 'period')
+        .annotate(
+            on_time_days=Count('id', filter=Q(status='on_time')),
+            late_days=Count('id', filter=Q(status='late')),
+            first_date=Min('date'),
+            last_date=Max('date'),
+        )
+        .order_by()
+    )
+    AttendanceSummary.objects.bulk_create(
+        (
+            AttendanceSummary(
+                present_days=r['on_time_days'] + r['late_days'], **r
+            )
+            for r in rows.iterator()
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_batch_department_alter_student_face_encoding_and_more'),
+        ('attendance', '0004_adminsetting_admintoken_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField()),
+                ('present_days', models.PositiveIntegerField(default=0)),
+                ('on_time_days', models.PositiveIntegerField(default=0)),
+                ('late_days', models.PositiveIntegerField(default=0)),
+                ('first_date', models.DateField(blank=True, null=True)),
+                ('last_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.student')),
+            ],
+            options={
+                'unique_together': {('student', 'period')},
+            },
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:20
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_expires_at(apps, schema_editor):
+    AdminToken = apps.get_model('attendance', 'AdminToken')
+    AdminToken.objects.filter(expires_at__isnull=True).update(
+        expires_at=F('created_at') + timedelta(hours=168)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_holiday'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='admintoken',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_expires_at, migrations.RunPython.noop),
+    ]
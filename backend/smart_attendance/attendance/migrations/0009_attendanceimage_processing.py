@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0008_attendanceimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendanceimage',
+            name='original_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendanceimage',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendanceimage',
+            name='thumbnail',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
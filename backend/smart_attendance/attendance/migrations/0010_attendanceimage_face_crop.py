@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0009_attendanceimage_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendanceimage',
+            name='distance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendanceimage',
+            name='face_box',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='attendanceimage',
+            name='kind',
+            field=models.CharField(choices=[('frame', 'Full frame'), ('crop', 'Face crop')], default='frame', max_length=5),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0010_attendanceimage_face_crop'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='match_distance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='match_tolerance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from accounts.models import Student
 from django.utils import timezone
+from datetime import timedelta
 
 # Create your models here.
 class Attendance(models.Model):
@@ -15,17 +16,98 @@ class Attendance(models.Model):
     time = models.TimeField(null=True, blank=True)  # Allow null for edits, don't auto_now_add
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='absent')
     already_marked = models.BooleanField(default=False)  # Track if marked
+    # Face distance and the tolerance it was accepted under (null for manual edits)
+    match_distance = models.FloatField(null=True, blank=True)
+    match_tolerance = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-date', '-time']
+        # No default ordering: callers that need an order ask for it, so plain
+        # lookups and aggregates don't pay for a sort (the admin orders its list)
         unique_together = (('student', 'date'),)  # One attendance per student per day
+        indexes = [
+            # Day and date-range reads across students (status list joins, export,
+            # edge-month counts); covers student_id and status so no row lookups
+            models.Index(fields=['date', 'student', 'status'], name='attendance_date_idx'),
+            # Status filters (admin, dashboards), newest first
+            models.Index(fields=['status', 'date'], name='attendance_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.name} - {self.date} ({self.status})"
 
 
+class AttendanceImage(models.Model):
+    """Index row for the photo archived when an Attendance was marked.
+
+    Files live at MEDIA_ROOT/attendance/<yyyy>/<mm>/<dd>/<roll_no>/<sha256>.jpg
+    (see attendance.utils.image_store), so finding a record's image is one
+    indexed lookup and retention is a range delete on created_at
+    (``manage.py prune_attendance_images``) instead of directory scans.
+
+    With ATTENDANCE_ARCHIVE_MODE = "crop" only the face (plus a margin) is
+    stored; face_box then locates the face in that crop so audits can
+    re-encode it without running detection again.
+    """
+    KIND_CHOICES = [
+        ('frame', 'Full frame'),
+        ('crop', 'Face crop'),
+    ]
+
+    attendance = models.OneToOneField(Attendance, on_delete=models.CASCADE, related_name='image')
+    path = models.CharField(max_length=255)  # relative to MEDIA_ROOT
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveIntegerField()
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES, default='frame')
+    # "top,right,bottom,left" as 0-1 fractions of the stored image (the format
+    # parse_face_box reads); blank when the face position is unknown
+    face_box = models.CharField(max_length=64, blank=True)
+    distance = models.FloatField(null=True, blank=True)  # match distance at marking time
+    # Set by utils.image_pipeline once the frame is re-encoded and thumbnailed
+    original_size = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail = models.CharField(max_length=255, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.path
+
+
+class AttendanceSummary(models.Model):
+    """Per-student, per-month attendance counts (period = first day of the month).
+
+    Kept in step with Attendance by the signals in attendance.signals and
+    rebuilt from scratch with `manage.py rebuild_attendance_summary`.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    period = models.DateField()
+    present_days = models.PositiveIntegerField(default=0)  # on_time + late
+    on_time_days = models.PositiveIntegerField(default=0)
+    late_days = models.PositiveIntegerField(default=0)
+    first_date = models.DateField(null=True, blank=True)  # first/last Attendance row of any status
+    last_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('student', 'period'),)
+
+    def __str__(self):
+        return f"{self.student_id} - {self.period:%Y-%m} ({self.present_days} present)"
+
+
+class Holiday(models.Model):
+    """A non-school day (on top of the weekly off days in SCHOOL_WEEKLY_OFF_DAYS)."""
+    date = models.DateField(unique=True)
+    name = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date} {self.name}".strip()
+
+
 class AdminSetting(models.Model):
     """Singleton-ish model to store admin PIN hash."""
     pin_hash = models.CharField(max_length=255, blank=True, null=True)
@@ -37,10 +119,22 @@ class AdminSetting(models.Model):
 
 class AdminToken(models.Model):
     """Simple token issued on successful PIN auth. Used to validate admin sessions."""
+    LIFETIME_HOURS = 168
+
     key = models.CharField(max_length=64, unique=True)
     created_at = models.DateTimeField(default=timezone.now)
+    # Stored so validation and purging are indexed range checks on one column
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        if self.expires_at is None:
+            self.expires_at = self.created_at + timedelta(hours=self.LIFETIME_HOURS)
+        super().save(*args, **kwargs)
 
-    def is_expired(self, lifetime_hours=168):
+    def is_expired(self, lifetime_hours=None):
+        if lifetime_hours is None and self.expires_at:
+            return timezone.now() >= self.expires_at
+        lifetime_hours = lifetime_hours or self.LIFETIME_HOURS
         return (timezone.now() - self.created_at).total_seconds() > lifetime_hours * 3600
 
     def __str__(self):
@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from accounts.models import Student
+
+from .models import Attendance, AttendanceImage
+from .utils.face_index import face_index
+from .utils.image_store import remove_archived_file
+from .utils.summary import month_start, refresh_student_period
+
+
+@receiver(post_save, sender=Student)
+def refresh_face_index_on_save(sender, instance, **kwargs):
+    """Keep the in-memory encoding index in step with registrations and edits.
+
+    Fires for the Student.save() path too, including the second
+    ``update_fields=ENCODING_FIELDS`` save after auto-encoding.
+    """
+    if instance.has_valid_encoding:
+        face_index.upsert(instance.pk, instance.roll_no, instance.face_encoding)
+    else:
+        face_index.remove(instance.pk)
+
+
+@receiver(post_delete, sender=Student)
+def refresh_face_index_on_delete(sender, instance, **kwargs):
+    face_index.remove(instance.pk)
+
+
+@receiver(pre_save, sender=Attendance)
+def remember_attendance_date(sender, instance, **kwargs):
+    # An edit may move a row to another month; remember where it came from
+    instance._previous_date = None
+    if instance.pk:
+        instance._previous_date = (
+            Attendance.objects.filter(pk=instance.pk).values_list("date", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Attendance)
+def refresh_summary_on_save(sender, instance, **kwargs):
+    refresh_student_period(instance.student_id, instance.date)
+    previous = getattr(instance, "_previous_date", None)
+    if previous and month_start(previous) != month_start(instance.date):
+        refresh_student_period(instance.student_id, previous)
+
+
+@receiver(post_delete, sender=Attendance)
+def refresh_summary_on_delete(sender, instance, **kwargs):
+    refresh_student_period(instance.student_id, instance.date)
+
+
+@receiver(post_delete, sender=AttendanceImage)
+def remove_image_file(sender, instance, **kwargs):
+    # Also fires for rows removed by the Attendance cascade and by prune_archive();
+    # the file goes only once the delete has committed
+    paths = [p for p in (instance.path, instance.thumbnail) if p]
+
+    def remove():
+        for path in paths:
+            remove_archived_file(path)
+
+    transaction.on_commit(remove)
@@ -1,3 +1,1074 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, time, timedelta
+from time import sleep
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import openpyxl
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import ClassGroup, Department, EncodingState, Student
+from .models import AdminSetting, AdminToken, Attendance, AttendanceImage, AttendanceSummary, Holiday
+from .utils.admin_tokens import purge_expired, token_cache
+from .utils.background import background
+from .utils.encoding_pool import EncoderBusy, EncoderTimeout, EncodingPool
+from .utils.face_index import FaceEncodingIndex
+from .utils.face_utils import (
+    MatchResult, encode_faces, get_face_encoding, load_image, match_face, parse_face_box, read_upload, storage_config,
+    tolerance_for,
+)
+from .utils.image_pipeline import bytes_saved_by_day, compress, process_attendance_image, process_student_image
+from .utils.image_store import archive_attendance_image, image_path_for
+from .utils import mark_lock
+from .utils.mark_lock import marking_lock
+from .utils.metrics import Histogram, registry as metrics_registry
+from .utils.query_audit import audit, collect_stats, explain, full_scans, hot_endpoints, seed
+from .utils.summary import range_counts, rebuild_summary, school_days
+
+
+def make_students(count, start=0, class_group=None):
+    return Student.objects.bulk_create(
+        Student(
+            roll_no=f"R{i:05d}",
+            name=f"Student {i}",
+            class_group=class_group,
+        )
+        for i in range(start, start + count)
+    )
+
+
+def face_result(distance=0.3, tolerance=0.6, **kwargs):
+    # What match_face / identify_match return for one detected face
+    return MatchResult(face_count=1, location=(0, 4, 4, 0), distance=distance, tolerance=tolerance, **kwargs)
+
+
+class AttendanceStatusListTests(TestCase):
+    url = "/api/attendanceStatus/list/"
+    day = date(2026, 1, 5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.group = ClassGroup.objects.create(name="BCA-1")
+
+    def _get(self, **params):
+        params.setdefault("date", self.day.isoformat())
+        return self.client.get(self.url, params)
+
+    def test_query_count_is_constant(self):
+        make_students(3, class_group=self.group)
+        with self.assertNumQueries(1):
+            self._get()
+
+        students = make_students(40, start=3, class_group=self.group)
+        Attendance.objects.bulk_create(
+            Attendance(student=s, date=self.day, time=time(8, 45), status="on_time")
+            for s in students[::2]
+        )
+        with self.assertNumQueries(1):
+            resp = self._get()
+        self.assertEqual(len(resp.data["results"]), 43)
+
+    def test_joins_only_the_requested_day(self):
+        s1, s2 = make_students(2)
+        Attendance.objects.create(student=s1, date=self.day, time=time(9, 10), status="late")
+        Attendance.objects.create(student=s2, date=date(2026, 1, 4), time=time(8, 0), status="on_time")
+
+        rows = {r["roll_no"]: r for r in self._get().data["results"]}
+        self.assertTrue(rows[s1.roll_no]["alreadyMarked"])
+        self.assertEqual(rows[s1.roll_no]["status"], "late")
+        self.assertEqual(rows[s1.roll_no]["time"], "09:10:00")
+        self.assertFalse(rows[s2.roll_no]["alreadyMarked"])
+        self.assertEqual(rows[s2.roll_no]["status"], "absent")
+        self.assertEqual(rows[s2.roll_no]["id"], s2.id)
+
+    def test_filters_and_pagination(self):
+        make_students(5, class_group=self.group)
+        make_students(5, start=5)
+
+        resp = self._get(class_id=self.group.id)
+        self.assertEqual(len(resp.data["results"]), 5)
+
+        with self.assertNumQueries(2):  # COUNT + page
+            resp = self._get(page=2, page_size=4)
+        self.assertEqual(resp.data["count"], 10)
+        self.assertEqual(len(resp.data["results"]), 4)
+        self.assertEqual(resp.data["results"][0]["roll_no"], "R00004")
+
+    def test_invalid_date(self):
+        self.assertEqual(self.client.get(self.url, {"date": "05-01-2026"}).status_code, 400)
+
+
+class ExportAttendanceTests(TestCase):
+    url = "/api/attendance/export/"
+
+    def setUp(self):
+        self.client = APIClient()
+        group = ClassGroup.objects.create(name="BCA-1")
+        s1, s2 = make_students(2, class_group=group)
+        s3, = make_students(1, start=2)
+        Attendance.objects.create(student=s1, date=date(2026, 1, 5), time=time(8, 50), status="on_time")
+        Attendance.objects.create(student=s2, date=date(2026, 1, 6), time=None, status="absent")
+        Attendance.objects.create(student=s3, date=date(2026, 1, 6), time=time(9, 20), status="late")
+        Attendance.objects.create(student=s1, date=date(2026, 2, 1), time=time(8, 50), status="on_time")
+        self.group = group
+
+    def test_csv_streams_rows_in_range(self):
+        resp = self.client.get(self.url, {
+            "date_from": "2026-01-01", "date_to": "2026-01-31", "file_format": "csv",
+        })
+        self.assertTrue(resp.streaming)
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "Date,Roll No,Name,Class,Present")
+        self.assertEqual(lines[1:], [
+            "2026-01-05,R00000,Student 0,BCA-1,True",
+            "2026-01-06,R00001,Student 1,BCA-1,False",
+            "2026-01-06,R00002,Student 2,,True",
+        ])
+
+    def test_class_filter_and_xlsx(self):
+        resp = self.client.get(self.url, {
+            "date_from": "2026-01-01", "date_to": "2026-01-31", "class_id": self.group.id,
+        })
+        self.assertEqual(resp.status_code, 200)
+        wb = openpyxl.load_workbook(io.BytesIO(b"".join(resp.streaming_content)))
+        rows = list(wb.active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][1], "R00000")
+
+    def test_invalid_date(self):
+        self.assertEqual(self.client.get(self.url, {"date_from": "nope"}).status_code, 400)
+
+
+class AttendanceSummaryTests(TestCase):
+    def setUp(self):
+        self.student, = make_students(1)
+
+    def _mark(self, day, status="on_time"):
+        return Attendance.objects.create(
+            student=self.student, date=day, time=time(8, 50), status=status
+        )
+
+    def test_writes_keep_summary_in_step(self):
+        a = self._mark(date(2026, 1, 5))
+        self._mark(date(2026, 1, 20), "late")
+        summary = AttendanceSummary.objects.get(student=self.student, period=date(2026, 1, 1))
+        self.assertEqual((summary.present_days, summary.on_time_days, summary.late_days), (2, 1, 1))
+        self.assertEqual((summary.first_date, summary.last_date), (date(2026, 1, 5), date(2026, 1, 20)))
+
+        resp = APIClient().patch(f"/api/attendance/{a.id}/", {"time": None}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        summary.refresh_from_db()
+        self.assertEqual((summary.present_days, summary.on_time_days), (1, 0))
+
+        Attendance.objects.filter(student=self.student).delete()
+        self.assertFalse(AttendanceSummary.objects.exists())
+
+    def test_range_counts_matches_raw_rows(self):
+        for day in (date(2025, 12, 30), date(2026, 1, 2), date(2026, 1, 31),
+                    date(2026, 2, 10), date(2026, 3, 1), date(2026, 3, 15)):
+            self._mark(day)
+        self.assertEqual(
+            range_counts(date(2025, 12, 31), date(2026, 3, 10))[self.student.id]["present"], 4
+        )
+        self.assertEqual(range_counts(date(2026, 1, 2), date(2026, 1, 30))[self.student.id]["present"], 1)
+        self.assertEqual(range_counts()[self.student.id]["present"], 6)
+
+        AttendanceSummary.objects.all().delete()
+        self.assertEqual(rebuild_summary(), 4)
+        self.assertEqual(range_counts(end=date(2026, 2, 28))[self.student.id]["present"], 4)
+
+    def test_student_detail_uses_summary(self):
+        for d in range(1, 21):
+            self._mark(date(2026, 1, d), "late" if d % 4 == 0 else "on_time")
+        with self.assertNumQueries(3):  # student, summary (whole month, no edge rows), records
+            resp = APIClient().get(
+                f"/api/student/{self.student.roll_no}/attendance/",
+                {"date_from": "2026-01-01", "date_to": "2026-01-31"},
+            )
+        self.assertEqual(resp.data["present_days"], 20)
+        self.assertEqual(resp.data["late_days"], 5)
+        self.assertEqual(resp.data["absent_days"], 11)
+        self.assertEqual(len(resp.data["records"]), 20)
+
+    def test_student_detail_record_cursor(self):
+        for d in range(1, 11):
+            self._mark(date(2026, 1, d))
+        url = f"/api/student/{self.student.roll_no}/attendance/"
+        resp = APIClient().get(url, {"cursor": "", "page_size": 4})
+        self.assertEqual([r["date"] for r in resp.data["records"]], [f"2026-01-{d:02d}" for d in (10, 9, 8, 7)])
+        self.assertEqual(resp.data["present_days"], 10)
+        dates = []
+        while resp.data.get("next"):
+            resp = APIClient().get(resp.data["next"])
+            dates += [r["date"] for r in resp.data["records"]]
+        self.assertEqual(dates[-1], "2026-01-01")
+        self.assertEqual(len(dates), 6)
+
+
+class MostAbsentTests(TestCase):
+    url = "/api/attendance/most-absent/"
+
+    def setUp(self):
+        self.group = ClassGroup.objects.create(name="BCA-1")
+        self.students = make_students(6, class_group=self.group) + make_students(4, start=6)
+        self.today = timezone.localdate()
+        # student i was present on the last i days
+        for i, s in enumerate(self.students):
+            for d in range(i):
+                Attendance.objects.create(
+                    student=s, date=self.today - timedelta(days=d), time=time(8, 50), status="on_time"
+                )
+
+    def test_ranking_is_one_query_and_limited(self):
+        with self.assertNumQueries(2):  # holidays + ranking
+            resp = APIClient().get(self.url, {"days": 60, "top_n": 3})
+        data = resp.data["data"]
+        self.assertEqual([r["roll_no"] for r in data], ["R00000", "R00001", "R00002"])
+        self.assertEqual([r["presents"] for r in data], [0, 1, 2])
+        self.assertEqual(data[0]["absences"], resp.data["school_days"])
+
+    def test_filters_and_pagination(self):
+        resp = APIClient().get(self.url, {"days": 30, "class_id": self.group.id, "page": 2, "page_size": 4})
+        self.assertEqual(resp.data["count"], 6)
+        self.assertEqual([r["roll_no"] for r in resp.data["data"]], ["R00004", "R00005"])
+
+    @override_settings(SCHOOL_WEEKLY_OFF_DAYS=[5, 6])
+    def test_school_days_skip_weekends_and_holidays(self):
+        monday = date(2026, 1, 5)
+        self.assertEqual(school_days(monday, monday + timedelta(days=13)), 10)
+        Holiday.objects.create(date=monday + timedelta(days=2), name="Holiday")
+        Holiday.objects.create(date=monday + timedelta(days=5), name="Saturday anyway")
+        self.assertEqual(school_days(monday, monday + timedelta(days=13)), 9)
+
+
+class AdminTokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+        AdminSetting.objects.create(pin_hash=make_password("11111"))
+        self.token = self.client.post("/api/admin/auth/", {"pin": "11111"}).data["token"]
+
+    def _validate(self, token=None):
+        return self.client.get(
+            "/api/admin/auth/validate/", HTTP_X_ADMIN_TOKEN=token or self.token
+        )
+
+    def test_validation_is_served_from_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self._validate().status_code, 200)
+        token_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self._validate().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._validate().status_code, 200)
+
+    def test_expired_and_unknown_tokens(self):
+        AdminToken.objects.filter(key=self.token).update(expires_at=timezone.now() - timedelta(seconds=1))
+        token_cache.clear()
+        self.assertEqual(self._validate().status_code, 401)
+        self.assertEqual(self._validate("nope").status_code, 401)
+        self.assertEqual(purge_expired(), 1)
+
+    def test_pin_change_revokes_cached_tokens(self):
+        self.assertEqual(self._validate().status_code, 200)
+        resp = self.client.post("/api/admin/pin/", {"current_pin": "11111", "pin": "22222"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(AdminToken.objects.exists())
+        self.assertEqual(self._validate().status_code, 401)
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class QueryPlanAuditTests(TestCase):
+    """Small-scale run of `manage.py audit_attendance_plans`."""
+
+    def test_hot_queries_use_indexes(self):
+        first, last = seed(students=60, days=70)
+        results = audit(hot_endpoints(first, last))
+        self.assertTrue(results)
+        self.assertEqual({r["status"] for r in results}, {200})
+        scans = [(r["endpoint"], r["full_scans"]) for r in results if r["full_scans"]]
+        self.assertEqual(scans, [])
+
+    def test_stats_are_skipped_on_mysql(self):
+        with mock.patch.object(connection, "vendor", "mysql"), mock.patch.object(connection, "cursor") as cursor:
+            self.assertFalse(collect_stats())
+        cursor.assert_not_called()
+
+    def test_full_scan_is_detected(self):
+        seed(students=5, days=3)
+        plan = explain("SELECT COUNT(*) FROM attendance_attendance WHERE time IS NULL")
+        self.assertTrue(full_scans(plan))
+
+
+class MarkAttendanceDedupeTests(TestCase):
+    url = "/api/attendance/"
+
+    def setUp(self):
+        self.student = Student.objects.bulk_create([Student(
+            roll_no="M1", name="Mark Me", face_encoding=np.full(128, 0.1).tobytes(),
+            encoding_state=EncodingState.VALID, encoding_version=1,
+        )])[0]
+
+    def post(self):
+        image = SimpleUploadedFile("face.jpg", b"not really a jpeg", content_type="image/jpeg")
+        return APIClient().post(self.url, {"roll_no": "M1", "image": image}, format="multipart")
+
+    def patched(self):
+        return (
+            mock.patch("attendance.views.read_upload", return_value=(b"raw", np.zeros((4, 4, 3), np.uint8))),
+            mock.patch("attendance.views.match_face", return_value=face_result()),
+            mock.patch("attendance.views.archive_attendance_image"),
+        )
+
+    def test_marks_once_then_skips_image_work(self):
+        read, match, save = self.patched()
+        with read as read_mock, match as match_mock, save:
+            first = self.post()
+            second = self.post()
+        self.assertEqual(first.data["message"], "Attendance marked for Mark Me")
+        self.assertEqual(second.data["message"], "Attendance already marked today")
+        self.assertEqual((read_mock.call_count, match_mock.call_count), (1, 1))
+        self.assertEqual(Attendance.objects.filter(student=self.student).count(), 1)
+
+    def test_duplicate_in_flight_gets_409(self):
+        read, match, save = self.patched()
+        with read as read_mock, match, save, marking_lock("M1", timezone.localdate()) as held:
+            self.assertTrue(held)
+            resp = self.post()
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp["Retry-After"], "1")
+        read_mock.assert_not_called()
+        # Lock is released with the holder
+        with marking_lock("M1", timezone.localdate()) as held:
+            self.assertTrue(held)
+
+    def test_unreadable_upload_is_400(self):
+        for url, data in ((self.url, {"roll_no": "M1"}), ("/api/attendance/identify/", {})):
+            image = SimpleUploadedFile("face.jpg", b"not really a jpeg", content_type="image/jpeg")
+            with self.assertLogs("attendance.views", "INFO") as logs:
+                resp = APIClient().post(url, {"image": image, **data}, format="multipart")
+            self.assertEqual((resp.status_code, resp.data), (400, {"error": "Invalid image"}))
+            self.assertIn("Could not decode attendance image", logs.output[0])
+
+    def test_mark_made_while_waiting_for_the_lock_skips_image_work(self):
+        @contextmanager
+        def marked_by_previous_holder(roll_no, day):
+            Attendance.objects.create(student=self.student, date=day, time=time(8, 0), status="on_time")
+            yield True
+
+        read, match, save = self.patched()
+        with read as read_mock, match as match_mock, save, \
+                mock.patch("attendance.views.marking_lock", side_effect=marked_by_previous_holder):
+            resp = self.post()
+        self.assertEqual((resp.data["message"], resp.data["time"]), ("Attendance already marked today", "08:00:00"))
+        self.assertEqual((read_mock.call_count, match_mock.call_count), (0, 0))
+
+    def test_insert_race_returns_existing_row(self):
+        def concurrent_winner(*args, **kwargs):
+            Attendance.objects.create(student=self.student, date=timezone.localdate(), time=time(8, 0), status="on_time")
+            return face_result()
+
+        read, match, save = self.patched()
+        with read, match as match_mock, save as save_mock:
+            match_mock.side_effect = concurrent_winner
+            resp = self.post()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data["message"], resp.data["time"]), ("Attendance already marked today", "08:00:00"))
+        save_mock.assert_not_called()
+
+    @override_settings(ATTENDANCE_MARK_LOCK_CACHE="default")
+    def test_shared_cache_lock(self):
+        day = timezone.localdate()
+        with marking_lock("M1", day) as first:
+            with marking_lock("M1", day) as second, marking_lock("M2", day) as other:
+                self.assertEqual((first, second, other), (True, False, True))
+        with marking_lock("M1", day) as again:
+            self.assertTrue(again)
+
+    def test_expired_holder_does_not_release_the_next_lock(self):
+        for cache_alias in (None, "default"):
+            with self.subTest(cache=cache_alias), override_settings(ATTENDANCE_MARK_LOCK_CACHE=cache_alias):
+                slow = mark_lock._acquire("2026-01-05:M1", 0.05)
+                sleep(0.1)  # slow's TTL runs out mid-request
+                second = mark_lock._acquire("2026-01-05:M1", 5)
+                self.assertTrue(slow and second and slow != second)
+                mark_lock._release("2026-01-05:M1", slow)
+                self.assertIsNone(mark_lock._acquire("2026-01-05:M1", 5))
+                mark_lock._release("2026-01-05:M1", second)
+                third = mark_lock._acquire("2026-01-05:M1", 5)
+                self.assertIsNotNone(third)
+                mark_lock._release("2026-01-05:M1", third)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        metrics_registry.reset()
+        self.client = APIClient()
+        AdminSetting.objects.create(pin_hash=make_password("11111"))
+        self.token = self.client.post("/api/admin/auth/", {"pin": "11111"}).data["token"]
+        make_students(3)
+
+    def test_server_timing_counts_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/api/attendanceStatus/list/", {"date": "2026-01-05"})
+        timing = resp["Server-Timing"]
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing)
+        self.assertTrue(timing.startswith("db;dur=") and "total;dur=" in timing)
+
+    def test_histogram_endpoint(self):
+        for _ in range(3):
+            self.client.get("/api/attendanceStatus/list/", {"date": "2026-01-05"})
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 401)
+
+        data = self.client.get("/api/metrics/", HTTP_X_ADMIN_TOKEN=self.token).data
+        route = data["routes"]["GET /api/attendanceStatus/list/"]
+        self.assertEqual(route["total_ms"]["count"], 3)
+        self.assertEqual(route["queries"]["count"], 3)
+        self.assertEqual(route["face_ms"]["count"], 0)
+        self.assertEqual(route["bytes"]["count"], 3)
+
+        self.assertEqual(self.client.delete("/api/metrics/", HTTP_X_ADMIN_TOKEN=self.token).status_code, 204)
+        # Only the DELETE itself, recorded after the reset
+        self.assertEqual(list(metrics_registry.snapshot()["routes"]), ["DELETE /api/metrics/"])
+
+    def test_mark_attendance_spans(self):
+        Student.objects.filter(roll_no="R00000").update(
+            face_encoding=np.full(128, 0.1).tobytes(), encoding_state=EncodingState.VALID, encoding_version=1,
+        )
+        image = SimpleUploadedFile("face.jpg", b"jpeg", content_type="image/jpeg")
+        with mock.patch("attendance.views.read_upload", return_value=(b"raw", np.zeros((4, 4, 3), np.uint8))), \
+                mock.patch("attendance.views.match_face", return_value=face_result()), \
+                mock.patch("attendance.views.archive_attendance_image"):
+            resp = self.client.post("/api/attendance/", {"roll_no": "R00000", "image": image}, format="multipart")
+        names = [part.split(";")[0] for part in resp["Server-Timing"].split(", ")]
+        self.assertEqual(names, ["db", "lookup", "decode", "insert", "archive", "total"])
+
+    def test_histogram_percentiles(self):
+        hist = Histogram((1, 10, 100))
+        for value in (0.5, 5, 5, 50, 500):
+            hist.add(value)
+        self.assertEqual((hist.percentile(0.2), hist.percentile(0.5), hist.percentile(0.8)), (1, 10, 100))
+        self.assertEqual(hist.percentile(1.0), 500)
+        self.assertEqual(hist.as_dict()["buckets"], [[1, 1], [10, 2], [100, 1], ["+Inf", 1]])
+
+
+class BenchAttendanceTests(TestCase):
+    def test_small_run_writes_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.json")
+            call_command("bench_attendance", scales="12x4", repeat=3, json_path=path, stdout=io.StringIO())
+            with open(path) as f:
+                report = json.load(f)
+
+        rows = {r["endpoint"]: r for r in report["results"]}
+        self.assertEqual(set(rows), {
+            "status_list", "status_list_cls", "most_absent", "student_detail",
+            "export_csv", "student_list", "mark", "mark_repeat",
+        })
+        self.assertEqual({r["status"] for r in rows.values()}, {200})
+        self.assertTrue(all(r["calls"] == 3 and r["p50_ms"] <= r["p99_ms"] for r in rows.values()))
+        # The repeat tap never reaches face matching or the insert
+        self.assertLess(rows["mark_repeat"]["queries"], rows["mark"]["queries"])
+        self.assertEqual(Attendance.objects.count(), 0)
+
+
+class AsyncMarkAttendanceTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.bulk_create([Student(
+            roll_no="M1", name="Mark Me", face_encoding=np.full(128, 0.1).tobytes(),
+            encoding_state=EncodingState.VALID, encoding_version=1,
+        )])[0]
+        self.frame = (b"raw", np.zeros((4, 4, 3), np.uint8))
+
+    async def post(self, url="/api/attendance/async/", **data):
+        image = SimpleUploadedFile("face.jpg", b"jpeg", content_type="image/jpeg")
+        return await AsyncClient().post(url, {"image": image, **data})
+
+    async def test_marks_then_archives_in_background(self):
+        release = threading.Event()
+        with mock.patch("attendance.views.read_upload", return_value=self.frame), \
+                mock.patch("attendance.views.match_face", return_value=face_result()) as match_mock, \
+                mock.patch("attendance.views.archive_attendance_image", side_effect=lambda *a, **kw: release.wait(5) and mock.Mock(path="p")) as save_mock:
+            first = await self.post(roll_no="M1")
+            # The response is out while the archive job is still waiting
+            self.assertEqual(background.pending(), 1)
+            release.set()
+            self.assertTrue(background.drain(timeout=5))
+            second = await self.post(roll_no="M1")
+
+        self.assertEqual(first.json()["message"], "Attendance marked for Mark Me")
+        self.assertEqual(second.json()["message"], "Attendance already marked today")
+        self.assertEqual(match_mock.call_count, 1)
+        attendance, raw = save_mock.call_args.args
+        self.assertEqual((attendance.student_id, raw), (self.student.id, b"raw"))
+        self.assertEqual(await Attendance.objects.filter(student=self.student).acount(), 1)
+        self.assertIn("insert;dur=", first["Server-Timing"])
+        self.assertNotIn('desc="0 queries"', first["Server-Timing"])
+
+    async def test_unreadable_upload_is_400(self):
+        for url, data in (("/api/attendance/async/", {"roll_no": "M1"}), ("/api/attendance/identify/async/", {})):
+            resp = await self.post(url, **data)
+            self.assertEqual((resp.status_code, resp.json()), (400, {"error": "Invalid image"}))
+
+    async def test_mark_made_while_waiting_for_the_lock_skips_image_work(self):
+        @asynccontextmanager
+        async def marked_by_previous_holder(roll_no, day):
+            await Attendance.objects.acreate(student=self.student, date=day, time=time(8, 0), status="on_time")
+            yield True
+
+        with mock.patch("attendance.views.read_upload", return_value=self.frame) as read_mock, \
+                mock.patch("attendance.views.async_marking_lock", side_effect=marked_by_previous_holder):
+            resp = await self.post(roll_no="M1")
+        self.assertEqual(resp.json()["message"], "Attendance already marked today")
+        read_mock.assert_not_called()
+
+    async def test_identify_and_errors(self):
+        with mock.patch("attendance.views.read_upload", return_value=self.frame), \
+                mock.patch("attendance.views.face_index.ensure_loaded"), \
+                mock.patch("attendance.views.identify_match", return_value=face_result(student_id=self.student.id, roll_no="M1", tolerance=None)), \
+                mock.patch("attendance.views.archive_attendance_image"):
+            resp = await self.post("/api/attendance/identify/async/")
+            background.drain(timeout=5)
+        self.assertEqual(resp.json()["roll_no"], "M1")
+
+        with mock.patch("attendance.views.read_upload", return_value=self.frame), \
+                mock.patch("attendance.views.match_face", return_value=face_result(distance=0.9)):
+            await Attendance.objects.all().adelete()
+            self.assertEqual((await self.post(roll_no="M1")).status_code, 400)
+        self.assertEqual((await self.post(roll_no="NOPE")).status_code, 404)
+        self.assertEqual((await AsyncClient().post("/api/attendance/async/", {})).status_code, 400)
+
+
+class ImageArchiveTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        student = make_students(1)[0]
+        self.att = Attendance.objects.create(student=student, date=date(2026, 2, 3), status="on_time")
+
+    def test_archive_is_content_addressed_and_indexed(self):
+        image = archive_attendance_image(self.att, b"photo-1")
+        self.assertTrue(image.path.startswith(os.path.join("attendance", "2026", "02", "03", "R00000", "")))
+        self.assertEqual((image.size, len(image.sha256)), (7, 64))
+        first = image_path_for(self.att.id)
+        with open(first, "rb") as f:
+            self.assertEqual(f.read(), b"photo-1")
+
+        # Same bytes: same file and row; new bytes replace both
+        self.assertEqual(archive_attendance_image(self.att, b"photo-1").path, image.path)
+        archive_attendance_image(self.att, b"photo-2")
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(AttendanceImage.objects.count(), 1)
+
+    def test_prune_honours_retention(self):
+        old = archive_attendance_image(self.att, b"old")
+        AttendanceImage.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=8))
+        newer = Attendance.objects.create(student=self.att.student, date=date(2026, 2, 4), status="late")
+        archive_attendance_image(newer, b"new")
+        old_file = image_path_for(self.att.id)
+
+        out = io.StringIO()
+        call_command("prune_attendance_images", dry_run=True, stdout=out)
+        self.assertIn("Would delete 1 images", out.getvalue())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("prune_attendance_images", stdout=io.StringIO())
+
+        self.assertEqual(list(AttendanceImage.objects.values_list("attendance_id", flat=True)), [newer.id])
+        self.assertFalse(os.path.exists(old_file))
+        # Emptied day folders are removed too
+        self.assertFalse(os.path.exists(os.path.join(self.media.name, "attendance", "2026", "02", "03")))
+        self.assertTrue(os.path.exists(image_path_for(newer.id)))
+
+    def test_deleting_attendance_removes_file(self):
+        archive_attendance_image(self.att, b"photo")
+        path = image_path_for(self.att.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.att.delete()
+        self.assertFalse(os.path.exists(path))
+
+
+def make_photo(size=(2000, 1500), fmt="JPEG", orientation=None):
+    im = Image.new("RGB", size, (120, 90, 60))
+    buf = io.BytesIO()
+    kwargs = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs["exif"] = exif
+    im.save(buf, fmt, **kwargs)
+    return buf.getvalue()
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.student = make_students(1)[0]
+        self.att = Attendance.objects.create(student=self.student, date=date(2026, 2, 3), status="on_time")
+
+    def test_compress_caps_size_and_applies_exif_rotation(self):
+        # Orientation 6 = rotate 90°, so the stored image comes out portrait
+        out = Image.open(io.BytesIO(compress(make_photo(orientation=6), 1024, 80)))
+        self.assertEqual(out.size, (768, 1024))
+        self.assertFalse(out.getexif())
+
+        small = make_photo((100, 100))
+        self.assertLessEqual(len(compress(small, 1024, 95)), len(small))
+
+    def test_attendance_photo_is_compressed_with_thumbnail(self):
+        image = archive_attendance_image(self.att, make_photo())
+        original_file = image_path_for(self.att.id)
+        saved = process_attendance_image(image.pk)
+
+        image.refresh_from_db()
+        self.assertGreater(saved, 0)
+        self.assertEqual(image.original_size - image.size, saved)
+        self.assertIsNotNone(image.processed_at)
+        self.assertFalse(os.path.exists(original_file))
+        with open(image_path_for(self.att.id), "rb") as f:
+            self.assertEqual(max(Image.open(f).size), 1024)
+        with open(os.path.join(self.media.name, image.thumbnail), "rb") as f:
+            self.assertEqual(max(Image.open(f).size), 160)
+        # Already processed: nothing to do
+        self.assertEqual(process_attendance_image(image.pk), 0)
+
+        self.assertEqual(bytes_saved_by_day(), [(self.att.date, 1, image.original_size, image.size)])
+        out = io.StringIO()
+        call_command("compress_images", report=True, stdout=out)
+        self.assertIn("2026-02-03", out.getvalue())
+
+    def test_missing_or_replaced_frame_is_left_alone(self):
+        image = archive_attendance_image(self.att, make_photo())
+        os.remove(image_path_for(self.att.id))
+        with self.assertLogs("attendance.utils.image_pipeline", "WARNING"):
+            self.assertEqual(process_attendance_image(image.pk), 0)
+
+        image = archive_attendance_image(self.att, make_photo())
+        real_compress = compress
+
+        def replaced_meanwhile(*args):
+            AttendanceImage.objects.filter(pk=image.pk).update(sha256="0" * 64)
+            return real_compress(*args)
+
+        with mock.patch("attendance.utils.image_pipeline.compress", side_effect=replaced_meanwhile):
+            self.assertEqual(process_attendance_image(image.pk), 0)
+        image.refresh_from_db()
+        self.assertIsNone(image.processed_at)
+        self.assertTrue(os.path.exists(image_path_for(self.att.id)))
+        # Only the original frame is left on disk
+        stored = [f for _, _, files in os.walk(os.path.join(self.media.name, "attendance")) for f in files]
+        self.assertEqual(stored, [os.path.basename(image.path)])
+
+    def test_student_png_becomes_jpeg_with_thumbnail(self):
+        os.makedirs(os.path.join(self.media.name, "students"))
+        with open(os.path.join(self.media.name, "students", "R00000.png"), "wb") as f:
+            f.write(make_photo(fmt="PNG"))
+        Student.objects.filter(pk=self.student.pk).update(image="students/R00000.png")
+
+        out = io.StringIO()
+        call_command("compress_images", students=True, stdout=out)
+        self.assertIn("Student photos: processed 1", out.getvalue())
+        student = Student.objects.get(pk=self.student.pk)
+        self.assertEqual(student.image.name, "students/R00000.jpg")
+        self.assertEqual(student.image_thumbnail.name, os.path.join("students", "thumbs", "R00000.jpg"))
+        self.assertFalse(os.path.exists(os.path.join(self.media.name, "students", "R00000.png")))
+        self.assertEqual(process_student_image(student.pk), 0)
+
+        row = APIClient().get("/api/students/").data[0]
+        self.assertTrue(row["thumbnail_url"].endswith("/students/thumbs/R00000.jpg"))
+
+    def test_student_photo_replaced_mid_processing_is_left_alone(self):
+        os.makedirs(os.path.join(self.media.name, "students"))
+        for name in ("R00000.png", "R00000_new.jpg"):
+            with open(os.path.join(self.media.name, "students", name), "wb") as f:
+                f.write(make_photo(fmt="PNG"))
+        Student.objects.filter(pk=self.student.pk).update(image="students/R00000.png")
+        real_compress = compress
+
+        def reuploaded_meanwhile(*args):
+            Student.objects.filter(pk=self.student.pk).update(image="students/R00000_new.jpg")
+            return real_compress(*args)
+
+        with mock.patch("attendance.utils.image_pipeline.compress", side_effect=reuploaded_meanwhile):
+            self.assertEqual(process_student_image(self.student.pk), 0)
+        student = Student.objects.get(pk=self.student.pk)
+        self.assertEqual((student.image.name, student.image_thumbnail.name), ("students/R00000_new.jpg", ""))
+        # The stale compressed copy and its thumbnail are gone
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media.name, "students"))),
+                         ["R00000.png", "R00000_new.jpg", "thumbs"])
+        self.assertEqual(os.listdir(os.path.join(self.media.name, "students", "thumbs")), [])
+        # The new photo still gets processed
+        self.assertGreater(process_student_image(self.student.pk), 0)
+        self.assertEqual(Student.objects.get(pk=self.student.pk).image_thumbnail.name,
+                         os.path.join("students", "thumbs", "R00000_new.jpg"))
+
+
+@override_settings(ATTENDANCE_ARCHIVE_MODE="crop")
+class FaceCropArchiveTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.student = Student.objects.bulk_create([Student(
+            roll_no="C1", name="Crop Me", face_encoding=np.full(128, 0.1).tobytes(),
+            encoding_state=EncodingState.VALID, encoding_version=1,
+        )])[0]
+        self.frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    def test_only_the_face_is_stored(self):
+        att = Attendance.objects.create(student=self.student, date=date(2026, 2, 3), status="on_time")
+        frame_jpeg = io.BytesIO()
+        Image.fromarray(self.frame).save(frame_jpeg, "JPEG")
+        image = archive_attendance_image(att, frame_jpeg.getvalue(), self.frame, (100, 300, 200, 200), 0.31)
+
+        self.assertEqual((image.kind, image.distance), ("crop", 0.31))
+        self.assertLess(image.size, len(frame_jpeg.getvalue()) / 4)
+        with open(image_path_for(att.id), "rb") as f:
+            crop = Image.open(f)
+            self.assertEqual(crop.size, (180, 180))  # 100px face + 40% margin each side
+        top, right, bottom, left = parse_face_box(image.face_box)
+        self.assertAlmostEqual(bottom - top, 100 / 180, places=3)
+
+        # No face position (e.g. mocked matcher): the frame is kept
+        image = archive_attendance_image(att, b"raw-frame")
+        self.assertEqual((image.kind, image.face_box, image.size), ("frame", "", 9))
+
+    def test_locations_account_for_the_center_roi(self):
+        with mock.patch("attendance.utils.face_utils.face_recognition.face_locations", return_value=[(10, 60, 60, 10)]), \
+                mock.patch("attendance.utils.face_utils.face_recognition.face_encodings", return_value=[np.zeros(128)]):
+            _, details = encode_faces(self.frame, config={
+                "FACE_DETECTOR_MODEL": "hog", "FACE_UPSAMPLE": 1, "FACE_MAX_IMAGE_SIDE": None,
+                "FACE_CENTER_ROI": 0.5, "FACE_TARGET_SIZE": 150, "FACE_NUM_JITTERS": 1,
+            }, with_details=True)
+        self.assertEqual((details["location"], details["face_count"]), ((130, 220, 180, 170), 1))
+
+    def test_mark_attendance_archives_crop_with_distance(self):
+        upload = io.BytesIO()
+        Image.fromarray(self.frame).save(upload, "JPEG")
+        encoded = ([np.full(128, 0.1)], {"location": (100, 300, 200, 200), "face_count": 1, "detect_ms": 5.0, "encode_ms": 20.0})
+        with mock.patch("attendance.utils.face_utils.encoding_pool.encode", return_value=encoded):
+            resp = APIClient().post("/api/attendance/", {
+                "roll_no": "C1", "image": SimpleUploadedFile("face.jpg", upload.getvalue(), content_type="image/jpeg"),
+            }, format="multipart")
+        self.assertEqual(resp.status_code, 200)
+        image = AttendanceImage.objects.get(attendance__student=self.student)
+        self.assertEqual((image.kind, image.distance), ("crop", 0.0))
+        attendance = image.attendance
+        self.assertEqual((attendance.match_distance, attendance.match_tolerance), (0.0, 0.6))
+
+
+class MatchToleranceTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name="BCA", match_tolerance=0.5)
+        self.group = ClassGroup.objects.create(name="BCA-1", department=self.department)
+        self.base = np.zeros(128)
+        self.base[2] = 1.0
+        self.student = Student.objects.bulk_create([Student(
+            roll_no="T1", name="Tol", department=self.department, class_group=self.group,
+            face_encoding=self.base.tobytes(), encoding_state=EncodingState.VALID, encoding_version=1,
+        )])[0]
+
+    def test_class_then_department_then_setting(self):
+        self.assertEqual(tolerance_for(self.student), 0.5)
+        self.group.match_tolerance = 0.42
+        self.assertEqual(tolerance_for(self.student), 0.42)
+        with override_settings(FACE_MATCH_TOLERANCE=0.55):
+            self.assertEqual(tolerance_for(Student(roll_no="X")), 0.55)
+
+    def test_match_face_reports_distance_and_timings(self):
+        probe = self.base.copy()
+        probe[0] = 0.55  # inside the default 0.6, outside the department's 0.5
+        details = {"location": (1, 3, 3, 1), "face_count": 2, "detect_ms": 12.0, "encode_ms": 30.0}
+        with mock.patch("attendance.utils.face_utils.encoding_pool.encode", return_value=([probe], details)):
+            result = match_face(np.zeros((4, 4, 3), np.uint8), [self.student])
+            self.assertEqual((result.face_count, result.location, result.detect_ms, result.encode_ms), (2, (1, 3, 3, 1), 12.0, 30.0))
+            self.assertAlmostEqual(result.distance, 0.55)
+            self.assertEqual((result.tolerance, result.matched, result.student), (0.5, False, None))
+
+            result = match_face(np.zeros((4, 4, 3), np.uint8), [self.student], tolerance=0.6)
+            self.assertEqual((result.matched, result.student), (True, self.student))
+
+        with mock.patch("attendance.utils.face_utils.encoding_pool.encode", return_value=([], {
+            "location": None, "face_count": 0, "detect_ms": 9.0, "encode_ms": 0.0,
+        })):
+            self.assertTrue(match_face(np.zeros((4, 4, 3), np.uint8), [self.student]).no_face)
+
+    def test_replay_stored_distances(self):
+        for day, distance in enumerate((0.30, 0.41, 0.47, 0.52), start=1):
+            Attendance.objects.create(
+                student=self.student, date=date(2026, 3, day), status="on_time",
+                match_distance=distance, match_tolerance=0.6,
+            )
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "replay.json")
+            call_command("replay_matches", tolerances="0.45,0.6", json_path=path, stdout=out)
+            with open(path) as f:
+                group = json.load(f)["groups"][0]
+        self.assertIn("BCA-1", out.getvalue())
+        self.assertEqual((group["group"], group["samples"], group["max"]), ("BCA-1", 4, 0.52))
+        self.assertEqual([cell["reject_pct"] for cell in group["sweep"]], [50.0, 0.0])
+
+    def test_replay_reencodes_archived_faces(self):
+        other = self.base.copy()
+        other[1] = 0.5
+        Student.objects.bulk_create([Student(
+            roll_no="T2", name="Other", face_encoding=other.tobytes(),
+            encoding_state=EncodingState.VALID, encoding_version=1,
+        )])
+        attendance = Attendance.objects.create(student=self.student, date=date(2026, 3, 2), status="on_time")
+        AttendanceImage.objects.create(
+            attendance=attendance, path="attendance/x.jpg", sha256="0" * 64, size=1,
+            kind="crop", face_box="0.2,0.8,0.8,0.2",
+        )
+        probe = self.base.copy()
+        probe[0] = 0.3
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch("attendance.management.commands.replay_matches.encoding_pool.encode", return_value=[probe]) as encode:
+            path = os.path.join(tmp, "replay.json")
+            call_command("replay_matches", reencode=True, by="all", tolerances="0.25,0.6", json_path=path, stdout=out)
+            with open(path) as f:
+                group = json.load(f)["groups"][0]
+        self.assertEqual(encode.call_args.kwargs["face_box"], (0.2, 0.8, 0.8, 0.2))
+        self.assertAlmostEqual(group["p50"], 0.3)
+        self.assertAlmostEqual(group["closest_impostor"], np.hypot(0.3, 0.5))
+        self.assertEqual(
+            [(c["reject_pct"], c["false_accept_pct"]) for c in group["sweep"]], [(100.0, 0.0), (0.0, 100.0)],
+        )
+
+
+class FaceEncodingIndexTests(TestCase):
+    def setUp(self):
+        self.vectors = {roll_no: np.eye(128)[i] for i, roll_no in enumerate(["A", "B", "C"])}
+        self.students = {
+            s.roll_no: s.id for s in Student.objects.bulk_create(
+                Student(roll_no=roll_no, name=roll_no, face_encoding=vector.tobytes(),
+                        encoding_state=EncodingState.VALID, encoding_version=1)
+                for roll_no, vector in self.vectors.items()
+            )
+        }
+        self.index = FaceEncodingIndex()
+
+    def assertRowsMatch(self, expected):
+        # Every student's row holds their vector and the bookkeeping agrees
+        self.assertEqual(sorted(self.index._roll_nos), sorted(expected))
+        self.assertEqual(self.index._matrix.shape, (len(expected), 128))
+        for pos, student_id in enumerate(self.index._student_ids):
+            self.assertEqual(self.index._positions[student_id], pos)
+            roll_no = self.index._roll_nos[pos]
+            np.testing.assert_array_equal(self.index._matrix[pos], expected[roll_no])
+
+    def test_changes_before_first_load_are_ignored(self):
+        self.index.upsert(999, "X", np.ones(128).tobytes())
+        self.index.remove(self.students["A"])
+        self.assertFalse(self.index.loaded)
+        self.assertEqual(self.index.identify(self.vectors["A"])[:2], (self.students["A"], "A"))
+        self.assertRowsMatch(self.vectors)
+
+    def test_remove_swaps_the_last_row_in(self):
+        self.index.load()
+        self.index.remove(self.students["A"])
+        self.assertEqual(self.index._roll_nos, ["C", "B"])
+        self.assertRowsMatch({"B": self.vectors["B"], "C": self.vectors["C"]})
+        self.assertEqual(self.index.identify(self.vectors["C"])[1], "C")
+        self.assertIsNone(self.index.identify(self.vectors["A"]))
+
+        self.index.remove(self.students["B"])  # the last row itself
+        self.index.remove(12345)               # not indexed
+        self.assertRowsMatch({"C": self.vectors["C"]})
+
+    def test_upsert_appends_replaces_and_drops(self):
+        self.index.load()
+        new = np.full(128, 0.5)
+        self.index.upsert(999, "D", new.tobytes())
+        moved = np.eye(128)[10]
+        self.index.upsert(self.students["B"], "B2", moved.tobytes())
+        self.index.upsert(self.students["A"], "A", np.zeros(128).tobytes())  # default vector: dropped
+        self.assertRowsMatch({"B2": moved, "C": self.vectors["C"], "D": new})
+        self.assertEqual(self.index.identify(moved)[:2], (self.students["B"], "B2"))
+
+    def test_invalidate_reloads_from_the_database(self):
+        self.index.load()
+        Student.objects.filter(roll_no="C").update(face_encoding=None, encoding_state=EncodingState.MISSING)
+        self.assertEqual(len(self.index), 3)  # bulk update: no signal reached the index
+        self.index.invalidate()
+        self.assertFalse(self.index.loaded)
+        self.assertIsNone(self.index.identify(self.vectors["C"]))
+        self.assertRowsMatch({"A": self.vectors["A"], "B": self.vectors["B"]})
+
+
+@override_settings(FACE_POOL_WORKERS=0, FACE_MAX_IMAGE_SIDE=640, FACE_CENTER_ROI=None)
+class FacePreprocessingTests(TestCase):
+    def detector_input(self, fn, *args, **kwargs):
+        with mock.patch("attendance.utils.face_utils.face_recognition.face_locations", return_value=[]) as locate:
+            fn(*args, **kwargs)
+        return locate.call_args.args[0].shape
+
+    def test_uploads_are_decoded_in_memory_and_upright(self):
+        photo = make_photo((1600, 1200), orientation=6)  # rotate 90°: portrait once applied
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            raw, frame = read_upload(SimpleUploadedFile("face.jpg", photo, content_type="image/jpeg"), max_side=640)
+            self.assertEqual(os.listdir(media), [])  # nothing written to media/temp
+        self.assertEqual(raw, photo)
+        self.assertEqual(frame.shape, (640, 480, 3))
+        self.assertEqual(load_image(io.BytesIO(photo)).shape, (1600, 1200, 3))
+        # Already decoded frames are only downscaled
+        self.assertEqual(load_image(frame, max_side=320).shape, (320, 240, 3))
+
+    @override_settings(FACE_CENTER_ROI=0.5)
+    def test_downscale_then_center_roi_with_full_frame_fallback(self):
+        frame = np.zeros((960, 1280, 3), dtype=np.uint8)
+        with mock.patch("attendance.utils.face_utils.face_recognition.face_locations",
+                        side_effect=[[], [(10, 60, 60, 10), (100, 300, 300, 100)]]) as locate, \
+                mock.patch("attendance.utils.face_utils.face_recognition.face_encodings",
+                           return_value=[np.zeros(128)]) as encode:
+            _, details = encode_faces(frame, with_details=True)
+        # The ROI of the 640px frame is tried first, then the whole frame
+        self.assertEqual([c.args[0].shape for c in locate.call_args_list], [(240, 320, 3), (480, 640, 3)])
+        # Of two faces, the largest is encoded
+        self.assertEqual(encode.call_args.kwargs["known_face_locations"], [(100, 300, 300, 100)])
+        self.assertEqual((details["location"], details["face_count"]), ((100, 300, 300, 100), 2))
+
+        # Registration photos skip the ROI; a client face box skips detection
+        self.assertEqual(self.detector_input(encode_faces, frame, use_roi=False), (480, 640, 3))
+        with mock.patch("attendance.utils.face_utils.face_recognition.face_locations") as locate, \
+                mock.patch("attendance.utils.face_utils.face_recognition.face_encodings", return_value=[]) as encode:
+            encode_faces(frame, face_box=(0.25, 0.75, 0.75, 0.25))
+        locate.assert_not_called()
+        # The 240x320px box plus 80px margins, scaled so the face is 150px tall
+        self.assertEqual(encode.call_args.args[0].shape, (250, 300, 3))
+        top, _, bottom, _ = encode.call_args.kwargs["known_face_locations"][0]
+        self.assertEqual(bottom - top, 150)
+
+    def test_registration_photos_are_encoded_at_full_size(self):
+        photo = io.BytesIO(make_photo((1600, 1200)))
+        # Attendance frames are capped at FACE_MAX_IMAGE_SIDE; stored encodings are not
+        self.assertEqual(self.detector_input(encode_faces, photo), (480, 640, 3))
+        photo.seek(0)
+        self.assertEqual(self.detector_input(get_face_encoding, photo), (1200, 1600, 3))
+        self.assertIsNone(storage_config()["FACE_MAX_IMAGE_SIDE"])
+        self.assertEqual(storage_config(FACE_MAX_IMAGE_SIDE=1024)["FACE_MAX_IMAGE_SIDE"], 1024)
+
+
+class FakeExecutor:
+    # Stands in for ProcessPoolExecutor: hands out futures the test completes
+    def __init__(self, *args, **kwargs):
+        self.futures = []
+        self.broken = False
+
+    def submit(self, fn, *args):
+        if self.broken:
+            raise BrokenProcessPool("worker died")
+        future = Future()
+        future.set_running_or_notify_cancel()  # already running: cancel() can't stop it
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@override_settings(FACE_POOL_WORKERS=1, FACE_POOL_MAX_PENDING=1, FACE_POOL_TIMEOUT=0.01, FACE_POOL_RETRY_AFTER=3)
+class EncodingPoolTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("attendance.utils.encoding_pool.ProcessPoolExecutor", side_effect=FakeExecutor)
+        self.executor_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = EncodingPool()
+
+    def test_timed_out_running_job_keeps_its_slot(self):
+        with self.assertRaises(EncoderTimeout):
+            self.pool.encode(np.zeros((4, 4, 3), np.uint8))
+        # The job is still running, so the only slot is taken
+        with self.assertRaises(EncoderBusy) as busy:
+            self.pool.encode(np.zeros((4, 4, 3), np.uint8))
+        self.assertEqual(busy.exception.retry_after, 3)
+
+        self.pool._executor.futures[-1].set_result([])
+        with self.assertRaises(EncoderTimeout):
+            self.pool.encode(np.zeros((4, 4, 3), np.uint8))
+
+    def test_broken_pool_is_replaced(self):
+        self.pool.warm()
+        first = self.pool._executor
+        first.broken = True
+        with self.assertRaises(EncoderBusy), self.assertLogs("attendance.utils.encoding_pool", "ERROR"):
+            self.pool.encode(np.zeros((4, 4, 3), np.uint8))
+        self.assertIsNone(self.pool._executor)
+
+        # A worker dying mid-job breaks the next executor the same way
+        future = Future()
+        with mock.patch.object(FakeExecutor, "submit", return_value=future):
+            future.set_exception(BrokenProcessPool("worker died"))
+            with self.assertRaises(EncoderBusy), self.assertLogs("attendance.utils.encoding_pool", "ERROR"):
+                self.pool.encode(np.zeros((4, 4, 3), np.uint8))
+        self.assertIsNone(self.pool._executor)
+        self.assertEqual(self.executor_cls.call_count, 2)
+
+        # Slots were all given back: the third pool takes a job
+        with self.assertRaises(EncoderTimeout):
+            self.pool.encode(np.zeros((4, 4, 3), np.uint8))
+        self.assertEqual(self.executor_cls.call_count, 3)
+
+    def test_executor_inherited_through_fork_is_replaced(self):
+        self.pool.warm()
+        self.assertEqual(len(self.pool._executor.futures), 1)  # one ping per worker
+        parent = self.pool._executor
+        self.pool._pid = -1  # as if this process had been forked after warm()
+        with self.assertRaises(EncoderTimeout):
+            self.pool.encode(np.zeros((4, 4, 3), np.uint8))
+        self.assertIsNot(self.pool._executor, parent)
+        self.assertEqual(self.executor_cls.call_count, 2)
+
+    def test_registration_answers_503_and_504(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        for exc, status in ((EncoderBusy(3), 503), (EncoderTimeout("slow"), 504)):
+            image = SimpleUploadedFile("face.jpg", make_photo((40, 40)), content_type="image/jpeg")
+            with override_settings(MEDIA_ROOT=media.name), \
+                    mock.patch("attendance.utils.face_utils.encoding_pool.encode", side_effect=exc):
+                resp = APIClient().post("/register/", {"roll_no": "N1", "name": "New", "image": image},
+                                        format="multipart")
+            self.assertEqual(resp.status_code, status)
+            self.assertEqual(resp.get("Retry-After"), "3" if status == 503 else None)
+            # Nothing half-registered is left behind
+            self.assertFalse(Student.objects.filter(roll_no="N1").exists())
+            self.assertEqual([f for _, _, files in os.walk(media.name) for f in files], [])
+
+    def test_views_answer_503_and_504(self):
+        Student.objects.bulk_create([Student(
+            roll_no="P1", name="Pool", face_encoding=np.full(128, 0.1).tobytes(),
+            encoding_state=EncodingState.VALID, encoding_version=1,
+        )])
+        for exc, status in ((EncoderBusy(3), 503), (EncoderTimeout("slow"), 504)):
+            image = SimpleUploadedFile("face.jpg", b"jpeg", content_type="image/jpeg")
+            with mock.patch("attendance.views.read_upload", return_value=(b"raw", np.zeros((4, 4, 3), np.uint8))), \
+                    mock.patch("attendance.utils.face_utils.encoding_pool.encode", side_effect=exc):
+                resp = APIClient().post("/api/attendance/", {"roll_no": "P1", "image": image}, format="multipart")
+            self.assertEqual(resp.status_code, status)
+            self.assertEqual(resp.get("Retry-After"), "3" if status == 503 else None)
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+SHARED_KEY_PREFIX = "admin-token:"
+GENERATION_KEY = "admin-token:generation"
+
+
+class TokenCache:
+    """Small in-process LRU of admin token validity with a TTL per entry.
+
+    Entries remember the token's own expiry, so an expired token is never
+    reported valid however long it has been cached. Negative results are
+    cached too (unknown keys are random, so they can't become valid later
+    except through revoke_all(), which clears the cache).
+    """
+
+    def __init__(self, max_size=1024):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (valid_until_monotonic, token_expires_at or None, generation)
+        self.max_size = max_size
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            valid_until, expires_at, entry_generation = entry
+            if time.monotonic() > valid_until or entry_generation != generation:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        if expires_at is None:
+            return False
+        return expires_at > timezone.now()
+
+    def set(self, key, expires_at, ttl, generation):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, expires_at, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(getattr(settings, "ADMIN_TOKEN_CACHE_SIZE", 1024))
+
+
+def _shared_cache():
+    alias = getattr(settings, "ADMIN_TOKEN_SHARED_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def _generation(shared):
+    # Bumped by revoke_all() so every worker drops its local entries
+    return shared.get(GENERATION_KEY, 0) if shared is not None else 0
+
+
+def _shared_key(key, generation):
+    # Generation is part of the key so revoke_all() orphans every shared entry
+    return f"{SHARED_KEY_PREFIX}{generation}:{key}"
+
+
+def is_token_valid(key):
+    """True if `key` is an unexpired AdminToken.
+
+    Looks in the in-process cache first, then (if ADMIN_TOKEN_SHARED_CACHE
+    names a Django cache) the shared cache, and only then the database.
+    """
+    if not key:
+        return False
+    shared = _shared_cache()
+    generation = _generation(shared)
+    cached = token_cache.get(key, generation)
+    if cached is not None:
+        return cached
+
+    ttl = getattr(settings, "ADMIN_TOKEN_CACHE_TTL", 60)
+    missing = object()
+    expires_at = missing
+    if shared is not None:
+        expires_at = shared.get(_shared_key(key, generation), missing)
+    if expires_at is missing:
+        from attendance.models import AdminToken
+
+        expires_at = (
+            AdminToken.objects.filter(key=key, expires_at__gt=timezone.now())
+            .values_list("expires_at", flat=True)
+            .first()
+        )
+        if shared is not None:
+            shared.set(_shared_key(key, generation), expires_at, ttl)
+
+    token_cache.set(key, expires_at, ttl, generation)
+    return expires_at is not None and expires_at > timezone.now()
+
+
+def remember_token(token):
+    """Prime the caches for a freshly issued token."""
+    shared = _shared_cache()
+    generation = _generation(shared)
+    ttl = getattr(settings, "ADMIN_TOKEN_CACHE_TTL", 60)
+    if shared is not None:
+        shared.set(_shared_key(token.key, generation), token.expires_at, ttl)
+    token_cache.set(token.key, token.expires_at, ttl, generation)
+
+
+def forget_token(key):
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_shared_key(key, _generation(shared)))
+    token_cache.discard(key)
+
+
+def revoke_all():
+    """Delete every AdminToken and invalidate cached validity everywhere."""
+    from attendance.models import AdminToken
+
+    AdminToken.objects.all().delete()
+    token_cache.clear()
+    shared = _shared_cache()
+    if shared is not None:
+        try:
+            shared.incr(GENERATION_KEY)
+        except ValueError:
+            shared.set(GENERATION_KEY, 1, None)
+
+
+def purge_expired():
+    """Delete expired AdminToken rows (an indexed range delete on expires_at)."""
+    from attendance.models import AdminToken
+
+    deleted, _ = AdminToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,100 @@
+"""Thread pools used by the async marking endpoint.
+
+``run_blocking`` moves CPU/blocking work (image decode, face encoding, index
+search) off the event loop onto a bounded thread pool, carrying the request's
+contextvars along so metrics spans still land on the right request.
+``background`` runs fire-and-forget jobs such as image archival after the
+response has gone out; failures are logged, never raised to the client.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor_lock = threading.Lock()
+_blocking_executor = None
+
+
+def _get_blocking_executor():
+    global _blocking_executor
+    with _executor_lock:
+        if _blocking_executor is None:
+            _blocking_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "ASYNC_MARK_THREADS", 16),
+                thread_name_prefix="attendance-cpu",
+            )
+        return _blocking_executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) run on the blocking thread pool.
+
+    fn must not touch the ORM: Django connections are per thread, so use the
+    async ORM methods (or sync_to_async) for queries instead.
+    """
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_blocking_executor(), lambda: ctx.run(fn, *args, **kwargs))
+
+
+class BackgroundQueue:
+    """Small in-process job queue on a thread pool of BACKGROUND_WORKERS threads.
+
+    Jobs are lost if the process dies before they run, so only use it for
+    work that is safe to drop (the attendance row is already committed).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "BACKGROUND_WORKERS", 2),
+                    thread_name_prefix="attendance-bg",
+                )
+            return self._executor
+
+    def _run(self, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Background job %s failed", getattr(fn, "__name__", fn))
+        finally:
+            # Jobs may use the ORM; worker threads outlive requests, so tidy
+            # their connections the way request_finished would
+            close_old_connections()
+
+    def submit(self, fn, *args, **kwargs):
+        future = self._get_executor().submit(self._run, fn, args, kwargs)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def drain(self, timeout=None):
+        """Wait for queued jobs (tests, graceful shutdown). True if all finished."""
+        with self._lock:
+            futures = list(self._pending)
+        done, not_done = wait(futures, timeout=timeout)
+        return not not_done
+
+
+background = BackgroundQueue()
@@ -0,0 +1,267 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EncoderBusy(Exception):
+    """Raised when the encoding queue is full; callers should answer 503."""
+
+    def __init__(self, retry_after):
+        super().__init__("Face encoder is busy")
+        self.retry_after = retry_after
+
+
+class EncoderTimeout(Exception):
+    """Raised when a single encoding job exceeds FACE_POOL_TIMEOUT."""
+
+
+def _warm_worker():
+    # Runs once per worker process: importing face_recognition loads the dlib
+    # detector, landmark and encoder models; one tiny call primes them.
+    import face_recognition
+
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank)
+    face_recognition.face_encodings(blank, known_face_locations=[(8, 56, 56, 8)])
+
+
+def _ping():
+    # Submitted by EncodingPool.warm() so every worker starts (and runs
+    # _warm_worker) before the first real job arrives
+    return True
+
+
+def _encode_job(image, face_box, use_roi, config, with_details=False):
+    from .face_utils import encode_faces
+
+    encodings, details = encode_faces(image, face_box, use_roi, config, with_details=True)
+    encodings = [np.asarray(e, dtype=np.float64) for e in encodings]
+    return (encodings, details) if with_details else encodings
+
+
+def encode_for_storage(source, config):
+    """Encode the first face in an image for storing on a Student, for bulk jobs.
+
+    `source` is a file path or the image file's bytes. Lives here rather than
+    next to its callers because spawned workers must unpickle it without
+    Django's app registry (no model imports). Returns ``(encoding_bytes, None)``
+    or ``(None, error_message)``.
+    """
+    from io import BytesIO
+
+    from .face_utils import encode_faces
+
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    try:
+        encodings = encode_faces(source, use_roi=False, config=config)
+    except Exception as e:
+        return None, f"Could not read image: {e}"
+    if not encodings:
+        return None, "No face found in image"
+    return np.asarray(encodings[0], dtype=np.float64).tobytes(), None
+
+
+def encoder_unavailable_response(exc, response_class=None):
+    """503 + Retry-After when the face encoding pool is full, 504 on a job timeout.
+
+    `response_class` defaults to DRF's Response; pass JsonResponse from plain
+    Django views.
+    """
+    if response_class is None:
+        from rest_framework.response import Response as response_class
+    if isinstance(exc, EncoderBusy):
+        resp = response_class({"error": "Face recognition is busy, please retry"}, status=503)
+        resp["Retry-After"] = str(exc.retry_after)
+        return resp
+    return response_class({"error": "Face recognition timed out, please retry"}, status=504)
+
+
+class EncodingPool:
+    """Dedicated process pool for dlib work so request threads only wait on a
+    future instead of holding the GIL through detection and encoding.
+
+    At most FACE_POOL_WORKERS jobs run at once and at most FACE_POOL_MAX_PENDING
+    are accepted (running + queued) per Django process; beyond that ``submit``
+    raises EncoderBusy immediately. FACE_POOL_WORKERS = 0 runs jobs inline,
+    which is what tests and ``runserver`` without the pool use.
+
+    A job's slot is held until the job really finishes: a timed-out job that
+    is already running can't be cancelled and keeps its worker busy, so it
+    keeps counting against FACE_POOL_MAX_PENDING. If a worker dies (OOM,
+    segfault, kill) the executor is broken for good; it is dropped, the
+    caller gets EncoderBusy (503) and the next job starts a fresh pool.
+
+    The executor is started lazily by the first job of each process. One
+    inherited through fork (gunicorn --preload) belongs to the parent and is
+    ignored, so every worker process starts its own.
+    """
+
+    def __init__(self, workers=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pid = None  # process that started _executor
+        self._workers = workers  # None: FACE_POOL_WORKERS
+
+    @property
+    def workers(self):
+        if self._workers is not None:
+            return self._workers
+        return getattr(settings, "FACE_POOL_WORKERS", 0)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked from the process that built these: its workers and
+                # queue threads didn't come along
+                self._executor, self._slots = None, None
+            if self._slots is None:
+                # Created once: jobs of a replaced executor still release into it
+                max_pending = getattr(settings, "FACE_POOL_MAX_PENDING", self.workers * 4)
+                if self._workers is not None:
+                    # Private pools (management commands) aren't shared with requests
+                    max_pending = self._workers * 2
+                self._slots = threading.BoundedSemaphore(max_pending)
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(
+                        getattr(settings, "FACE_POOL_START_METHOD", "spawn")
+                    ),
+                    initializer=_warm_worker,
+                )
+                self._pid = os.getpid()
+                atexit.register(self.shutdown)
+                logger.info("Started face encoding pool with %d workers", self.workers)
+                # The executor forks workers one job at a time; one ping each
+                # starts them all (and loads dlib) in parallel
+                try:
+                    for _ in range(self.workers):
+                        self._executor.submit(_ping)
+                except BrokenProcessPool:
+                    pass  # the caller's own submit finds out and replaces it
+            return self._executor
+
+    def _discard(self, executor):
+        # Drop a broken executor, unless another thread already replaced it
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self):
+        """Start every worker now so the first requests don't pay for spawning
+        processes and loading the dlib models inside FACE_POOL_TIMEOUT. Call it
+        from inside the serving process (e.g. gunicorn's post_worker_init hook),
+        not at import time. Returns without waiting for the workers."""
+        if self.workers:
+            self._get_executor()
+
+    def is_saturated(self):
+        if not self.workers or self._slots is None:
+            return False
+        # BoundedSemaphore has no public counter; probe it without blocking
+        if self._slots.acquire(blocking=False):
+            self._slots.release()
+            return False
+        return True
+
+    def encode(self, image, face_box=None, use_roi=True, config=None, with_details=False):
+        """Run encode_faces in the pool and return its list of encodings
+        (and its details dict, with with_details)."""
+        from .face_utils import preprocess_config
+
+        config = config or preprocess_config()
+        if not self.workers:
+            return _encode_job(image, face_box, use_roi, config, with_details)
+
+        executor = self._get_executor()
+        retry_after = getattr(settings, "FACE_POOL_RETRY_AFTER", 2)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise EncoderBusy(retry_after)
+        try:
+            future = executor.submit(_encode_job, image, face_box, use_roi, config, with_details)
+        except BrokenProcessPool:
+            slots.release()
+            self._discard(executor)
+            logger.error("Face encoding pool was broken; starting a new one")
+            raise EncoderBusy(retry_after)
+        except Exception:
+            slots.release()
+            raise
+        # Released when the job is done, cancelled or failed, not when we stop waiting
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=getattr(settings, "FACE_POOL_TIMEOUT", 10))
+        except FutureTimeout:
+            # Only frees a queued job; a running one finishes in the background
+            future.cancel()
+            raise EncoderTimeout("Face encoding timed out")
+        except BrokenProcessPool:
+            self._discard(executor)
+            logger.error("Face encoding worker died; starting a new pool")
+            raise EncoderBusy(retry_after)
+
+    def imap(self, fn, jobs, window=None):
+        """Run fn(*args) for each (tag, args) in `jobs`, yielding (tag, result)
+        in order, for bulk work such as imports. Tags stay in this process.
+
+        At most `window` jobs (default: one per worker) are in flight, each
+        holding a pool slot; unlike encode(), a full pool makes this wait for a
+        slot instead of raising EncoderBusy, so bulk work shares the pool's
+        capacity with requests rather than failing. `jobs` is consumed lazily.
+        """
+        if not self.workers:
+            for tag, args in jobs:
+                yield tag, fn(*args)
+            return
+
+        executor = self._get_executor()
+        slots = self._slots
+        window = window or self.workers
+        pending = deque()
+        try:
+            for tag, args in jobs:
+                if len(pending) >= window:
+                    done_tag, future = pending.popleft()
+                    yield done_tag, future.result()
+                slots.acquire()
+                try:
+                    future = executor.submit(fn, *args)
+                except BaseException:
+                    slots.release()
+                    raise
+                future.add_done_callback(lambda _: slots.release())
+                pending.append((tag, future))
+            while pending:
+                done_tag, future = pending.popleft()
+                yield done_tag, future.result()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+encoding_pool = EncodingPool()
@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIM = 128
+
+
+def _decode_encoding(raw):
+    """Return a (128,) float64 vector for a stored encoding, or None when the
+    blob is empty, malformed or the default all-zero vector."""
+    if not raw:
+        return None
+    try:
+        arr = np.frombuffer(bytes(raw), dtype=np.float64)
+    except ValueError:
+        return None
+    if arr.shape != (ENCODING_DIM,) or not np.any(arr):
+        return None
+    return arr
+
+
+class FaceEncodingIndex:
+    """Process-wide matrix of every valid Student.face_encoding.
+
+    Rows of ``_matrix`` line up with ``_student_ids`` / ``_roll_nos`` so a
+    1:N identification is one vectorized distance computation plus argmin.
+    The index is loaded lazily on first use, patched in place by the Student
+    signals in ``attendance.signals`` and fully reloaded every
+    ``FACE_INDEX_REFRESH_SECONDS`` to pick up writes made by other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._matrix = np.empty((0, ENCODING_DIM), dtype=np.float64)
+        self._student_ids = []
+        self._roll_nos = []
+        self._positions = {}  # student_id -> row in _matrix
+        self._loaded_at = None
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def __len__(self):
+        return len(self._student_ids)
+
+    def _is_stale(self):
+        if self._loaded_at is None:
+            return True
+        max_age = getattr(settings, "FACE_INDEX_REFRESH_SECONDS", 300)
+        return bool(max_age) and time.monotonic() - self._loaded_at > max_age
+
+    def load(self):
+        """(Re)build the whole index from the database."""
+        from accounts.models import EncodingState, Student
+
+        ids, rolls, rows = [], [], []
+        # Only rows already known to be valid; the rest are never fetched
+        qs = Student.objects.filter(encoding_state=EncodingState.VALID).values_list(
+            "id", "roll_no", "face_encoding"
+        )
+        for student_id, roll_no, raw in qs.iterator(chunk_size=2000):
+            enc = _decode_encoding(raw)
+            if enc is None:
+                continue
+            ids.append(student_id)
+            rolls.append(roll_no)
+            rows.append(enc)
+
+        matrix = (
+            np.ascontiguousarray(np.vstack(rows), dtype=np.float64)
+            if rows
+            else np.empty((0, ENCODING_DIM), dtype=np.float64)
+        )
+        with self._lock:
+            self._matrix = matrix
+            self._student_ids = ids
+            self._roll_nos = rolls
+            self._positions = {sid: i for i, sid in enumerate(ids)}
+            self._loaded_at = time.monotonic()
+        logger.info("Face index loaded with %d encodings", len(ids))
+
+    def invalidate(self):
+        """Force a full reload on next use (e.g. after bulk_create/update)."""
+        self._loaded_at = None
+
+    def ensure_loaded(self):
+        if self._is_stale():
+            self.load()
+
+    def upsert(self, student_id, roll_no, raw_encoding):
+        """Insert, replace or drop a single student's row.
+
+        A no-op until the index has been loaded; the first ``identify`` call
+        will read the current state from the database anyway.
+        """
+        if not self.loaded:
+            return
+        enc = _decode_encoding(raw_encoding)
+        if enc is None:
+            self.remove(student_id)
+            return
+        with self._lock:
+            pos = self._positions.get(student_id)
+            if pos is None:
+                self._matrix = np.vstack([self._matrix, enc[np.newaxis, :]])
+                self._student_ids.append(student_id)
+                self._roll_nos.append(roll_no)
+                self._positions[student_id] = len(self._student_ids) - 1
+            else:
+                self._matrix[pos] = enc
+                self._roll_nos[pos] = roll_no
+
+    def remove(self, student_id):
+        """Drop a student's row by swapping the last row into its place."""
+        if not self.loaded:
+            return
+        with self._lock:
+            pos = self._positions.pop(student_id, None)
+            if pos is None:
+                return
+            last = len(self._student_ids) - 1
+            if pos != last:
+                self._matrix[pos] = self._matrix[last]
+                self._student_ids[pos] = self._student_ids[last]
+                self._roll_nos[pos] = self._roll_nos[last]
+                self._positions[self._student_ids[pos]] = pos
+            self._matrix = self._matrix[:last].copy()
+            self._student_ids.pop()
+            self._roll_nos.pop()
+
+    def closest(self, encoding):
+        """Return ``(student_id, roll_no, distance)`` for the closest stored
+        encoding, or None if the index is empty."""
+        self.ensure_loaded()
+        with self._lock:
+            if not self._student_ids:
+                return None
+            distances = np.linalg.norm(self._matrix - encoding, axis=1)
+            best = int(np.argmin(distances))
+            return self._student_ids[best], self._roll_nos[best], float(distances[best])
+
+    def identify(self, encoding, tolerance=0.6):
+        """Like closest(), but None unless the distance is within ``tolerance``."""
+        match = self.closest(encoding)
+        if match is None or match[2] > tolerance:
+            return None
+        return match
+
+
+face_index = FaceEncodingIndex()
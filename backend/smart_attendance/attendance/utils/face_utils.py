@@ -1,44 +1,326 @@
+import logging
+import time
+from dataclasses import dataclass
+from io import BytesIO
+
 import face_recognition
 import numpy as np
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .encoding_pool import encoding_pool
+from .face_index import ENCODING_DIM, face_index
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Default for FACE_MATCH_TOLERANCE (face_recognition's own default)
+DEFAULT_TOLERANCE = 0.6
+
+# Defaults for the preprocessing stage; each can be overridden in settings.
+PREPROCESS_DEFAULTS = {
+    "FACE_DETECTOR_MODEL": "hog",   # "hog" (CPU) or "cnn" (needs dlib with CUDA to be fast)
+    "FACE_UPSAMPLE": 1,             # number_of_times_to_upsample passed to the detector
+    "FACE_MAX_IMAGE_SIDE": 640,     # frames are downscaled so the longest side is at most this (None = full size)
+    "FACE_CENTER_ROI": None,        # e.g. 0.6 keeps the central 60% of width/height for detection
+    "FACE_TARGET_SIZE": 150,        # face height in px when the client sends a face box (dlib chips are 150px)
+    "FACE_NUM_JITTERS": 1,
+}
+
+def preprocess_config(**overrides):
+    # Effective preprocessing settings: defaults < Django settings < explicit overrides
+    cfg = {key: getattr(settings, key, default) for key, default in PREPROCESS_DEFAULTS.items()}
+    cfg.update(overrides)
+    return cfg
+
+def storage_config(**overrides):
+    # For encodings that get stored (registration, imports, repairs): decoded at
+    # full size, since FACE_MAX_IMAGE_SIDE is a per-frame speed cap for the kiosk
+    # and every later match is measured against what is stored
+    return preprocess_config(**{"FACE_MAX_IMAGE_SIDE": None, **overrides})
+
+def load_image(source, max_side=None):
+    # Accepts a file path, a file-like object or an already decoded RGB array.
+    # With max_side, JPEGs are decoded at reduced scale (PIL draft mode) and then
+    # thumbnailed, which is much cheaper than decoding full size and resizing.
+    # The EXIF orientation is applied, so phone photos are upright for the
+    # detector and pixel boxes match what the client displayed.
+    if isinstance(source, np.ndarray):
+        return _downscale(source, max_side)
+    im = Image.open(source)
+    if max_side:
+        im.draft("RGB", (max_side, max_side))
+    im = ImageOps.exif_transpose(im).convert("RGB")
+    if max_side and max(im.size) > max_side:
+        im.thumbnail((max_side, max_side))
+    return np.array(im)
+
+def read_upload(uploaded_file, max_side=None):
+    # Reads an uploaded file once and decodes it in memory (no temp file).
+    # Returns (raw_bytes, rgb_array) so the same buffer can be archived as-is.
+    raw = b"".join(uploaded_file.chunks())
+    return raw, load_image(BytesIO(raw), max_side=max_side)
+
+def parse_face_box(value):
+    # Parses a client supplied "top,right,bottom,left" box given as fractions (0-1)
+    # of the frame height/width. Returns None if missing or malformed.
+    if not value:
+        return None
+    try:
+        top, right, bottom, left = (float(v) for v in str(value).split(","))
+    except ValueError:
+        return None
+    if not (0 <= top < bottom <= 1 and 0 <= left < right <= 1):
+        return None
+    return top, right, bottom, left
+
+def _downscale(image, max_side):
+    h, w = image.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return image
+    scale = max_side / float(max(h, w))
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR))
+
+def _center_roi(image, fraction):
+    h, w = image.shape[:2]
+    dh, dw = int(h * (1 - fraction) / 2), int(w * (1 - fraction) / 2)
+    return image[dh:h - dh, dw:w - dw]
+
+def _crop_to_face_box(image, face_box, target_size):
+    # Crops the client's face box (plus a margin so dlib's landmarks fit) and
+    # scales it so the face is about target_size px tall.
+    h, w = image.shape[:2]
+    top, right, bottom, left = face_box
+    top, bottom = int(top * h), int(bottom * h)
+    left, right = int(left * w), int(right * w)
+    margin = int(0.25 * max(bottom - top, right - left))
+    y0, y1 = max(0, top - margin), min(h, bottom + margin)
+    x0, x1 = max(0, left - margin), min(w, right + margin)
+    crop = image[y0:y1, x0:x1]
+    scale = min(1.0, target_size / float(max(1, bottom - top)))
+    if scale < 1.0:
+        crop = np.asarray(Image.fromarray(crop).resize(
+            (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+            Image.BILINEAR,
+        ))
+    location = (
+        int((top - y0) * scale),
+        int((right - x0) * scale),
+        int((bottom - y0) * scale),
+        int((left - x0) * scale),
+    )
+    return crop, location
+
+def _area(location):
+    top, right, bottom, left = location
+    return (bottom - top) * (right - left)
+
+def encode_faces(image, face_box=None, use_roi=True, config=None, with_details=False):
+    # Preprocessing + detection + encoding. Returns a list of 128-dim encodings.
+    # - face_box: client supplied box (see parse_face_box); skips detection entirely
+    # - otherwise the frame is downscaled, optionally limited to a center ROI, and
+    #   run through the configured detector; the ROI falls back to the full frame.
+    #   Of several faces the largest (nearest the camera) is encoded.
+    # With with_details, returns (encodings, details): "location" of the encoded
+    # face as a (top, right, bottom, left) pixel box in the downscaled frame,
+    # "face_count" detected, and "detect_ms" / "encode_ms" spent in dlib.
+    cfg = config or preprocess_config()
+    image = load_image(image, max_side=cfg["FACE_MAX_IMAGE_SIDE"])
+    encodings = []
+    details = {"location": None, "face_count": 0, "detect_ms": 0.0, "encode_ms": 0.0}
+
+    if face_box:
+        crop, location = _crop_to_face_box(image, face_box, cfg["FACE_TARGET_SIZE"])
+        started = time.perf_counter()
+        encodings = face_recognition.face_encodings(
+            crop, known_face_locations=[location], num_jitters=cfg["FACE_NUM_JITTERS"]
+        )
+        h, w = image.shape[:2]
+        top, right, bottom, left = face_box
+        details.update(
+            location=(int(top * h), int(right * w), int(bottom * h), int(left * w)),
+            face_count=1,
+            encode_ms=(time.perf_counter() - started) * 1000,
+        )
+        return (encodings, details) if with_details else encodings
+
+    candidates = [(image, 0, 0)]
+    if use_roi and cfg["FACE_CENTER_ROI"]:
+        roi = _center_roi(image, cfg["FACE_CENTER_ROI"])
+        candidates.insert(0, (roi, (image.shape[0] - roi.shape[0]) // 2, (image.shape[1] - roi.shape[1]) // 2))
+
+    for frame, dy, dx in candidates:
+        started = time.perf_counter()
+        found = face_recognition.face_locations(
+            frame,
+            number_of_times_to_upsample=cfg["FACE_UPSAMPLE"],
+            model=cfg["FACE_DETECTOR_MODEL"],
+        )
+        details["detect_ms"] += (time.perf_counter() - started) * 1000
+        if found:
+            chosen = max(found, key=_area)
+            started = time.perf_counter()
+            encodings = face_recognition.face_encodings(
+                frame, known_face_locations=[chosen], num_jitters=cfg["FACE_NUM_JITTERS"]
+            )
+            top, right, bottom, left = chosen
+            details.update(
+                location=(top + dy, right + dx, bottom + dy, left + dx),
+                face_count=len(found),
+                encode_ms=(time.perf_counter() - started) * 1000,
+            )
+            break
+    return (encodings, details) if with_details else encodings
 
 def get_face_encoding(image_path):
-    # Extracts a 128-dim float64 encoding from the image for storage
-    image = face_recognition.load_image_file(image_path)
-    encodings = face_recognition.face_encodings(image)
+    # Extracts a 128-dim float64 encoding from the image for storage.
+    # Runs in the encoding pool; may raise EncoderBusy / EncoderTimeout.
+    with span("face_encode"):
+        encodings = encoding_pool.encode(image_path, use_roi=False, config=storage_config())
     if not encodings:
-        print("No face found in registration image.")
+        logger.info("No face found in registration image")
         return None
     encoding = np.asarray(encodings[0], dtype=np.float64)
-    print(f"Registration encoding (shape={encoding.shape}, dtype={encoding.dtype}): {encoding}")
-    if encoding.shape[0] != 128:
-        print("Warning: Registration encoding is not 128-dim!")
+    if encoding.shape[0] != ENCODING_DIM:
+        logger.warning("Registration encoding has shape %s, expected (%d,)", encoding.shape, ENCODING_DIM)
         return None
     return encoding.tobytes()
 
-def match_face(unknown_image_path, known_students):
-    # Loads the student's stored encoding and compares it to the new image's encoding
-    unknown_image = face_recognition.load_image_file(unknown_image_path)
-    unknown_encs = face_recognition.face_encodings(unknown_image)
+@dataclass
+class MatchResult:
+    """What one attendance photo matched, and what it cost.
+
+    ``student`` is set only when the closest candidate is within
+    ``tolerance``; ``distance`` is to the closest candidate either way, so
+    near misses can be logged and thresholds tuned (see replay_matches).
+    """
+    face_count: int = 0
+    location: tuple = None         # encoded face, (top, right, bottom, left) px in the downscaled frame
+    distance: float = None         # to the closest candidate
+    tolerance: float = None
+    student_id: int = None         # closest candidate
+    roll_no: str = None
+    student: object = None         # the matched Student, if loaded
+    detect_ms: float = 0.0
+    encode_ms: float = 0.0
+
+    @property
+    def no_face(self):
+        return self.face_count == 0 or self.location is None
+
+    @property
+    def matched(self):
+        return self.distance is not None and self.tolerance is not None and self.distance <= self.tolerance
+
+def _unknown_encoding(unknown_image, face_box=None):
+    # Encodes the chosen face in the attendance image: (encoding or None, MatchResult)
+    with span("face_encode", face_box=bool(face_box)):
+        unknown_encs, details = encoding_pool.encode(unknown_image, face_box=face_box, with_details=True)
+    result = MatchResult(**details)
     if not unknown_encs:
-        print("No face detected in attendance image.")
-        return "no_face"
-    unknown_enc = np.asarray(unknown_encs[0], dtype=np.float64)
-    print(f"Unknown encoding (shape={unknown_enc.shape}, dtype={unknown_enc.dtype}): {unknown_enc}")
+        logger.info("No face detected in attendance image")
+        result.location = None
+        return None, result
+    return np.asarray(unknown_encs[0], dtype=np.float64), result
+
+def match_face(unknown_image, known_students, tolerance=None, face_box=None):
+    # Loads the students' stored encodings and compares them to the new image's encoding.
+    # unknown_image may be a path, a file-like object or a decoded RGB array.
+    # Returns a MatchResult; tolerance defaults to the first student's (see tolerance_for).
+    unknown_enc, result = _unknown_encoding(unknown_image, face_box=face_box)
+    if unknown_enc is None:
+        return result
 
+    candidates = []
+    rows = []
     for student in known_students:
-        if not student.face_encoding:
-            print(f"Student {student.roll_no} has no face_encoding stored.")
-            continue
-        known_enc = np.frombuffer(student.face_encoding, dtype=np.float64)
-        print(f"Known encoding for {student.roll_no} (shape={known_enc.shape}, dtype={known_enc.dtype}): {known_enc}")
-        if known_enc.shape[0] != 128:
-            print(f"Skipping student {student.roll_no}: encoding shape {known_enc.shape}")
+        # encoding_state is maintained at write time, so only valid blobs are decoded
+        if not student.has_valid_encoding:
+            logger.info("Skipping student %s: encoding is %s", student.roll_no, student.encoding_state)
             continue
-        # This is the actual linkage: compare the stored encoding (from registration) to the new encoding (from attendance)
-        match = face_recognition.compare_faces([known_enc], unknown_enc)
-        print(f"Compare result for {student.roll_no}: {match}")
-        if match[0]:
-            print(f"Face matched for {student.roll_no}")
-            return student
-    print("No matching face found.")
-    return None
\ No newline at end of file
+        candidates.append(student)
+        rows.append(np.frombuffer(student.face_encoding, dtype=np.float64))
+
+    if not candidates:
+        return result
+
+    # This is the actual linkage: one vectorized distance from the new encoding to every stored one
+    with span("face_match", candidates=len(candidates)):
+        distances = face_recognition.face_distance(np.vstack(rows), unknown_enc)
+        best = int(np.argmin(distances))
+    closest = candidates[best]
+    result.distance = float(distances[best])
+    result.tolerance = tolerance_for(closest) if tolerance is None else tolerance
+    result.student_id, result.roll_no = closest.pk, closest.roll_no
+    if result.matched:
+        result.student = closest
+    _log_result("Closest match", result)
+    return result
+
+def identify_match(unknown_image, tolerance=None, face_box=None):
+    # Encoding + index search only, returning a MatchResult with the closest
+    # candidate's id and roll number (student stays None). Without tolerance
+    # no decision is made: set result.tolerance once the student is known.
+    # The index must already be loaded for this to stay free of DB queries.
+    unknown_enc, result = _unknown_encoding(unknown_image, face_box=face_box)
+    if unknown_enc is None:
+        return result
+
+    with span("face_match"):
+        closest = face_index.closest(unknown_enc)
+    if closest is None:
+        logger.info("Face index is empty")
+        return result
+
+    result.student_id, result.roll_no, result.distance = closest
+    result.tolerance = tolerance
+    if tolerance is not None:
+        _log_result("Identified", result)
+    return result
+
+def _log_result(prefix, result):
+    logger.info(
+        "%s %s at distance %.4f (%s)", prefix, result.roll_no, result.distance,
+        "matched" if result.matched else "no match",
+        extra={
+            "roll_no": result.roll_no, "distance": result.distance, "tolerance": result.tolerance,
+            "matched": result.matched, "face_count": result.face_count,
+            "detect_ms": round(result.detect_ms, 2), "encode_ms": round(result.encode_ms, 2),
+        },
+    )
+
+def identify_face(unknown_image, face_box=None):
+    # 1:N identification against the process-wide encoding index (no roll number
+    # needed). The closest student is accepted within their own tolerance.
+    result = identify_match(unknown_image, face_box=face_box)
+    if result.student_id is None:
+        return result
+
+    from accounts.models import Student
+
+    student = (
+        Student.objects.select_related("class_group", "batch", "department")
+        .filter(pk=result.student_id)
+        .first()
+    )
+    if student is not None:
+        accept_identified(result, student)
+    return result
+
+def accept_identified(result, student):
+    # Applies the identified student's tolerance to an identify_match result
+    result.tolerance = tolerance_for(student)
+    result.student = student if result.matched else None
+    _log_result("Identified", result)
+    return result
+
+def tolerance_for(student):
+    """Match tolerance for `student`: their class group's match_tolerance, else
+    their department's, else FACE_MATCH_TOLERANCE. Lower is stricter (fewer
+    false accepts, more retries). Uses the already loaded relations, so select
+    class_group and department with the student."""
+    for group in (student.class_group, student.department):
+        if group is not None and group.match_tolerance is not None:
+            return group.match_tolerance
+    return getattr(settings, "FACE_MATCH_TOLERANCE", DEFAULT_TOLERANCE)
@@ -0,0 +1,244 @@
+"""Re-encode stored photos to a capped size and make thumbnails.
+
+Uploads are kept as sent at request time (archiving must be cheap); this
+stage runs afterwards on the background queue, or in bulk through
+``manage.py compress_images``:
+
+- attendance frames (AttendanceImage) are re-encoded under the same
+  content-addressed layout and get a ``<sha256>_thumb.jpg`` beside them;
+- registration photos (Student.image) are re-encoded in place and get a
+  thumbnail under students/thumbs/.
+
+Re-encoding applies the EXIF orientation and then drops all metadata.
+``face_crop`` cuts the face out of a decoded frame for crop-only archiving
+(ATTENDANCE_ARCHIVE_MODE = "crop", see utils.image_store).
+"""
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .background import background
+from .image_store import _ensure_dir, _write_atomic, archive_path, remove_archived_file
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the image pipeline; each can be overridden in settings.
+PIPELINE_DEFAULTS = {
+    "IMAGE_MAX_SIDE": 1024,          # longest side of stored photos, px
+    "IMAGE_JPEG_QUALITY": 80,
+    "THUMBNAIL_SIDE": 160,
+    "THUMBNAIL_JPEG_QUALITY": 70,
+    "IMAGE_PROCESSING_ENABLED": True,  # schedule processing after each save
+    "FACE_CROP_MARGIN": 0.4,         # crop padding around the face box, fraction of its size
+}
+
+THUMB_DIR = os.path.join("students", "thumbs")
+
+
+def pipeline_config(**overrides):
+    # Effective settings: defaults < Django settings < explicit overrides
+    cfg = {key: getattr(settings, key, default) for key, default in PIPELINE_DEFAULTS.items()}
+    cfg.update(overrides)
+    return cfg
+
+
+def _open(raw):
+    im = Image.open(BytesIO(raw))
+    im = ImageOps.exif_transpose(im)  # bake in the rotation before EXIF goes
+    return im.convert("RGB")
+
+
+def _encode(im, quality):
+    buf = BytesIO()
+    # No exif/icc arguments, so nothing but pixels is written
+    im.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def compress(raw, max_side, quality):
+    """JPEG bytes of `raw` with the longest side capped and no metadata.
+
+    `raw` itself is returned when it already is such a JPEG and re-encoding
+    would not make it smaller.
+    """
+    original = Image.open(BytesIO(raw))
+    fits = original.format == "JPEG" and max(original.size) <= max_side and not original.getexif()
+    im = _open(raw)
+    if max(im.size) > max_side:
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+    data = _encode(im, quality)
+    return raw if fits and len(data) >= len(raw) else data
+
+
+def face_box_string(location, shape):
+    """Pixel (top, right, bottom, left) in an image of `shape` -> "t,r,b,l" fractions."""
+    h, w = shape[:2]
+    top, right, bottom, left = location
+    fractions = (max(0, top) / h, min(w, right) / w, min(h, bottom) / h, max(0, left) / w)
+    return ",".join(f"{v:.4f}" for v in fractions)
+
+
+def face_crop(frame, location, margin, quality):
+    """JPEG of the face at `location` in `frame` (an RGB array) and the face's
+    box within the crop as a face_box string.
+
+    The margin keeps chin, brow and ears in so dlib's landmark model still
+    has the whole face when the crop is re-encoded from that box.
+    """
+    h, w = frame.shape[:2]
+    top, right, bottom, left = location
+    pad = int(margin * max(bottom - top, right - left))
+    y0, y1 = max(0, top - pad), min(h, bottom + pad)
+    x0, x1 = max(0, left - pad), min(w, right + pad)
+    crop = frame[y0:y1, x0:x1]
+    box = face_box_string((top - y0, right - x0, bottom - y0, left - x0), crop.shape)
+    return _encode(Image.fromarray(crop), quality), box
+
+
+def thumbnail(raw, side, quality):
+    im = _open(raw)
+    im.thumbnail((side, side), Image.LANCZOS)
+    return _encode(im, quality)
+
+
+def _read(rel_path):
+    with open(os.path.join(settings.MEDIA_ROOT, rel_path), "rb") as f:
+        return f.read()
+
+
+def _store(rel_path, data):
+    full_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+    _ensure_dir(os.path.dirname(full_path))
+    _write_atomic(full_path, data)
+
+
+def thumbnail_path(image_rel_path):
+    """Where the thumbnail of an archived attendance frame lives."""
+    stem, _ = os.path.splitext(image_rel_path)
+    return f"{stem}_thumb.jpg"
+
+
+def process_attendance_image(image_id, config=None):
+    """Compress one archived frame and add its thumbnail. Returns bytes saved
+    (0 if the row or its file is gone, or the row is already processed)."""
+    from attendance.models import AttendanceImage
+
+    cfg = config or pipeline_config()
+    image = AttendanceImage.objects.select_related("attendance__student").filter(pk=image_id).first()
+    if image is None or image.processed_at is not None:
+        return 0
+
+    try:
+        raw = _read(image.path)
+    except FileNotFoundError:
+        # Pruned or replaced between the queueing and now
+        logger.warning("Skipping attendance image %s: %s is missing", image_id, image.path)
+        return 0
+    data = compress(raw, cfg["IMAGE_MAX_SIDE"], cfg["IMAGE_JPEG_QUALITY"])
+    digest = hashlib.sha256(data).hexdigest()
+    rel_path = archive_path(image.attendance.date, image.attendance.student.roll_no, digest)
+    thumb_path = thumbnail_path(rel_path)
+    if rel_path != image.path:
+        _store(rel_path, data)
+    _store(thumb_path, thumbnail(data, cfg["THUMBNAIL_SIDE"], cfg["THUMBNAIL_JPEG_QUALITY"]))
+
+    # Only if the row still points at the file that was read: a re-archive,
+    # a prune or a concurrent run may have changed it while we compressed
+    updated = AttendanceImage.objects.filter(
+        pk=image.pk, path=image.path, sha256=image.sha256, processed_at__isnull=True,
+    ).update(
+        path=rel_path, sha256=digest, size=len(data), original_size=image.size,
+        thumbnail=thumb_path, processed_at=timezone.now(),
+    )
+    if not updated:
+        current = AttendanceImage.objects.filter(pk=image.pk).values_list("path", "thumbnail").first() or ()
+        for path in {rel_path, thumb_path} - {image.path} - set(current):
+            remove_archived_file(path)
+        logger.info("Attendance image %s changed while it was processed; left as is", image_id)
+        return 0
+    if image.path != rel_path:
+        remove_archived_file(image.path)
+    logger.info("Compressed %s: %d -> %d bytes", rel_path, image.size, len(data))
+    return image.size - len(data)
+
+
+def student_thumbnail_name(image_name):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return os.path.join(THUMB_DIR, f"{stem}.jpg")
+
+
+def student_image_processed(student):
+    # The thumbnail name follows the image name, so a replaced photo shows up as unprocessed
+    return bool(student.image_thumbnail) and student.image_thumbnail.name == student_thumbnail_name(student.image.name)
+
+
+def process_student_image(student_id, config=None):
+    """Re-encode a registration photo as a capped JPEG and make its thumbnail.
+    Returns bytes saved (0 if there is nothing to do)."""
+    from accounts.models import Student
+
+    cfg = config or pipeline_config()
+    student = Student.objects.filter(pk=student_id).only("id", "image", "image_thumbnail").first()
+    if student is None or not student.image or student_image_processed(student):
+        return 0
+
+    old_name = student.image.name
+    try:
+        raw = _read(old_name)
+    except FileNotFoundError:
+        logger.warning("Skipping student %s: %s is missing", student_id, old_name)
+        return 0
+    data = compress(raw, cfg["IMAGE_MAX_SIDE"], cfg["IMAGE_JPEG_QUALITY"])
+    new_name = os.path.splitext(old_name)[0] + ".jpg"
+    thumb_name = student_thumbnail_name(new_name)
+    _store(new_name, data)
+    _store(thumb_name, thumbnail(data, cfg["THUMBNAIL_SIDE"], cfg["THUMBNAIL_JPEG_QUALITY"]))
+    # update(), not save(): no re-encoding of the face, but updated_at still moves for the list ETag.
+    # Only if the photo is still the one that was read: a re-upload meanwhile wins
+    updated = Student.objects.filter(pk=student_id, image=old_name).update(
+        image=new_name, image_thumbnail=thumb_name, updated_at=timezone.now(),
+    )
+    if not updated:
+        current = Student.objects.filter(pk=student_id).values_list("image", "image_thumbnail").first() or ()
+        for name in {new_name, thumb_name} - {old_name} - set(current):
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, name))
+            except FileNotFoundError:
+                pass
+        logger.info("Photo of student %s changed while it was processed; left as is", student_id)
+        return 0
+    if new_name != old_name:
+        try:
+            os.remove(os.path.join(settings.MEDIA_ROOT, old_name))
+        except FileNotFoundError:
+            pass
+    logger.info("Compressed %s: %d -> %d bytes", new_name, len(raw), len(data))
+    return len(raw) - len(data)
+
+
+def schedule(fn, pk):
+    """Queue fn(pk) on the background queue once the current transaction commits."""
+    if pipeline_config()["IMAGE_PROCESSING_ENABLED"]:
+        transaction.on_commit(lambda: background.submit(fn, pk))
+
+
+def bytes_saved_by_day(since=None):
+    """[(date, images, original_bytes, stored_bytes)] for processed attendance frames, newest first."""
+    from attendance.models import AttendanceImage
+
+    qs = AttendanceImage.objects.filter(processed_at__isnull=False)
+    if since:
+        qs = qs.filter(attendance__date__gte=since)
+    rows = (
+        qs.values("attendance__date")
+        .annotate(images=Count("id"), original=Sum("original_size"), stored=Sum("size"))
+        .order_by("-attendance__date")
+    )
+    return [(r["attendance__date"], r["images"], r["original"] or 0, r["stored"] or 0) for r in rows]
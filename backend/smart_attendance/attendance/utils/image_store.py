@@ -1,101 +1,164 @@
+import hashlib
 import os
 import shutil
-from django.utils import timezone
+import uuid
+from datetime import timedelta
+
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-WEEKDAY_FOLDERS = {
-    "Sunday": "1sunday",
-    "Monday": "2monday",
-    "Tuesday": "3tuesday",
-    "Wednesday": "4wednesday",
-    "Thursday": "5thursday",
-    "Friday": "6friday",
-    "Saturday": "7saturday",
-}
+ARCHIVE_DIR = "attendance"
 
+# Default for ATTENDANCE_IMAGE_RETENTION_DAYS
 RETENTION_DAYS = 7
 
+# Default for ATTENDANCE_ARCHIVE_MODE: "frame" keeps the upload, "crop" only the face
+ARCHIVE_MODE = "frame"
+
+
 def _ensure_dir(path):
     os.makedirs(path, exist_ok=True)
     return path
 
-def get_weekday_folder_for_date(dt=None):
-    """
-    Return folder under MEDIA_ROOT/temp/<weekday_folder>
-    e.g. .../media/temp/5thursday
-    """
-    dt = dt or timezone.localdate()
-    weekday_name = dt.strftime("%A")
-    folder_name = WEEKDAY_FOLDERS.get(weekday_name, weekday_name.lower())
-    return os.path.join(settings.MEDIA_ROOT, 'temp', folder_name)
-
-def _find_temp_image_for_roll(roll_no):
-    """Search MEDIA_ROOT/temp and its subfolders for a file named <roll_no>.jpg.
-    Return the path to the newest matching file if found, otherwise None.
-    """
-    temp_root = os.path.join(settings.MEDIA_ROOT, 'temp')
-    candidates = []
-    # direct file in temp
-    direct = os.path.join(temp_root, f"{roll_no}.jpg")
-    if os.path.isfile(direct):
-        candidates.append(direct)
-
-    # search subdirectories (e.g. media/temp/5thrusday)
-    if os.path.isdir(temp_root):
-        for entry in os.listdir(temp_root):
-            sub = os.path.join(temp_root, entry)
-            if os.path.isdir(sub):
-                p = os.path.join(sub, f"{roll_no}.jpg")
-                if os.path.isfile(p):
-                    candidates.append(p)
-
-    if not candidates:
-        return None
-
-    # return the newest by modification time
-    candidates.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-    return candidates[0]
-
-
-def save_attendance_image_from_path(src_path, roll_no, move_src=False):
-    """
-    Save a single canonical image at MEDIA_ROOT/temp/<weekday_folder>/<roll_no>.jpg.
-    - If src_path missing, searches MEDIA_ROOT/temp and subfolders for <roll_no>.jpg.
-    - If src_path already equals destination, does nothing.
-    - By default copies; set move_src=True to move the file (removes temp).
-    - Removes other temp duplicates for the same roll after saving.
+
+def retention_days():
+    return getattr(settings, "ATTENDANCE_IMAGE_RETENTION_DAYS", RETENTION_DAYS)
+
+
+def archive_path(day, roll_no, digest):
+    """Archive path relative to MEDIA_ROOT: attendance/<yyyy>/<mm>/<dd>/<roll_no>/<sha256>.jpg"""
+    return os.path.join(ARCHIVE_DIR, f"{day:%Y}", f"{day:%m}", f"{day:%d}", roll_no, f"{digest}.jpg")
+
+
+def _write_atomic(full_path, raw_bytes):
+    # Unique sibling first, then rename into place: readers never see a partial file
+    tmp_path = os.path.join(os.path.dirname(full_path), f".{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(raw_bytes)
+        os.replace(tmp_path, full_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def archive_mode():
+    return getattr(settings, "ATTENDANCE_ARCHIVE_MODE", ARCHIVE_MODE)
+
+
+def archive_attendance_image(attendance, raw_bytes, frame=None, location=None, distance=None):
+    """Store the photo for `attendance` and index it in AttendanceImage.
+
+    `frame` is the decoded RGB array used for matching and `location` the
+    face's pixel box in it; with both, the face box is recorded and in
+    "crop" mode only the face crop is stored instead of `raw_bytes`.
+
+    The file name is the content's sha256, so re-archiving the same bytes is
+    a no-op on disk; a different photo for the same record replaces the old
+    file. Compression and thumbnailing (utils.image_pipeline) are queued to
+    run once the row commits. Returns the AttendanceImage.
     """
-    if not src_path or not os.path.isfile(src_path):
-        found = _find_temp_image_for_roll(roll_no)
-        if found:
-            src_path = found
+    from attendance.models import AttendanceImage
+
+    # Lazy: image_pipeline imports this module
+    from .image_pipeline import face_box_string, face_crop, pipeline_config, process_attendance_image, schedule
+
+    kind, face_box = "frame", ""
+    if frame is not None and location is not None:
+        if archive_mode() == "crop":
+            cfg = pipeline_config()
+            raw_bytes, face_box = face_crop(frame, location, cfg["FACE_CROP_MARGIN"], cfg["IMAGE_JPEG_QUALITY"])
+            kind = "crop"
         else:
-            raise FileNotFoundError(f"No temp image found for roll {roll_no}")
-
-    dst_dir = _ensure_dir(get_weekday_folder_for_date())
-    main_dst = os.path.join(dst_dir, f"{roll_no}.jpg")
-
-    # If already at destination, return immediately
-    if os.path.abspath(src_path) == os.path.abspath(main_dst):
-        return main_dst
-
-    # Copy or move single canonical file (no dated archive)
-    if move_src:
-        shutil.move(src_path, main_dst)
-    else:
-        shutil.copy2(src_path, main_dst)
-
-    # Remove other temp duplicates (keep only the saved canonical file)
-    temp_root = os.path.join(settings.MEDIA_ROOT, 'temp')
-    if os.path.isdir(temp_root):
-        for root, _, files in os.walk(temp_root):
-            for fn in files:
-                if fn.lower() == f"{roll_no}.jpg":
-                    fp = os.path.abspath(os.path.join(root, fn))
-                    try:
-                        if fp != os.path.abspath(main_dst):
-                            os.remove(fp)
-                    except Exception:
-                        pass
-
-    return main_dst
\ No newline at end of file
+            # The frame is the upload downscaled, so fractions carry over to raw_bytes
+            face_box = face_box_string(location, frame.shape)
+
+    digest = hashlib.sha256(raw_bytes).hexdigest()
+    rel_path = archive_path(attendance.date, attendance.student.roll_no, digest)
+    full_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+    if not os.path.exists(full_path):
+        _ensure_dir(os.path.dirname(full_path))
+        _write_atomic(full_path, raw_bytes)
+
+    previous = AttendanceImage.objects.filter(attendance=attendance).values_list("path", "thumbnail").first()
+    image, _ = AttendanceImage.objects.update_or_create(
+        attendance=attendance,
+        defaults={
+            "path": rel_path, "sha256": digest, "size": len(raw_bytes),
+            "kind": kind, "face_box": face_box, "distance": distance,
+            "original_size": None, "thumbnail": "", "processed_at": None,
+        },
+    )
+    if previous:
+        for old_path in previous:
+            if old_path and old_path != rel_path:
+                remove_archived_file(old_path)
+
+    # Compression and the thumbnail happen later, off the request path
+    schedule(process_attendance_image, image.pk)
+    return image
+
+
+def image_path_for(attendance_id):
+    """Absolute path of the archived photo for an Attendance id, or None."""
+    from attendance.models import AttendanceImage
+
+    rel_path = AttendanceImage.objects.filter(attendance_id=attendance_id).values_list("path", flat=True).first()
+    return os.path.join(settings.MEDIA_ROOT, rel_path) if rel_path else None
+
+
+def remove_archived_file(rel_path):
+    """Delete one archived file and any directories it leaves empty (up to the archive root)."""
+    root = os.path.join(settings.MEDIA_ROOT, ARCHIVE_DIR)
+    full_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+    try:
+        os.remove(full_path)
+    except FileNotFoundError:
+        pass
+    folder = os.path.dirname(full_path)
+    while os.path.abspath(folder).startswith(os.path.abspath(root) + os.sep):
+        try:
+            os.rmdir(folder)
+        except OSError:
+            break  # not empty
+        folder = os.path.dirname(folder)
+
+
+def prune_archive(days=None, batch_size=500, dry_run=False):
+    """Delete archived photos older than `days` (default: retention_days()).
+
+    Walks AttendanceImage by primary key in batches on the created_at index;
+    each batch's rows are deleted and the post_delete signal removes the
+    files once the delete commits. Returns (images, bytes).
+    """
+    from attendance.models import AttendanceImage
+
+    days = retention_days() if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = AttendanceImage.objects.filter(created_at__lt=cutoff).order_by("id")
+    if dry_run:
+        return expired.count(), sum(expired.values_list("size", flat=True).iterator())
+
+    images = total = 0
+    last_id = 0
+    while True:
+        batch = list(expired.filter(id__gt=last_id).values_list("id", "size")[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        with transaction.atomic():
+            AttendanceImage.objects.filter(id__in=[pk for pk, _ in batch]).delete()
+        images += len(batch)
+        total += sum(size for _, size in batch)
+    return images, total
+
+
+def remove_legacy_temp():
+    """Delete the old MEDIA_ROOT/temp/<weekday>/<roll_no>.jpg tree. Returns files removed."""
+    temp_root = os.path.join(settings.MEDIA_ROOT, "temp")
+    if not os.path.isdir(temp_root):
+        return 0
+    count = sum(len(files) for _, _, files in os.walk(temp_root))
+    shutil.rmtree(temp_root)
+    return count
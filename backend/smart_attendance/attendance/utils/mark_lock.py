@@ -0,0 +1,85 @@
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = "attendance-mark:"
+
+_lock = threading.Lock()
+_held = {}  # key -> (owner token, monotonic deadline)
+
+
+def _shared_cache():
+    alias = getattr(settings, "ATTENDANCE_MARK_LOCK_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def _acquire(key, ttl):
+    """Take the lock; returns the holder's token, or None if it is taken."""
+    token = uuid.uuid4().hex
+    shared = _shared_cache()
+    if shared is not None:
+        # cache.add is atomic on Redis/Memcached/locmem: only one caller wins
+        return token if shared.add(KEY_PREFIX + key, token, ttl) else None
+    now = time.monotonic()
+    with _lock:
+        held = _held.get(key)
+        if held is not None and held[1] > now:
+            return None
+        _held[key] = (token, now + ttl)
+        # Drop stale entries so the dict stays as small as the set of in-flight marks
+        for stale in [k for k, (_, d) in _held.items() if d <= now]:
+            del _held[stale]
+        return token
+
+
+def _release(key, token):
+    # Only the holder may release: a request that outlived the TTL must not
+    # drop the lock a later request has taken since
+    shared = _shared_cache()
+    if shared is not None:
+        # get + delete is not atomic, but the window is one round trip and
+        # the key would have to expire and be re-taken inside it
+        if shared.get(KEY_PREFIX + key) == token:
+            shared.delete(KEY_PREFIX + key)
+        return
+    with _lock:
+        held = _held.get(key)
+        if held is not None and held[0] == token:
+            del _held[key]
+
+
+@contextmanager
+def marking_lock(roll_no, day):
+    """Non-blocking per-student, per-day lock around one marking attempt.
+
+    Yields True if this request holds the lock and False if another request
+    for the same roll number is already being processed, so a duplicate tap
+    can be turned away before it pays for face recognition. The lock expires
+    after ATTENDANCE_MARK_LOCK_TTL seconds even if the holder dies; set
+    ATTENDANCE_MARK_LOCK_CACHE to a CACHES alias to share it across workers.
+    """
+    key = f"{day.isoformat()}:{roll_no}"
+    token = _acquire(key, getattr(settings, "ATTENDANCE_MARK_LOCK_TTL", 15))
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            _release(key, token)
+
+
+@asynccontextmanager
+async def async_marking_lock(roll_no, day):
+    """marking_lock for async views; cache round trips run off the event loop."""
+    key = f"{day.isoformat()}:{roll_no}"
+    ttl = getattr(settings, "ATTENDANCE_MARK_LOCK_TTL", 15)
+    token = await sync_to_async(_acquire, thread_sensitive=False)(key, ttl)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            await sync_to_async(_release, thread_sensitive=False)(key, token)
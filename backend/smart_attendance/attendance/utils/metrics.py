@@ -0,0 +1,187 @@
+"""Per-request timing and query counts (see attendance.middleware).
+
+RequestMetricsMiddleware opens a ``RequestMetrics`` for each request and
+counts every SQL statement through a connection execute wrapper; code on
+the request path adds named timing spans with ``span()``. When the response
+is done the numbers go out as a ``Server-Timing`` header, one
+``attendance.metrics`` log line and an in-process histogram per route that
+``/api/metrics/`` reports. Histograms use fixed buckets, so recording is a
+few integer increments and memory is bounded by the number of routes.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("attendance.metrics")
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+# Upper bucket bounds; the last bucket is open-ended
+MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METRIC_BUCKETS = {
+    "total_ms": MS_BUCKETS,
+    "db_ms": MS_BUCKETS,
+    "queries": COUNT_BUCKETS,
+    "face_ms": MS_BUCKETS,
+    "bytes": BYTES_BUCKETS,
+}
+
+
+class RequestMetrics:
+    """Counters for one request; spans are summed by name."""
+
+    __slots__ = ("started", "queries", "db_ms", "spans")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.spans = {}
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(); one call per statement
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - t0) * 1000
+
+    def add_span(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def face_ms(self):
+        # None (not 0) for requests that never touched face recognition
+        face = [ms for name, ms in self.spans.items() if name.startswith("face")]
+        return sum(face) if face else None
+
+
+def current():
+    """The RequestMetrics of the request being served, or None."""
+    return _current.get()
+
+
+def begin():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end(token):
+    _current.reset(token)
+
+
+@contextmanager
+def span(name, **fields):
+    """Time a block as span `name` of the current request.
+
+    Outside a request the block still runs and is logged at DEBUG with its
+    duration and `fields`; nothing else is recorded.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add_span(name, ms)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s %.1fms %s", name, ms, fields, extra={"span": name, "duration_ms": ms, **fields})
+
+
+def server_timing(metrics, total_ms):
+    """Server-Timing header value: db, each span, then total."""
+    parts = [f'db;dur={metrics.db_ms:.1f};desc="{metrics.queries} queries"']
+    parts += [f"{name};dur={ms:.1f}" for name, ms in metrics.spans.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        # Upper bound of the bucket holding the q-th value (max for the open bucket)
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 2) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": round(self.max, 2),
+            "buckets": [
+                [bound, n] for bound, n in zip(list(self.bounds) + ["+Inf"], self.counts)
+            ],
+        }
+
+
+class MetricsRegistry:
+    """Histograms keyed by (route, metric), shared by every thread in the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.since = time.time()
+
+    def record(self, route, values):
+        with self._lock:
+            hists = self._routes.get(route)
+            if hists is None:
+                hists = self._routes[route] = {
+                    name: Histogram(bounds) for name, bounds in METRIC_BUCKETS.items()
+                }
+            for name, value in values.items():
+                if value is not None:
+                    hists[name].add(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "since": self.since,
+                "routes": {
+                    route: {name: hist.as_dict() for name, hist in hists.items()}
+                    for route, hists in sorted(self._routes.items())
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self.since = time.time()
+
+
+registry = MetricsRegistry()
@@ -1,13 +1,80 @@
-import qrcode
+import hashlib
 from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.cache import cache
 from django.core.files import File
+from PIL import Image, ImageDraw, ImageFont
 
-def generate_qr_code(roll_no):
+# Bump when the rendering below changes so cached PNGs and client ETags expire
+QR_RENDER_VERSION = 1
+
+SHEET_DPI = 150
+SHEET_SIZE = (1240, 1754)  # A4 portrait at SHEET_DPI
+SHEET_MARGIN = 60
+SHEET_COLUMNS = 4
+SHEET_ROWS = 5
+
+
+def _qr_image(roll_no):
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(roll_no)
     qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
+    return qr.make_image(fill_color="black", back_color="white").get_image().convert("L")
+
+
+def qr_etag(roll_no):
+    # The QR only encodes the roll number, so roll number + render version identify it
+    return hashlib.sha1(f"{QR_RENDER_VERSION}:{roll_no}".encode()).hexdigest()
+
+
+def render_qr_png(roll_no):
+    """PNG bytes of the student's QR code, rendered once and kept in the cache."""
+    key = f"qr-png:{qr_etag(roll_no)}"
+    png = cache.get(key)
+    if png is None:
+        buffer = BytesIO()
+        _qr_image(roll_no).save(buffer, format="PNG", optimize=True)
+        png = buffer.getvalue()
+        cache.set(key, png, getattr(settings, "QR_CACHE_TIMEOUT", 7 * 24 * 3600))
+    return png
+
+
+def generate_qr_code(roll_no):
+    return File(BytesIO(render_qr_png(roll_no)), name=f"{roll_no}_qr.png")
+
+
+def render_qr_sheet(students, title=""):
+    """Printable A4 PDF with a grid of QR codes labelled with roll no and name.
+
+    `students` is an iterable of (roll_no, name) pairs.
+    """
+    font = ImageFont.load_default()
+    cell_w = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+    cell_h = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // SHEET_ROWS
+    qr_side = min(cell_w, cell_h - 40) - 20
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+
+    pages = []
+    page = draw = None
+    for i, (roll_no, name) in enumerate(students):
+        slot = i % per_page
+        if slot == 0:
+            page = Image.new("L", SHEET_SIZE, 255)
+            draw = ImageDraw.Draw(page)
+            if title:
+                draw.text((SHEET_MARGIN, SHEET_MARGIN // 3), title, fill=0, font=font)
+            pages.append(page)
+        x = SHEET_MARGIN + (slot % SHEET_COLUMNS) * cell_w
+        y = SHEET_MARGIN + (slot // SHEET_COLUMNS) * cell_h
+        qr = _qr_image(roll_no).resize((qr_side, qr_side), Image.NEAREST)
+        page.paste(qr, (x + (cell_w - qr_side) // 2, y))
+        draw.text((x + 10, y + qr_side + 4), str(roll_no), fill=0, font=font)
+        draw.text((x + 10, y + qr_side + 20), str(name)[:32], fill=0, font=font)
 
+    if not pages:
+        pages.append(Image.new("L", SHEET_SIZE, 255))
     buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    return File(buffer, name=f"{roll_no}_qr.png")
+    pages[0].save(buffer, format="PDF", save_all=True, append_images=pages[1:], resolution=SHEET_DPI)
+    return buffer.getvalue()
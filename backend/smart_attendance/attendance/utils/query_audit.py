@@ -0,0 +1,163 @@
+"""EXPLAIN every query the hot attendance endpoints run and flag full scans.
+
+Each endpoint in ``hot_endpoints`` is called through the test client while
+its SQL is captured; every captured statement is then EXPLAINed and any
+plan that reads a whole attendance table (instead of an index range or
+lookup) is reported. Used by ``manage.py audit_attendance_plans`` on a large
+synthetic dataset and by the tests on a small one.
+"""
+from datetime import date, time, timedelta
+
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+
+# Tables that grow with days x students; scans of anything else are fine
+HOT_TABLES = ("attendance_attendance", "attendance_attendancesummary")
+
+
+def seed(students, days, first=date(2020, 1, 6), batch_size=20000):
+    """Create `students` students in 10 class groups and `days` days of
+    attendance for each (~1 in 8 absent, ~1 in 5 late). Returns (first, last)."""
+    from accounts.models import ClassGroup, Student
+    from attendance.models import Attendance
+    from attendance.utils.summary import rebuild_summary
+
+    groups = ClassGroup.objects.bulk_create(ClassGroup(name=f"AUDIT-{g}") for g in range(10))
+    Student.objects.bulk_create(
+        (
+            Student(roll_no=f"AUDIT{i:06d}", name=f"Audit Student {i}", class_group=groups[i % 10])
+            for i in range(students)
+        ),
+        batch_size=5000,
+    )
+    ids = list(Student.objects.filter(roll_no__startswith="AUDIT").values_list("id", flat=True))
+    rows = []
+    for d in range(days):
+        day = first + timedelta(days=d)
+        for n, student_id in enumerate(ids):
+            key = (n + d) % 40
+            if key < 5:
+                rows.append(Attendance(student_id=student_id, date=day, status="absent"))
+            else:
+                late = key < 13
+                rows.append(Attendance(
+                    student_id=student_id, date=day, status="late" if late else "on_time",
+                    time=time(9, 20) if late else time(8, 50),
+                ))
+            if len(rows) >= batch_size:
+                Attendance.objects.bulk_create(rows)
+                rows = []
+    if rows:
+        Attendance.objects.bulk_create(rows)
+    rebuild_summary()
+    collect_stats()
+    return first, first + timedelta(days=days - 1)
+
+
+def can_collect_stats():
+    """False on MySQL: ANALYZE TABLE commits implicitly, which would keep the
+    rows that seed() callers create inside a rolled-back transaction. InnoDB
+    recalculates statistics by itself once enough rows change."""
+    return connection.vendor in ("sqlite", "postgresql")
+
+
+def collect_stats():
+    """Refresh planner statistics for the seeded tables where that is
+    transaction-safe (see can_collect_stats); a no-op elsewhere."""
+    if connection.vendor == "sqlite":
+        sql = "ANALYZE"
+    elif connection.vendor == "postgresql":
+        sql = f"ANALYZE {', '.join(HOT_TABLES + ('accounts_student',))}"
+    else:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+    return True
+
+
+def hot_endpoints(first, last):
+    """(name, url, params) for every endpoint whose queries must stay indexed."""
+    from accounts.models import ClassGroup, Student
+
+    student = Student.objects.filter(roll_no__startswith="AUDIT").order_by("id").first()
+    group = ClassGroup.objects.filter(name__startswith="AUDIT").order_by("id").first()
+    mid = last - timedelta(days=45)
+    return [
+        ("status one student", "/api/attendanceStatus/", {"roll_no": student.roll_no}),
+        ("status list day", "/api/attendanceStatus/list/", {"date": last.isoformat()}),
+        ("status list day+class", "/api/attendanceStatus/list/",
+         {"date": last.isoformat(), "class_id": group.id, "page": 1, "page_size": 50}),
+        ("export range", "/api/attendance/export/",
+         {"date_from": (last - timedelta(days=2)).isoformat(), "date_to": last.isoformat(), "file_format": "csv"}),
+        ("export range+class", "/api/attendance/export/",
+         {"date_from": (last - timedelta(days=6)).isoformat(), "date_to": last.isoformat(),
+          "class_id": group.id, "file_format": "csv"}),
+        ("most absent", "/api/attendance/most-absent/", {"days": 60, "top_n": 10}),
+        ("most absent class", "/api/attendance/most-absent/", {"days": 30, "class_id": group.id}),
+        ("student detail", f"/api/student/{student.roll_no}/attendance/",
+         {"date_from": mid.isoformat(), "date_to": last.isoformat()}),
+        ("student records page", f"/api/student/{student.roll_no}/attendance/",
+         {"cursor": "", "page_size": 30}),
+    ]
+
+
+def explain(sql):
+    """Plan lines for `sql` on the current backend."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == "mysql":
+            cursor.execute(f"EXPLAIN {sql}")
+            columns = [c[0] for c in cursor.description]
+            return [
+                "table={table} type={type} key={key} rows={rows} extra={Extra}".format(**dict(zip(columns, row)))
+                for row in cursor.fetchall()
+            ]
+        cursor.execute(f"EXPLAIN {sql}")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """Plan lines that read an entire hot table."""
+    bad = []
+    for line in plan:
+        if connection.vendor == "sqlite":
+            # "SCAN t" / "SCAN t USING COVERING INDEX i" walk every row; "SEARCH" is a range/lookup
+            words = line.split()
+            if len(words) > 1 and words[0] == "SCAN" and words[1] in HOT_TABLES:
+                bad.append(line)
+        elif connection.vendor == "mysql":
+            fields = dict(part.split("=", 1) for part in line.split(" ") if "=" in part)
+            if fields.get("table") in HOT_TABLES and fields.get("type") in ("ALL", "index"):
+                bad.append(line)
+        elif "Seq Scan" in line and any(t in line for t in HOT_TABLES):
+            bad.append(line)
+    return bad
+
+
+def audit(endpoints):
+    """Call each endpoint, EXPLAIN its queries and return a list of dicts
+    {"endpoint", "status", "sql", "plan", "full_scans"}."""
+    client = Client()
+    results = []
+    for name, url, params in endpoints:
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url, params)
+            if getattr(response, "streaming", False):
+                for _ in response.streaming_content:
+                    pass
+        for query in ctx.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            plan = explain(sql)
+            results.append({
+                "endpoint": name,
+                "status": response.status_code,
+                "sql": sql,
+                "plan": plan,
+                "full_scans": full_scans(plan),
+            })
+    return results
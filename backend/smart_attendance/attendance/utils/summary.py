@@ -0,0 +1,221 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def month_start(d):
+    return d.replace(day=1)
+
+
+def next_month(d):
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _raw_counts(qs, *group_by):
+    """Per-student (or per `group_by`) counts straight from Attendance rows."""
+    return (
+        qs.values(*(group_by or ("student_id",)))
+        .annotate(
+            on_time=Count("id", filter=Q(status="on_time")),
+            late=Count("id", filter=Q(status="late")),
+            first_date=Min("date"),
+            last_date=Max("date"),
+        )
+        .order_by()
+    )
+
+
+def refresh_student_period(student_id, day):
+    """Recompute one student's summary row for the month containing `day`.
+
+    Called from the Attendance signals, so every write touches at most one
+    month of one student (<= 31 rows) instead of the whole history.
+    """
+    from attendance.models import Attendance, AttendanceSummary
+
+    period = month_start(day)
+    counts = next(iter(_raw_counts(
+        Attendance.objects.filter(
+            student_id=student_id, date__gte=period, date__lt=next_month(period)
+        )
+    )), None)
+    with transaction.atomic():
+        if not counts:
+            AttendanceSummary.objects.filter(student_id=student_id, period=period).delete()
+            return
+        AttendanceSummary.objects.update_or_create(
+            student_id=student_id,
+            period=period,
+            defaults={
+                "present_days": counts["on_time"] + counts["late"],
+                "on_time_days": counts["on_time"],
+                "late_days": counts["late"],
+                "first_date": counts["first_date"],
+                "last_date": counts["last_date"],
+            },
+        )
+
+
+def rebuild_summary(since=None):
+    """Rebuild AttendanceSummary from Attendance (optionally only from `since`'s month)."""
+    from attendance.models import Attendance, AttendanceSummary
+
+    attendance = Attendance.objects.all()
+    existing = AttendanceSummary.objects.all()
+    if since:
+        attendance = attendance.filter(date__gte=month_start(since))
+        existing = existing.filter(period__gte=month_start(since))
+
+    rows = _raw_counts(attendance.annotate(period=TruncMonth("date")), "student_id", "period")
+    with transaction.atomic():
+        existing.delete()
+        created = AttendanceSummary.objects.bulk_create(
+            (
+                AttendanceSummary(
+                    student_id=r["student_id"],
+                    period=r["period"],
+                    present_days=r["on_time"] + r["late"],
+                    on_time_days=r["on_time"],
+                    late_days=r["late"],
+                    first_date=r["first_date"],
+                    last_date=r["last_date"],
+                )
+                for r in rows.iterator()
+            ),
+            batch_size=2000,
+        )
+    return len(created)
+
+
+def _split_range(start, end):
+    """Split [start, end] into whole months (read from AttendanceSummary) and
+    partial edge months (read from raw Attendance rows).
+
+    Returns ``(summary_q, edge_q)``; either may be None when that part is empty.
+    """
+    full_from = None if start is None else (start if start.day == 1 else next_month(start))
+    full_to = None if end is None else month_start(end + timedelta(days=1))  # exclusive
+
+    if full_from is not None and full_to is not None and full_from >= full_to:
+        # The range sits inside a single month: raw rows only
+        return None, Q(date__gte=start, date__lte=end)
+
+    summary_q = Q()
+    if full_from is not None:
+        summary_q &= Q(period__gte=full_from)
+    if full_to is not None:
+        summary_q &= Q(period__lt=full_to)
+
+    edges = []
+    if start is not None and start < full_from:
+        edges.append(Q(date__gte=start, date__lt=full_from))
+    if end is not None and full_to <= end:
+        edges.append(Q(date__gte=full_to, date__lte=end))
+    edge_q = None
+    for q in edges:
+        edge_q = q if edge_q is None else edge_q | q
+    return summary_q, edge_q
+
+
+def range_counts(start=None, end=None, **filters):
+    """Return {student_id: {present, on_time, late, first_date, last_date}} for
+    attendance between `start` and `end` (both inclusive, either may be None).
+
+    Whole months are read from AttendanceSummary and only the partial months
+    at either edge of the range fall back to raw Attendance rows, so this is
+    two grouped queries whatever the range length. `filters` are lookups that
+    work on both models, e.g. ``student_id=1`` or ``student__class_group_id=3``.
+    """
+    from attendance.models import Attendance, AttendanceSummary
+
+    result = {}
+
+    def merge(student_id, present, on_time, late, first_date, last_date):
+        row = result.setdefault(student_id, {
+            "present": 0, "on_time": 0, "late": 0, "first_date": None, "last_date": None,
+        })
+        row["present"] += present
+        row["on_time"] += on_time
+        row["late"] += late
+        if first_date and (row["first_date"] is None or first_date < row["first_date"]):
+            row["first_date"] = first_date
+        if last_date and (row["last_date"] is None or last_date > row["last_date"]):
+            row["last_date"] = last_date
+
+    summary_q, edge_q = _split_range(start, end)
+    if summary_q is not None:
+        for r in (
+            AttendanceSummary.objects.filter(summary_q, **filters)
+            .values("student_id")
+            .annotate(
+                present=Sum("present_days"),
+                on_time=Sum("on_time_days"),
+                late=Sum("late_days"),
+                first=Min("first_date"),
+                last=Max("last_date"),
+            )
+            .order_by()
+        ):
+            merge(r["student_id"], r["present"], r["on_time"], r["late"], r["first"], r["last"])
+
+    if edge_q is not None:
+        for r in _raw_counts(Attendance.objects.filter(edge_q, **filters)):
+            merge(
+                r["student_id"], r["on_time"] + r["late"], r["on_time"], r["late"],
+                r["first_date"], r["last_date"],
+            )
+    return result
+
+
+def present_days_expression(start, end):
+    """SQL expression for a Student's present days in [start, end], for use in
+    Student.objects.annotate(). Same summary/edge split as range_counts, as
+    two correlated subqueries, so ranking and limiting happen in the database.
+    """
+    from attendance.models import Attendance, AttendanceSummary
+
+    summary_q, edge_q = _split_range(start, end)
+    parts = []
+    if summary_q is not None:
+        parts.append(Subquery(
+            AttendanceSummary.objects.filter(summary_q, student=OuterRef("pk"))
+            .values("student")
+            .annotate(n=Sum("present_days"))
+            .values("n")[:1],
+            output_field=IntegerField(),
+        ))
+    if edge_q is not None:
+        parts.append(Subquery(
+            Attendance.objects.filter(edge_q, student=OuterRef("pk"))
+            .exclude(status="absent")
+            .values("student")
+            .annotate(n=Count("id"))
+            .values("n")[:1],
+            output_field=IntegerField(),
+        ))
+    expr = Value(0)
+    for part in parts:
+        expr = expr + Coalesce(part, Value(0))
+    return expr
+
+
+def school_days(start, end):
+    """Number of school days in [start, end]: weekdays not in
+    SCHOOL_WEEKLY_OFF_DAYS, minus Holiday rows that fall on those weekdays."""
+    from attendance.models import Holiday
+
+    off_days = set(getattr(settings, "SCHOOL_WEEKLY_OFF_DAYS", []))
+    if end < start:
+        return 0
+    total = (end - start).days + 1
+    full_weeks, rest = divmod(total, 7)
+    count = full_weeks * (7 - len(off_days))
+    for i in range(rest):
+        if (start + timedelta(days=full_weeks * 7 + i)).weekday() not in off_days:
+            count += 1
+    holidays = Holiday.objects.filter(date__range=(start, end)).values_list("date", flat=True)
+    count -= sum(1 for d in holidays if d.weekday() not in off_days)
+    return count
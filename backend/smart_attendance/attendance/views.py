@@ -1,19 +1,41 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .utils.face_utils import match_face
+from .utils.face_utils import (
+    accept_identified,
+    identify_face,
+    identify_match,
+    match_face,
+    parse_face_box,
+    preprocess_config,
+    read_upload,
+)
 from accounts.models import Student
+from accounts.pagination import AttendanceRecordCursorPagination
+from accounts.views import StandardResultsSetPagination
 from .models import Attendance, AdminSetting, AdminToken
 from django.utils import timezone
+import csv
+import itertools
 import os
-from django.db.models import Count
+import tempfile
+from django.db.models import Count, F, FilteredRelation, Q
 from django.utils import timezone
 from datetime import timedelta, date
 from accounts.models import Student
 import openpyxl
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
 from datetime import time as datetime_time
 
-from .utils.image_store import save_attendance_image_from_path
+from .utils.admin_tokens import is_token_valid, purge_expired, remember_token, revoke_all
+from .utils.encoding_pool import EncoderBusy, EncoderTimeout, encoder_unavailable_response
+from .utils.image_store import archive_attendance_image
+from .utils.background import background, run_blocking
+from .utils.face_index import face_index
+from .utils.mark_lock import async_marking_lock, marking_lock
+from .utils.metrics import registry as metrics_registry, span
+from .utils.summary import present_days_expression, range_counts, school_days
 from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
 import secrets
@@ -69,7 +91,16 @@ class AttendanceStatus(APIView):
         return Response(response_data)
 
 class AttendanceStatusList(APIView):
-    """List attendance status for all students for a given date (defaults to today)"""
+    """List attendance status for all students for a given date (defaults to today).
+
+    Query params:
+      - date (YYYY-MM-DD, optional)
+      - class_id, batch, department (ids, optional filters)
+      - page / page_size (optional; without them every student is returned)
+
+    Today's attendance row is LEFT JOINed onto each student, so the whole
+    list is one query (plus a COUNT when paginated) whatever the roster size.
+    """
     def get(self, request):
         # Accept optional `date` query param (YYYY-MM-DD). If provided and valid, use it.
         date_str = request.query_params.get("date")
@@ -82,186 +113,541 @@ class AttendanceStatusList(APIView):
             # invalid format -> respond with 400
             return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
         
-        students = Student.objects.select_related('class_group', 'batch', 'department').all()
-        
+        students = (
+            Student.objects.select_related('class_group', 'batch', 'department')
+            .annotate(day_att=FilteredRelation('attendance', condition=Q(attendance__date=today)))
+            .annotate(
+                att_id=F('day_att__id'),
+                att_time=F('day_att__time'),
+                att_status=F('day_att__status'),
+            )
+            .order_by('roll_no')
+        )
+        class_id = request.query_params.get("class_id")
+        batch = request.query_params.get("batch")
+        dept = request.query_params.get("department")
+        if class_id:
+            students = students.filter(class_group_id=class_id)
+        if batch:
+            students = students.filter(batch_id=batch)
+        if dept:
+            students = students.filter(department_id=dept)
+
+        paginator = None
+        if "page" in request.query_params or "page_size" in request.query_params:
+            paginator = StandardResultsSetPagination()
+            students = paginator.paginate_queryset(students, request, view=self)
+
         result = []
         for student in students:
-            att = Attendance.objects.filter(student=student, date=today).first()
-            exists = att is not None
+            exists = student.att_id is not None
             
             result.append({
-                "id": att.id if att else student.id,
+                "id": student.att_id if exists else student.id,
                 "roll_no": student.roll_no,
                 "name": student.name,
                 "class": student.class_group.name if student.class_group else None,
                 "batch": student.batch.name if student.batch else None,
                 "department": student.department.name if student.department else None,
                 "alreadyMarked": exists,
-                "time": att.time.isoformat() if att and att.time else None,
-                "status": att.status if att else "absent",
+                "time": student.att_time.isoformat() if student.att_time else None,
+                "status": student.att_status if exists else "absent",
             })
         
+        if paginator is not None:
+            return paginator.get_paginated_response(result)
         return Response({"results": result})
 
+def _status_for(now_time):
+    # Compute status based on time
+    CUTOFF_TIME = datetime_time(9, 0)
+    LATE_TIME = datetime_time(9, 30)
+    if now_time <= CUTOFF_TIME:
+        return "on_time"
+    elif now_time <= LATE_TIME:
+        return "late"
+    else:
+        return "late"
+
+def _marked_payload(student, attendance, message):
+    return {
+        "message": message,
+        "name": student.name,
+        "roll_no": student.roll_no,
+        "class": student.class_group.name if student.class_group else None,
+        "batch": student.batch.name if student.batch else None,
+        "department": student.department.name if student.department else None,
+        "time": attendance.time.isoformat() if attendance.time else None,
+        "status": attendance.status,
+    }
+
+IN_PROGRESS_ERROR = "Attendance is already being marked for this student, please retry"
+
 class MarkAttendance(APIView):
+    """
+    POST /api/attendance/          Body: roll_no, image (1:1 verification)
+    POST /api/attendance/identify/ Body: image, optional roll_no (1:N identification)
+
+    In identify mode the student is looked up from the face alone through the
+    process-wide encoding index, so kiosks don't need a roll number or QR scan.
+
+    Optional ``face_box`` ("top,right,bottom,left" as 0-1 fractions of the
+    frame) lets a client that already ran face detection skip it server side.
+
+    The upload is read once and decoded straight into a NumPy array; that one
+    frame is used for detection and encoding and the original bytes are
+    archived, so nothing is written to a shared temp path. With
+    ATTENDANCE_ARCHIVE_MODE = "crop" only the matched face is archived,
+    cut from that same frame, along with its box and match distance.
+
+    Marking is idempotent: a student already marked today gets the existing
+    record back before any image work, a second request racing the first is
+    turned away with 409 by a per-roll-number lock (utils.mark_lock), and
+    the row itself is written with get_or_create on (student, date).
+    """
+    identify = False
+
     def post(self, request):
-        print("Received attendance request")
         roll_no = request.data.get('roll_no')
         image = request.FILES.get('image')
-        print(f"Roll No: {roll_no}, Image: {image}")
+        face_box = parse_face_box(request.data.get('face_box'))
+
+        if self.identify and not roll_no:
+            return self._identify_and_mark(image, face_box)
 
         if not roll_no or not image:
-            print("Error: Missing roll_no or image")
             return Response({"error": "Roll number and image are required"}, status=400)
 
         try:
-            student = Student.objects.get(roll_no=roll_no)
+            student = Student.objects.select_related('class_group', 'batch', 'department').get(roll_no=roll_no)
         except Student.DoesNotExist:
-            print(f"Error: Student with roll_no {roll_no} not found")
+            logger.info("Attendance for unknown roll_no %s", roll_no)
             return Response({"error": "Student not found"}, status=404)
 
-        # Check if attendance is already marked for today
-        today = timezone.now().date()
-        existing_att = Attendance.objects.filter(student=student, date=today).first()
+        # Cheap checks first: a repeat tap never reaches face recognition
+        today = timezone.localdate()
+        with span("lookup"):
+            existing_att = Attendance.objects.filter(student=student, date=today).first()
         if existing_att:
-            # Return existing attendance without modification
-            return Response({
-                "message": "Attendance already marked today",
-                "name": student.name,
-                "roll_no": student.roll_no,
-                "class": student.class_group.name if student.class_group else None,
-                "batch": student.batch.name if student.batch else None,
-                "department": student.department.name if student.department else None,
-                "time": existing_att.time.isoformat() if existing_att.time else None,
-                "status": existing_att.status,
-            })
-        
-        if not student.face_encoding:
-            print(f"Error: Student {student.roll_no} has no face encoding. Register via /register/ API or fix with management command.")
+            return self._marked_response(student, existing_att, "Attendance already marked today")
+
+        with marking_lock(student.roll_no, today) as acquired:
+            if not acquired:
+                return self._in_progress_response()
+            # Again under the lock: the request that held it until just now may have marked
+            with span("lookup"):
+                existing_att = Attendance.objects.filter(student=student, date=today).first()
+            if existing_att:
+                return self._marked_response(student, existing_att, "Attendance already marked today")
+            return self._verify_and_mark(student, image, face_box)
+
+    def _verify_and_mark(self, student, image, face_box):
+        if not student.has_valid_encoding:
+            logger.info("Student %s has no usable face encoding (%s)", student.roll_no, student.encoding_state)
             return Response({"error": "Student has no face encoding. Register via /register/ API or fix with management command."}, status=400)
 
-        # Ensure directory exists
-        os.makedirs("media/temp", exist_ok=True)
-
-        # Save uploaded image temporarily
-        path = f"media/temp/{roll_no}.jpg"
-        with open(path, 'wb+') as f:
-            for chunk in image.chunks():
-                f.write(chunk)
+        # Decode the upload once, in memory
+        decoded = _decode_upload(image)
+        if decoded is None:
+            return Response({"error": "Invalid image"}, status=400)
+        raw, frame = decoded
 
         # Match face with student
         try:
-            print(f"Matching face for student: {student.name} ({student.roll_no})")
-            matched_student = match_face(path, [student])
-            print(f"Match result: {matched_student}")
-            if matched_student == "no_face":
-                print("Error: No face detected in image")
+            result = match_face(frame, [student], face_box=face_box)
+            if result.no_face:
                 return Response({"error": "No face detected in image"}, status=400)
+        except (EncoderBusy, EncoderTimeout) as e:
+            return encoder_unavailable_response(e)
         except Exception as e:
-            print(f"Exception during face matching: {e}")
+            logger.exception("Face matching failed for %s", student.roll_no)
             return Response({"error": f"Error processing image: {str(e)}"}, status=500)
 
-        if matched_student:
-            today = timezone.localdate()
-            now_time = timezone.localtime(timezone.now()).time()
-            
-            # Compute status based on time
-            CUTOFF_TIME = datetime_time(9, 0)
-            LATE_TIME = datetime_time(9, 30)
-            if now_time <= CUTOFF_TIME:
-                status = "on_time"
-            elif now_time <= LATE_TIME:
-                status = "late"
-            else:
-                status = "late"
-            
-            # Create attendance record
-            attendance = Attendance.objects.create(
+        if result.matched:
+            return self._mark(student, raw, frame, result)
+        else:
+            return Response({"error": "Face did not match"}, status=400)
+
+    def _identify_and_mark(self, image, face_box=None):
+        if not image:
+            return Response({"error": "Image is required"}, status=400)
+
+        decoded = _decode_upload(image)
+        if decoded is None:
+            return Response({"error": "Invalid image"}, status=400)
+        raw, frame = decoded
+
+        try:
+            result = identify_face(frame, face_box=face_box)
+            if result.no_face:
+                return Response({"error": "No face detected in image"}, status=400)
+        except (EncoderBusy, EncoderTimeout) as e:
+            return encoder_unavailable_response(e)
+        except Exception as e:
+            logger.exception("Face identification failed")
+            return Response({"error": f"Error processing image: {str(e)}"}, status=500)
+
+        if not result.matched:
+            return Response({"error": "Face not recognised"}, status=404)
+
+        # The student is only known after recognition here, so the insert
+        # itself (get_or_create on the unique (student, date)) dedupes
+        return self._mark(result.student, raw, frame, result)
+
+    def _mark(self, student, raw, frame=None, result=None):
+        today = timezone.localdate()
+        now_time = timezone.localtime(timezone.now()).time()
+        status = _status_for(now_time)
+
+        # One INSERT guarded by unique_together(student, date); a concurrent
+        # request that got there first makes this a plain read instead of an
+        # IntegrityError
+        with span("insert"):
+            attendance, created = Attendance.objects.get_or_create(
                 student=student,
                 date=today,
-                time=now_time,
-                status=status,
-                already_marked=True,
+                defaults=_attendance_defaults(now_time, status, result),
             )
-            
-            try:
-                saved_path = save_attendance_image_from_path(path, roll_no)
-                logger.info(f"Saved attendance image to {saved_path}")
-            except Exception as e:
-                logger.exception("Failed to save attendance image: %s", e)
-            finally:
-                try:
-                    if os.path.exists(path):
-                        os.remove(path)
-                except Exception:
-                    pass
-
-            print(f"Attendance marked for {student.name}")
-            return Response({
-                "message": f"Attendance marked for {student.name}",
-                "name": student.name,
-                "roll_no": student.roll_no,
-                "class": student.class_group.name if student.class_group else None,
-                "batch": student.batch.name if student.batch else None,
-                "department": student.department.name if student.department else None,
-                "time": attendance.time.isoformat() if attendance.time else None,
-                "status": attendance.status,
-            })
-        else:
-            print("Error: Face did not match")
-            try:
-                if os.path.exists(path):
-                    os.remove(path)
-            except Exception:
-                pass
-            return Response({"error": "Face did not match"}, status=400)
+        if not created:
+            return self._marked_response(student, attendance, "Attendance already marked today")
+
+        try:
+            _archive_image(attendance, raw, frame, result)
+        except Exception as e:
+            logger.exception("Failed to save attendance image: %s", e)
+
+        logger.info(
+            "Attendance marked for %s (%s)", student.roll_no, status,
+            extra={"roll_no": student.roll_no, "status": status},
+        )
+        return self._marked_response(student, attendance, f"Attendance marked for {student.name}")
+
+    @staticmethod
+    def _marked_response(student, attendance, message):
+        return Response(_marked_payload(student, attendance, message))
+
+    @staticmethod
+    def _in_progress_response():
+        resp = Response({"error": IN_PROGRESS_ERROR}, status=409)
+        resp["Retry-After"] = "1"
+        return resp
+
+
+def _decode_upload(image):
+    # Shared by the sync and async marking views: one in-memory decode, capped
+    # at FACE_MAX_IMAGE_SIDE. Returns (raw, frame), or None if the upload is
+    # not a readable image.
+    try:
+        with span("decode"):
+            return read_upload(image, max_side=preprocess_config()["FACE_MAX_IMAGE_SIDE"])
+    except Exception as e:
+        logger.info("Could not decode attendance image: %s", e)
+        return None
+
+def _attendance_defaults(now_time, status, result):
+    defaults = {"time": now_time, "status": status, "already_marked": True}
+    if result is not None:
+        defaults.update(match_distance=result.distance, match_tolerance=result.tolerance)
+    return defaults
+
+def _archive_image(attendance, raw, frame=None, result=None):
+    with span("archive"):
+        archived = archive_attendance_image(
+            attendance, raw, frame=frame,
+            location=result.location if result else None,
+            distance=result.distance if result else None,
+        )
+    logger.info(f"Saved attendance image to {archived.path}")
+
+
+class AsyncMarkAttendance(View):
+    """
+    POST /api/attendance/async/          Body: roll_no, image (1:1 verification)
+    POST /api/attendance/identify/async/ Body: image, optional roll_no (1:N identification)
+
+    Same requests and responses as MarkAttendance, as a native async view for
+    ASGI deployments (smart_attendance.asgi). Queries use the async ORM,
+    image decoding and face recognition run on a bounded thread pool
+    (utils.background.run_blocking), and the response is sent as soon as
+    the Attendance row is committed; the upload is archived afterwards by
+    the background queue. Waiting requests hold no thread, so one worker
+    can keep many kiosk requests in flight.
+    """
+    identify = False
+    http_method_names = ["post", "options"]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Kiosk endpoints carry no session, like the (csrf-exempt) DRF views
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request):
+        roll_no = request.POST.get('roll_no')
+        image = request.FILES.get('image')
+        face_box = parse_face_box(request.POST.get('face_box'))
+
+        if self.identify and not roll_no:
+            return await self._identify_and_mark(image, face_box)
+
+        if not roll_no or not image:
+            return JsonResponse({"error": "Roll number and image are required"}, status=400)
+
+        student = await Student.objects.select_related('class_group', 'batch', 'department').filter(roll_no=roll_no).afirst()
+        if student is None:
+            logger.info("Attendance for unknown roll_no %s", roll_no)
+            return JsonResponse({"error": "Student not found"}, status=404)
+
+        # Cheap checks first: a repeat tap never reaches face recognition
+        today = timezone.localdate()
+        with span("lookup"):
+            existing_att = await Attendance.objects.filter(student=student, date=today).afirst()
+        if existing_att:
+            return JsonResponse(_marked_payload(student, existing_att, "Attendance already marked today"))
+
+        async with async_marking_lock(student.roll_no, today) as acquired:
+            if not acquired:
+                resp = JsonResponse({"error": IN_PROGRESS_ERROR}, status=409)
+                resp["Retry-After"] = "1"
+                return resp
+            # Again under the lock: the request that held it until just now may have marked
+            with span("lookup"):
+                existing_att = await Attendance.objects.filter(student=student, date=today).afirst()
+            if existing_att:
+                return JsonResponse(_marked_payload(student, existing_att, "Attendance already marked today"))
+            return await self._verify_and_mark(student, image, face_box)
+
+    async def _verify_and_mark(self, student, image, face_box):
+        if not student.has_valid_encoding:
+            logger.info("Student %s has no usable face encoding (%s)", student.roll_no, student.encoding_state)
+            return JsonResponse({"error": "Student has no face encoding. Register via /register/ API or fix with management command."}, status=400)
+
+        decoded = await run_blocking(_decode_upload, image)
+        if decoded is None:
+            return JsonResponse({"error": "Invalid image"}, status=400)
+        raw, frame = decoded
+
+        try:
+            result = await run_blocking(match_face, frame, [student], face_box=face_box)
+            if result.no_face:
+                return JsonResponse({"error": "No face detected in image"}, status=400)
+        except (EncoderBusy, EncoderTimeout) as e:
+            return encoder_unavailable_response(e, JsonResponse)
+        except Exception as e:
+            logger.exception("Face matching failed for %s", student.roll_no)
+            return JsonResponse({"error": f"Error processing image: {str(e)}"}, status=500)
+
+        if not result.matched:
+            return JsonResponse({"error": "Face did not match"}, status=400)
+        return await self._mark(student, raw, frame, result)
+
+    async def _identify_and_mark(self, image, face_box=None):
+        if not image:
+            return JsonResponse({"error": "Image is required"}, status=400)
+
+        decoded = await run_blocking(_decode_upload, image)
+        if decoded is None:
+            return JsonResponse({"error": "Invalid image"}, status=400)
+        raw, frame = decoded
+
+        try:
+            # (Re)loading the index queries the DB, so it stays on the ORM's thread
+            await sync_to_async(face_index.ensure_loaded)()
+            result = await run_blocking(identify_match, frame, face_box=face_box)
+            if result.no_face:
+                return JsonResponse({"error": "No face detected in image"}, status=400)
+        except (EncoderBusy, EncoderTimeout) as e:
+            return encoder_unavailable_response(e, JsonResponse)
+        except Exception as e:
+            logger.exception("Face identification failed")
+            return JsonResponse({"error": f"Error processing image: {str(e)}"}, status=500)
+
+        if result.student_id is not None:
+            student = await Student.objects.select_related('class_group', 'batch', 'department').filter(pk=result.student_id).afirst()
+            if student is not None:
+                accept_identified(result, student)
+        if not result.matched:
+            return JsonResponse({"error": "Face not recognised"}, status=404)
+        return await self._mark(result.student, raw, frame, result)
+
+    async def _mark(self, student, raw, frame=None, result=None):
+        today = timezone.localdate()
+        now_time = timezone.localtime(timezone.now()).time()
+        status = _status_for(now_time)
+
+        # Autocommit: the row is committed when aget_or_create returns
+        with span("insert"):
+            attendance, created = await Attendance.objects.aget_or_create(
+                student=student,
+                date=today,
+                defaults=_attendance_defaults(now_time, status, result),
+            )
+        if not created:
+            return JsonResponse(_marked_payload(student, attendance, "Attendance already marked today"))
+
+        background.submit(_archive_image, attendance, raw, frame, result)
+        logger.info(
+            "Attendance marked for %s (%s)", student.roll_no, status,
+            extra={"roll_no": student.roll_no, "status": status},
+        )
+        return JsonResponse(_marked_payload(student, attendance, f"Attendance marked for {student.name}"))
 
 
 class MostAbsentAPIView(APIView):
+    """
+    GET /api/attendance/most-absent/
+    Query params:
+      - days (lookback, default 7)
+      - class_id, batch, department (ids, optional filters)
+      - top_n (optional limit on the ranking)
+      - page / page_size (optional pagination)
+
+    Absences are counted against school days (weekly off days and Holiday rows
+    excluded), and the ranking is one SQL query: present days come from
+    correlated subqueries on AttendanceSummary (plus raw rows for partial
+    months), ordered and limited in the database.
+    """
     def get(self, request):
-        days = int(request.query_params.get("days", 7))
+        try:
+            days = int(request.query_params.get("days", 7))
+            top_n = int(request.query_params["top_n"]) if request.query_params.get("top_n") else None
+        except ValueError:
+            return Response({"error": "days and top_n must be integers"}, status=400)
+        if days < 1 or (top_n is not None and top_n < 1):
+            return Response({"error": "days and top_n must be positive"}, status=400)
         class_id = request.query_params.get("class_id")  # optional filter
+        batch = request.query_params.get("batch")
+        dept = request.query_params.get("department")
         end = timezone.localdate()
         start = end - timedelta(days=days-1)
-        # count present per student in range:
-        present_qs = Attendance.objects.filter(date__range=(start, end))
-        if class_id:
-            present_qs = present_qs.filter(student__class_group_id=class_id)
-        present_counts = present_qs.values('student_id', 'student__roll_no', 'student__name', 'student__class_group__name')\
-                                   .annotate(presents=Count('id'))
-        # build dict by student
-        presents_map = {p['student_id']: p for p in present_counts}
-        # students to evaluate
+        total_days = school_days(start, end)
+
         students = Student.objects.all()
         if class_id:
             students = students.filter(class_group_id=class_id)
-        total_days = days
-        result = []
-        for s in students:
-            p = presents_map.get(s.id)
-            presents = p['presents'] if p else 0
-            absences = total_days - presents
-            result.append({"roll_no": s.roll_no, "name": s.name, "class": s.class_group and s.class_group.name, "presents": presents, "absences": absences})
-        # sort by absences desc
-        result.sort(key=lambda x: x['absences'], reverse=True)
-        return Response({"period_days": total_days, "start": start, "end": end, "data": result})
+        if batch:
+            students = students.filter(batch_id=batch)
+        if dept:
+            students = students.filter(department_id=dept)
+        ranking = (
+            students.annotate(presents=present_days_expression(start, end))
+            .order_by("presents", "roll_no")
+            .values("roll_no", "name", "class_group__name", "presents")
+        )
+        if top_n:
+            ranking = ranking[:top_n]
+
+        paginator = None
+        if "page" in request.query_params or "page_size" in request.query_params:
+            paginator = StandardResultsSetPagination()
+            ranking = paginator.paginate_queryset(ranking, request, view=self)
+
+        result = [
+            {
+                "roll_no": r["roll_no"],
+                "name": r["name"],
+                "class": r["class_group__name"],
+                "presents": r["presents"],
+                "absences": max(total_days - r["presents"], 0),
+            }
+            for r in ranking
+        ]
+        payload = {"period_days": days, "school_days": total_days, "start": start, "end": end, "data": result}
+        if paginator is not None:
+            payload.update(count=paginator.page.paginator.count,
+                           next=paginator.get_next_link(),
+                           previous=paginator.get_previous_link())
+        return Response(payload)
+
+class _Echo:
+    """File-like object whose write() just returns the value, for csv.writer streaming."""
+    def write(self, value):
+        return value
+
 
 class ExportAttendanceExcelAPIView(APIView):
+    """
+    GET /api/attendance/export/
+    Query params:
+      - date_from / date_to (YYYY-MM-DD, optional; default is the last `days` days)
+      - days (default 7)
+      - class_id, department (ids, optional filters)
+      - file_format ("xlsx" default, or "csv")
+
+    Rows are read with .values_list().iterator() so no model instances are
+    built. CSV is streamed straight to the client; XLSX uses openpyxl's
+    write-only mode spooled to a temp file, so memory stays flat however
+    many rows are exported.
+    """
+    HEADER = ["Date", "Roll No", "Name", "Class", "Present"]
+    CHUNK_SIZE = 2000
+
     def get(self, request):
-        days = int(request.query_params.get("days", 7))
-        end = timezone.localdate()
-        start = end - timedelta(days=days-1)
-        qs = Attendance.objects.filter(date__range=(start, end)).select_related('student','student__class_group')
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.append(["Date","Roll No","Name","Class","Present"])
-        for a in qs.order_by('date'):
-            ws.append([a.date.isoformat(), a.student.roll_no, a.student.name, a.student.class_group and a.student.class_group.name or "", bool(a.status)])
-        resp = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        resp['Content-Disposition'] = f'attachment; filename=attendance_{start}_{end}.xlsx'
-        wb.save(resp)
+        try:
+            start, end = self._date_range(request)
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+
+        qs = Attendance.objects.filter(date__range=(start, end))
+        class_id = request.query_params.get("class_id")
+        dept = request.query_params.get("department")
+        if class_id:
+            qs = qs.filter(student__class_group_id=class_id)
+        if dept:
+            qs = qs.filter(student__department_id=dept)
+        # (date, student) order walks attendance_date_idx, no sort step
+        rows = qs.order_by("date", "student_id").values_list(
+            "date", "student__roll_no", "student__name", "student__class_group__name", "status"
+        ).iterator(chunk_size=self.CHUNK_SIZE)
+
+        filename = f"attendance_{start}_{end}"
+        if request.query_params.get("file_format") == "csv":
+            return self._csv_response(rows, filename)
+        return self._xlsx_response(rows, filename)
+
+    def _date_range(self, request):
+        date_from = request.query_params.get("date_from")
+        date_to = request.query_params.get("date_to")
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else timezone.localdate()
+        if date_from:
+            start = datetime.strptime(date_from, "%Y-%m-%d").date()
+        else:
+            days = int(request.query_params.get("days", 7))
+            start = end - timedelta(days=days-1)
+        return start, end
+
+    @staticmethod
+    def _row(values):
+        d, roll_no, name, class_name, status = values
+        return [d.isoformat(), roll_no, name, class_name or "", status != "absent"]
+
+    def _csv_response(self, rows, filename):
+        writer = csv.writer(_Echo())
+        lines = itertools.chain(
+            [writer.writerow(self.HEADER)],
+            (writer.writerow(self._row(r)) for r in rows),
+        )
+        resp = StreamingHttpResponse(lines, content_type="text/csv")
+        resp['Content-Disposition'] = f'attachment; filename={filename}.csv'
         return resp
 
+    def _xlsx_response(self, rows, filename):
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(self.HEADER)
+        for r in rows:
+            ws.append(self._row(r))
+        tmp = tempfile.TemporaryFile()
+        wb.save(tmp)
+        tmp.seek(0)
+        return FileResponse(
+            tmp,
+            as_attachment=True,
+            filename=f"{filename}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
 from rest_framework import status
 from django.db.models import Q
 from rest_framework import generics
@@ -273,6 +659,9 @@ class StudentAttendanceDetail(APIView):
     Query params:
       - date_from (YYYY-MM-DD, optional)
       - date_to (YYYY-MM-DD, optional)
+      - cursor (optional; present, even empty, to page the records by
+        (date, id) newest first, with next/previous links in the response)
+      - page_size (optional, with cursor)
     """
     def get(self, request, roll_no):
         date_from = request.GET.get("date_from")
@@ -296,44 +685,42 @@ class StudentAttendanceDetail(APIView):
         except ValueError:
             return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
 
+        # Counts come from the monthly summary table (plus raw rows for partial
+        # months), not from re-reading every Attendance row.
+        counts = range_counts(start, end, student_id=student.id).get(student.id)
+
         if start is None or end is None:
-            if qs.exists():
-                start = qs.order_by("date").first().date
-                end = qs.order_by("-date").first().date
+            if counts:
+                start = counts["first_date"]
+                end = counts["last_date"]
 
-        # Build date range and counts
-        all_dates = []
+        present_days = counts["present"] if counts else 0
         if start and end and end >= start:
-            delta = (end - start).days
-            all_dates = [start + timedelta(days=i) for i in range(delta + 1)]
-
-        present_days = qs.count()
-        present_dates = set(qs.values_list("date", flat=True))
-        absent_days = len([d for d in all_dates if d not in present_dates]) if all_dates else 0
-        total_days = len(all_dates) if all_dates else present_days
-
-        # Status breakdown - now use the status field directly from model
-        status_counts = {"on_time": 0, "late": 0}
+            total_days = (end - start).days + 1
+            absent_days = total_days - present_days
+        else:
+            total_days = present_days
+            absent_days = 0
 
-        for att in qs:
-            if att.status == "on_time":
-                status_counts["on_time"] += 1
-            elif att.status == "late":
-                status_counts["late"] += 1
+        rows = qs.order_by("-date", "-id").values("id", "date", "time", "status")
+        paginator = None
+        if "cursor" in request.query_params:
+            paginator = AttendanceRecordCursorPagination()
+            rows = paginator.paginate_queryset(rows, request, self)
 
         # Build records with id field for editing
         records = [
             {
-                "id": a.id,
-                "attendanceId": a.id,  # alias for compatibility
-                "date": a.date.isoformat(),
-                "time": (a.time.isoformat() if a.time else None),
-                "status": a.status,
+                "id": a["id"],
+                "attendanceId": a["id"],  # alias for compatibility
+                "date": a["date"].isoformat(),
+                "time": (a["time"].isoformat() if a["time"] else None),
+                "status": a["status"],
             }
-            for a in qs.order_by("-date")
+            for a in rows
         ]
 
-        return Response({
+        data = {
             "roll_no": student.roll_no,
             "name": student.name,
             "class": student.class_group.name if student.class_group else None,
@@ -341,11 +728,15 @@ class StudentAttendanceDetail(APIView):
             "department": student.department.name if student.department else None,
             "present_days": present_days,
             "absent_days": absent_days,
-            "on_time_days": status_counts["on_time"],
-            "late_days": status_counts["late"],
+            "on_time_days": counts["on_time"] if counts else 0,
+            "late_days": counts["late"] if counts else 0,
             "total_days": total_days,
             "records": records,
-        })
+        }
+        if paginator is not None:
+            data["next"] = paginator.get_next_link()
+            data["previous"] = paginator.get_previous_link()
+        return Response(data)
 
 class AttendanceUpdateAPIView(generics.RetrieveUpdateAPIView):
     queryset = Attendance.objects.all()
@@ -383,6 +774,9 @@ class AdminAuthAPIView(APIView):
 
         key = secrets.token_hex(32)
         token = AdminToken.objects.create(key=key)
+        remember_token(token)
+        # Logins are rare, so this is a cheap place to drop expired rows too
+        purge_expired()
         return Response({"token": token.key})
 
 class AdminAuthValidateAPIView(APIView):
@@ -395,12 +789,8 @@ class AdminAuthValidateAPIView(APIView):
         token_key = request.headers.get("X-Admin-Token") or request.query_params.get("token")
         if not token_key:
             return Response({"valid": False}, status=401)
-        try:
-            token = AdminToken.objects.get(key=token_key)
-        except AdminToken.DoesNotExist:
-            return Response({"valid": False}, status=401)
-        if token.is_expired():
-            token.delete()
+        # Served from the token cache; expired rows are removed by purge_expired()
+        if not is_token_valid(token_key):
             return Response({"valid": False}, status=401)
         return Response({"valid": True})
 
@@ -429,6 +819,9 @@ class AdminPinAPIView(APIView):
         else:
             setting.pin_hash = hashed
             setting.save()
+
+        # Sessions issued under the old PIN are revoked (and dropped from the token cache)
+        revoke_all()
         return Response({"message": "PIN updated"}, status=200)
 
 # --- DEBUG-only reset endpoint ---
@@ -454,9 +847,33 @@ class AdminPinResetAPIView(APIView):
             setting.save()
 
         # Revoke any existing admin tokens so clients must re-authenticate
-        AdminToken.objects.all().delete()
+        revoke_all()
 
         return Response({
             "message": "Admin PIN reset to default (DEBUG only).",
             "default_pin": self.DEFAULT_RESET_PIN,
-        })
\ No newline at end of file
+        })
+
+class RequestMetricsAPIView(APIView):
+    """
+    GET    /api/metrics/   per-route histograms of total_ms, db_ms, queries,
+                           face_ms and bytes since start-up (or the last reset)
+    DELETE /api/metrics/   reset them
+    Header: X-Admin-Token: <token>
+
+    Figures are per worker process (see attendance.middleware); for a fleet-wide
+    view ship the attendance.metrics log lines instead.
+    """
+    def _authorised(self, request):
+        return is_token_valid(request.headers.get("X-Admin-Token"))
+
+    def get(self, request):
+        if not self._authorised(request):
+            return Response({"error": "Admin token required"}, status=401)
+        return Response(metrics_registry.snapshot())
+
+    def delete(self, request):
+        if not self._authorised(request):
+            return Response({"error": "Admin token required"}, status=401)
+        metrics_registry.reset()
+        return Response(status=204)
@@ -57,6 +57,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
 MIDDLEWARE = [
+    'attendance.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -112,6 +113,15 @@ DATABASES = {
     }
 }
 
+# Local runs and benchmarks without a MySQL server
+if os.environ.get('SMART_ATTENDANCE_SQLITE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -154,3 +164,102 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Face recognition
+# In-memory encoding index used by /api/attendance/identify/. Each worker keeps
+# its own copy; signals patch it on local writes and it is fully reloaded after
+# this many seconds so writes from other workers are picked up (0 = never).
+FACE_INDEX_REFRESH_SECONDS = 300
+
+# Preprocessing before face detection/encoding (see attendance.utils.face_utils).
+# Benchmark changes with: python manage.py bench_face_pipeline <fixtures_dir>
+FACE_DETECTOR_MODEL = 'hog'   # 'hog' or 'cnn'
+FACE_UPSAMPLE = 1             # detector upsampling passes
+FACE_MAX_IMAGE_SIDE = 640     # downscale frames so the longest side is <= this (None = full size);
+                              # registration photos are always encoded at full size
+FACE_CENTER_ROI = None        # e.g. 0.6 to detect only in the central 60% of the frame
+FACE_TARGET_SIZE = 150        # face height in px when the client sends a face_box
+FACE_NUM_JITTERS = 1
+
+# Process pool for dlib detection/encoding (attendance.utils.encoding_pool).
+# Each Django worker process owns its own pool; request threads just wait on a
+# future, so run gunicorn with --threads to keep light endpoints responsive.
+# FACE_POOL_WORKERS = 0 encodes inline in the request thread, with no 503/504
+# backpressure. The pool starts on the first encode in each worker process; to
+# start it at boot instead, call encoding_pool.warm() from gunicorn's
+# post_worker_init hook (not at import time, which --preload runs in the master).
+FACE_POOL_WORKERS = int(os.environ.get('FACE_POOL_WORKERS', min(2, os.cpu_count() or 1)))
+FACE_POOL_MAX_PENDING = int(os.environ.get('FACE_POOL_MAX_PENDING', 8))  # running + queued jobs before 503
+FACE_POOL_TIMEOUT = 10        # seconds per encoding job before 504
+FACE_POOL_RETRY_AFTER = 2     # Retry-After seconds sent with 503
+FACE_POOL_START_METHOD = 'spawn'
+
+# School calendar used for absence counts: weekly off days (Monday=0 ... Sunday=6)
+# on top of the dates in the attendance.Holiday table.
+SCHOOL_WEEKLY_OFF_DAYS = [5]  # Saturday
+
+# Admin token validation cache (attendance.utils.admin_tokens). Validity is kept
+# in-process for ADMIN_TOKEN_CACHE_TTL seconds; set ADMIN_TOKEN_SHARED_CACHE to a
+# CACHES alias (e.g. a Redis/Memcached 'default') to share it and PIN-change
+# revocation across workers.
+ADMIN_TOKEN_CACHE_TTL = 60
+ADMIN_TOKEN_CACHE_SIZE = 1024
+ADMIN_TOKEN_SHARED_CACHE = None
+
+# Processes used by manage.py import_students (None = all cores); the import API
+# uses the shared FACE_POOL_WORKERS pool instead
+STUDENT_IMPORT_WORKERS = None
+
+# On-demand QR codes: seconds rendered PNGs stay in the cache and clients may reuse them
+QR_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# Version stamped on newly computed face encodings. Bump after changing the face
+# model or preprocessing, then run fix_face_encodings to re-encode older ones.
+FACE_ENCODING_VERSION = 1
+
+# Upper bound on suggestions returned by /api/students/search/
+STUDENT_SEARCH_MAX_RESULTS = 20
+
+# Page-number lists with ?count=approximate count at most this many rows
+APPROXIMATE_COUNT_CAP = 10000
+
+# Per-roll-number lock held while a marking request runs face recognition, so a
+# duplicate tap gets 409 instead of a second encode. In-process by default; set
+# ATTENDANCE_MARK_LOCK_CACHE to a CACHES alias to share it across workers.
+ATTENDANCE_MARK_LOCK_TTL = 15
+ATTENDANCE_MARK_LOCK_CACHE = None
+
+# Request metrics (attendance.middleware.RequestMetricsMiddleware): Server-Timing
+# header, per-route histograms at /api/metrics/ and one INFO line per request on
+# the "attendance.metrics" logger.
+REQUEST_METRICS_ENABLED = True
+
+# Async marking endpoint (attendance.views.AsyncMarkAttendance): threads for image
+# decoding and face recognition, and for archiving uploads after the response.
+ASYNC_MARK_THREADS = 16
+BACKGROUND_WORKERS = 2
+
+# Marking photos are archived under MEDIA_ROOT/attendance/ and indexed in
+# attendance.AttendanceImage; prune_attendance_images deletes those older than this.
+ATTENDANCE_IMAGE_RETENTION_DAYS = 7
+
+# Image pipeline (attendance.utils.image_pipeline): after each save, photos are
+# re-encoded as EXIF-free JPEGs capped at IMAGE_MAX_SIDE and get a thumbnail.
+# compress_images processes the backlog and reports bytes saved.
+IMAGE_MAX_SIDE = 1024
+IMAGE_JPEG_QUALITY = 80
+THUMBNAIL_SIDE = 160
+THUMBNAIL_JPEG_QUALITY = 70
+IMAGE_PROCESSING_ENABLED = True
+
+# "frame" archives each marking upload; "crop" archives only the matched face
+# (padded by FACE_CROP_MARGIN) with its box and match distance, a fraction of
+# the bytes per record. Falls back to the frame when the face position is unknown.
+ATTENDANCE_ARCHIVE_MODE = "frame"
+FACE_CROP_MARGIN = 0.4
+
+# Largest face distance accepted as a match (face_recognition's default). Override
+# per class or department with ClassGroup / Department.match_tolerance; use
+# replay_matches to see what a change would do to retries and false accepts.
+FACE_MATCH_TOLERANCE = 0.6
@@ -32,13 +32,18 @@ from accounts.views import (
     all_classgroups,
     classgroup_detail,
     RegisterStudent,  # <-- expose register/ endpoint
+    StudentImportView,
+    StudentImportStatusView,
+    student_qr,
+    classgroup_qr_sheet,
+    student_typeahead,
 )
 from attendance.views import (
-    AttendanceStatus, AttendanceStatusList, MarkAttendance,
+    AttendanceStatus, AttendanceStatusList, MarkAttendance, AsyncMarkAttendance,
     MostAbsentAPIView, ExportAttendanceExcelAPIView,
     StudentAttendanceDetail, AttendanceUpdateAPIView,
     AdminAuthAPIView, AdminAuthValidateAPIView, AdminPinAPIView,
-    AdminPinResetAPIView,
+    AdminPinResetAPIView, RequestMetricsAPIView,
 )
 
 router = DefaultRouter()
@@ -48,11 +53,22 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     # Registration endpoint used by frontend AddStudent to compute & save face encodings
     path('register/', RegisterStudent.as_view()),
+    # Must come before the router so these aren't taken as student detail routes
+    path('api/students/import/', StudentImportView.as_view()),
+    path('api/students/import/<int:job_id>/', StudentImportStatusView.as_view()),
+    path('api/students/search/', student_typeahead),
+    path('api/students/<str:roll_no>/qr.png', student_qr, name='student-qr'),
     path('api/', include(router.urls)),
     path('api/attendanceStatus/', AttendanceStatus.as_view()),
     path('api/attendanceStatus/list/', AttendanceStatusList.as_view()),
     path('api/attendance/', MarkAttendance.as_view()),
+    path('api/attendance/identify/', MarkAttendance.as_view(identify=True)),
+    # Async variants for ASGI servers (uvicorn/daphne smart_attendance.asgi:application)
+    path('api/attendance/async/', AsyncMarkAttendance.as_view()),
+    path('api/attendance/identify/async/', AsyncMarkAttendance.as_view(identify=True)),
     path('api/attendance/<int:pk>/', AttendanceUpdateAPIView.as_view()),
+    path('api/attendance/export/', ExportAttendanceExcelAPIView.as_view()),
+    path('api/attendance/most-absent/', MostAbsentAPIView.as_view()),
     path('api/student/<str:roll_no>/attendance/', StudentAttendanceDetail.as_view()),
     path('api/students/', StudentListView.as_view()),
     path('api/departments/', departments_list),
@@ -64,11 +80,14 @@ urlpatterns = [
     path('api/batches/<int:batch_id>/classgroups/', batch_classgroups),
     path('api/classgroups/', all_classgroups),
     path('api/classgroups/<int:classgroup_id>/', classgroup_detail),
+    path('api/classgroups/<int:classgroup_id>/qr-sheet/', classgroup_qr_sheet),
 
     # Admin PIN / auth endpoints
     path('api/admin/auth/', AdminAuthAPIView.as_view()),
     path('api/admin/auth/validate/', AdminAuthValidateAPIView.as_view()),
     path('api/admin/pin/', AdminPinAPIView.as_view()),
+    # Per-route latency / query histograms (admin)
+    path('api/metrics/', RequestMetricsAPIView.as_view()),
     # DEBUG-only: reset admin PIN to default (remove in production)
     path('api/admin/pin/reset-default/', AdminPinResetAPIView.as_view()),
 ]